@@ -1,45 +1,153 @@
-import numpy as np
-from numpy import ndarray
-
-def assessment_FoM(before_landuse_list:list,after_landuse_list:list,simulated_landuse_list:list,areas:ndarray)->tuple:
-    '''
-    ### Abstract
-        Calculate FoM,UA,PA accuracy
-    ### Parameters
-        - before_landuse_list：List of previous land uses
-        - after_landuse_list：Late land use list
-        - simulated_landuse_list：List of land use simulation results
-        - areas：Area of all plots
-
-    ### Return
-        FoM，PA，UA
-    '''
-    landuse_count=len(before_landuse_list)
-
-    '''
-        A: The actual changes and the simulation results do not change
-        B: The actual changes occur and the simulation results are correct
-        C: The actual changes and the simulation results change and the simulation results are incorrect
-        D: There is no actual change and the simulation results change
-    '''
-    A,B,C,D=0,0,0,0
-    for i in range(landuse_count):
-        before_landuse=before_landuse_list[i]
-        after_landuse=after_landuse_list[i]
-        simulated_landuse=simulated_landuse_list[i]
-        area=areas[i]
-
-        if before_landuse!=after_landuse and before_landuse==simulated_landuse:
-            A+=area
-        if before_landuse!=after_landuse and after_landuse==simulated_landuse:
-            B+=area
-        if before_landuse!=after_landuse and before_landuse!=simulated_landuse and after_landuse!=simulated_landuse:
-            C+=area
-        if before_landuse==after_landuse and before_landuse!=simulated_landuse:
-            D+=area
-
-    FoM=B/(A+B+C+D)
-    PA=B/(A+B+C)
-    UA=B/(B+C+D)
-
-    return FoM,PA,UA
+import numpy as np
+from numpy import ndarray
+
+def get_ABCD(before_landuse:ndarray,after_landuse:ndarray,simulated_landuse:ndarray,areas:ndarray)->ndarray:
+    '''
+    ### Abstract
+        Calculate the areas A, B, C, D used by FoM, PA and UA
+    ### Parameters
+        - before_landuse：Previous land use of each plot
+        - after_landuse：Late land use of each plot
+        - simulated_landuse：Land use simulation result of each plot
+        - areas：Area of each plot
+
+    ### Return
+        Array of A, B, C, D
+    '''
+    '''
+        A: The actual changes and the simulation results do not change
+        B: The actual changes occur and the simulation results are correct
+        C: The actual changes and the simulation results change and the simulation results are incorrect
+        D: There is no actual change and the simulation results change
+    '''
+    is_actual_changed=before_landuse!=after_landuse
+    is_simulated_changed=before_landuse!=simulated_landuse
+    is_correct=after_landuse==simulated_landuse
+
+    A=areas[is_actual_changed&~is_simulated_changed].sum()
+    B=areas[is_actual_changed&is_correct].sum()
+    C=areas[is_actual_changed&is_simulated_changed&~is_correct].sum()
+    D=areas[~is_actual_changed&is_simulated_changed].sum()
+
+    return np.array([A,B,C,D])
+
+def get_FoM_PA_UA(ABCD:ndarray)->tuple:
+    '''
+    ### Abstract
+        Calculate FoM,UA,PA accuracy from A, B, C, D
+    ### Parameters
+        - ABCD：Array of A, B, C, D
+
+    ### Return
+        FoM，PA，UA
+    '''
+    A,B,C,D=ABCD
+
+    FoM=B/(A+B+C+D)
+    PA=B/(A+B+C)
+    UA=B/(B+C+D)
+
+    return FoM,PA,UA
+
+def assessment_FoM(before_landuse_list:list,after_landuse_list:list,simulated_landuse_list:list,areas:ndarray)->tuple:
+    '''
+    ### Abstract
+        Calculate FoM,UA,PA accuracy
+    ### Parameters
+        - before_landuse_list：List or array of previous land uses, either land use types or land use codes
+        - after_landuse_list：Late land use list, encoded the same way
+        - simulated_landuse_list：List of land use simulation results, encoded the same way
+        - areas：Area of all plots
+
+    ### Return
+        FoM，PA，UA
+    '''
+    ABCD=get_ABCD(np.asarray(before_landuse_list),np.asarray(after_landuse_list),np.asarray(simulated_landuse_list),np.asarray(areas))
+
+    return get_FoM_PA_UA(ABCD)
+
+def get_confusion_matrix(after_landuse_codes:ndarray,simulated_landuse_codes:ndarray,areas:ndarray,landuse_type_count:int)->ndarray:
+    '''
+    ### Abstract
+        Calculate the area-weighted confusion matrix between the late land use and the simulation results
+    ### Parameters
+        - after_landuse_codes：Late land use code of each plot
+        - simulated_landuse_codes：Simulated land use code of each plot
+        - areas：Area of each plot
+        - landuse_type_count：Number of land use types
+
+    ### Return
+        confusion_matrix[i,j] is the area of the plots whose late land use is type i and simulated land use is type j
+    '''
+    confusion_matrix=np.zeros(shape=(landuse_type_count,landuse_type_count))
+    np.add.at(confusion_matrix,(after_landuse_codes,simulated_landuse_codes),areas)
+
+    return confusion_matrix
+
+def assessment_FoM_and_confusion_matrix(before_landuse_codes:ndarray,after_landuse_codes:ndarray,simulated_landuse_codes:ndarray,areas:ndarray,landuse_type_count:int)->tuple:
+    '''
+    ### Abstract
+        Calculate FoM,UA,PA accuracy and the area-weighted confusion matrix
+    ### Parameters
+        - before_landuse_codes：Previous land use code of each plot
+        - after_landuse_codes：Late land use code of each plot
+        - simulated_landuse_codes：Simulated land use code of each plot
+        - areas：Area of each plot
+        - landuse_type_count：Number of land use types
+
+    ### Return
+        FoM，PA，UA and the confusion matrix, see get_confusion_matrix
+    '''
+    FoM,PA,UA=get_FoM_PA_UA(get_ABCD(before_landuse_codes,after_landuse_codes,simulated_landuse_codes,areas))
+    confusion_matrix=get_confusion_matrix(after_landuse_codes,simulated_landuse_codes,areas,landuse_type_count)
+
+    return FoM,PA,UA,confusion_matrix
+
+
+class AccuracyTracker():
+    def __init__(self, before_landuse_codes: ndarray, after_landuse_codes: ndarray, simulated_landuse_codes: ndarray, areas: ndarray, landuse_type_count: int):
+        self.before_landuse_codes = before_landuse_codes # Previous land use code of each plot
+        self.after_landuse_codes = after_landuse_codes # Late land use code of each plot
+        self.simulated_landuse_codes = simulated_landuse_codes.copy() # Simulated land use code of each plot as last seen by the tracker
+        self.areas = areas # Area of each plot
+        self.ABCD = get_ABCD(before_landuse_codes, after_landuse_codes, self.simulated_landuse_codes, areas) # Current A, B, C, D
+        self.confusion_matrix = get_confusion_matrix(after_landuse_codes, self.simulated_landuse_codes, areas, landuse_type_count) # Current area-weighted confusion matrix
+
+    def update(self, changed_indices: ndarray, simulated_landuse_codes: ndarray) -> None:
+        '''
+        ### Abstract
+            Update A, B, C, D and the confusion matrix from the plots changed in the latest iteration only
+        ### Parameters
+            - changed_indices：Indices of the plots changed in the latest iteration
+            - simulated_landuse_codes：Simulated land use code of each plot after the latest iteration
+
+        ### Return
+            none
+        '''
+        if len(changed_indices) == 0:
+            return
+
+        before_landuse_codes = self.before_landuse_codes[changed_indices]
+        after_landuse_codes = self.after_landuse_codes[changed_indices]
+        previous_landuse_codes = self.simulated_landuse_codes[changed_indices]
+        current_landuse_codes = simulated_landuse_codes[changed_indices]
+        areas = self.areas[changed_indices]
+
+        self.ABCD -= get_ABCD(before_landuse_codes, after_landuse_codes, previous_landuse_codes, areas)
+        self.ABCD += get_ABCD(before_landuse_codes, after_landuse_codes, current_landuse_codes, areas)
+        np.add.at(self.confusion_matrix, (after_landuse_codes, previous_landuse_codes), -areas)
+        np.add.at(self.confusion_matrix, (after_landuse_codes, current_landuse_codes), areas)
+
+        self.simulated_landuse_codes[changed_indices] = current_landuse_codes
+
+    def get_accuracy(self) -> tuple:
+        '''
+        ### Abstract
+            Get the current FoM,UA,PA accuracy
+        ### Parameters
+            none
+
+        ### Return
+            FoM，PA，UA
+        '''
+        return get_FoM_PA_UA(self.ABCD)
@@ -0,0 +1,384 @@
+from osgeo import ogr, gdal, osr
+from osgeo.ogr import Feature
+from osgeo.ogr import FieldDefn
+from osgeo.ogr import Geometry
+from osgeo.gdal import Dataset
+import numpy as np
+from numpy import ndarray
+from scipy.spatial import cKDTree
+from multiprocessing import Pool
+import time
+import json
+from profiling import get_peak_rss
+from preparation_DLPS import DLPS
+from preparation_match import match
+from preparation_zonal import zonal
+from preparation_zonal import RasterFileConfig
+from preparation_zonal import StatisticMethod
+from mining_Pg_RF import mining_pg_RF
+from simulation import simulation
+from utils import create_layer
+from utils import get_layer_schema
+import os
+os.environ['PROJ_LIB'] = r'C:\Users\dell\AppData\Local\Programs\Python\Python38\Lib\site-packages\osgeo\data\proj'
+
+STAGE_NAME_LIST = ['DLPS', 'match', 'zonal', 'mining_pg_RF', 'simulation']
+
+
+class SyntheticConfig():
+    def __init__(self, parcel_count: int, cell_size: float = 100, landuse_type_count: int = 5, change_rate: float = 0.1, spatial_variable_count: int = 2, seed: int = 0):
+        self.parcel_count = parcel_count # Number of parcels
+        self.cell_size = cell_size # Side length of the grid cells of the parcels
+        self.landuse_type_count = landuse_type_count # Number of land use types, they are named '0', '1', ...
+        self.change_rate = change_rate # Share of the parcels whose land use changes between the two periods
+        self.spatial_variable_count = spatial_variable_count # Number of spatial variables, each one is a raster and a field named var0, var1, ...
+        self.seed = seed # Seed of the generator
+
+
+def get_spatial_variable(x: ndarray, y: ndarray, extent: float, seed: int) -> ndarray:
+    '''
+    ### Abstract
+        A smooth random surface used as a spatial variable, the sum of a few waves with random directions and phases
+    ### Parameters
+        - x：x coordinates
+        - y：y coordinates
+        - extent：Size of the study area
+        - seed：Seed of the surface
+
+    ### Return
+        Value of the surface at each coordinate, between 0 and 1
+    '''
+    rng = np.random.default_rng(seed)
+    value = np.zeros(np.broadcast(x, y).shape)
+    for _ in range(4):
+        angle = rng.random()*np.pi
+        frequency = (1+rng.random()*3)*2*np.pi/extent
+        phase = rng.random()*2*np.pi
+        value += np.sin((x*np.cos(angle)+y*np.sin(angle))*frequency+phase)
+
+    return (value+4)/8
+
+
+def get_grid_polygons(config: SyntheticConfig) -> tuple:
+    '''
+    ### Abstract
+        Generate parcels as the cells of a grid whose vertices are moved randomly, so the parcels have different shapes and sizes but still cover the plane without overlapping
+    ### Parameters
+        - config：Configuration of the synthetic data
+
+    ### Return
+        Coordinates of the 4 corners of each parcel (n x 4 x 2), and the size of the study area
+    '''
+    rng = np.random.default_rng(config.seed)
+    side = int(np.ceil(np.sqrt(config.parcel_count)))
+    extent = side*config.cell_size
+
+    vertex_x, vertex_y = np.meshgrid(np.arange(side+1)*config.cell_size, np.arange(side+1)*config.cell_size)
+    vertices = np.stack([vertex_x, vertex_y], axis=2).astype(np.float64)
+    vertices[1:-1, 1:-1] += (rng.random(size=(side-1, side-1, 2))-0.5)*0.4*config.cell_size
+
+    cell_indices = np.arange(config.parcel_count)
+    rows = cell_indices//side
+    cols = cell_indices % side
+    corners = np.stack([vertices[rows, cols], vertices[rows, cols+1], vertices[rows+1, cols+1], vertices[rows+1, cols]], axis=1)
+
+    return corners, extent
+
+
+def get_landuse(centroids: ndarray, config: SyntheticConfig) -> tuple:
+    '''
+    ### Abstract
+        Generate spatially clustered land use for two periods. Each parcel takes the land use of its nearest seed point, then some parcels change, mostly to type '0'
+    ### Parameters
+        - centroids：Centroid of each parcel
+        - config：Configuration of the synthetic data
+
+    ### Return
+        Land use codes of the earlier period and of the later period
+    '''
+    rng = np.random.default_rng(config.seed+1)
+    seed_count = max(config.parcel_count//50, config.landuse_type_count)
+    seed_points = centroids[rng.choice(len(centroids), size=seed_count, replace=False)]
+    seed_landuse = rng.integers(0, config.landuse_type_count, size=seed_count)
+    _, nearest_seed = cKDTree(seed_points).query(centroids)
+    before_landuse = seed_landuse[nearest_seed]
+
+    after_landuse = before_landuse.copy()
+    is_changed = rng.random(size=len(centroids)) < config.change_rate
+    new_landuse = np.where(rng.random(size=len(centroids)) < 0.7, 0, rng.integers(0, config.landuse_type_count, size=len(centroids)))
+    after_landuse[is_changed] = new_landuse[is_changed]
+
+    return before_landuse, after_landuse
+
+
+def get_spatial_ref() -> osr.SpatialReference:
+    '''
+    ### Abstract
+        Spatial reference of the synthetic data, a projected coordinate system in meters
+    ### Parameters
+        none
+
+    ### Return
+        The spatial reference
+    '''
+    spatial_ref = osr.SpatialReference()
+    spatial_ref.ImportFromEPSG(32650)
+    return spatial_ref
+
+
+def get_polygon(corners: ndarray) -> Geometry:
+    '''
+    ### Abstract
+        Build a polygon from its corners
+    ### Parameters
+        - corners：Coordinates of the corners
+
+    ### Return
+        The polygon
+    '''
+    ring = ogr.Geometry(ogr.wkbLinearRing)
+    for x, y in corners.tolist():
+        ring.AddPoint_2D(x, y)
+    ring.AddPoint_2D(*corners[0].tolist())
+    polygon = ogr.Geometry(ogr.wkbPolygon)
+    polygon.AddGeometry(ring)
+    return polygon
+
+
+def write_raster(file_name: str, extent: float, pixel_size: float, seed: int) -> None:
+    '''
+    ### Abstract
+        Write a spatial variable of the study area to a GeoTIFF, see get_spatial_variable
+    ### Parameters
+        - file_name：The tiff file name
+        - extent：Size of the study area
+        - pixel_size：Size of the pixels
+        - seed：Seed of the spatial variable
+
+    ### Return
+        none
+    '''
+    pixel_count = int(np.ceil(extent/pixel_size))
+    driver: gdal.Driver = gdal.GetDriverByName('GTiff')
+    raster_file: Dataset = driver.Create(file_name, pixel_count, pixel_count, 1, gdal.GDT_Float32, options=['COMPRESS=LZW', 'TILED=YES'])
+    raster_file.SetGeoTransform((0, pixel_size, 0, pixel_count*pixel_size, 0, -pixel_size))
+    raster_file.SetProjection(get_spatial_ref().ExportToWkt())
+    band = raster_file.GetRasterBand(1)
+    band.SetNoDataValue(-99999)
+
+    # The raster is written by blocks of rows to bound the memory
+    x = (np.arange(pixel_count)+0.5)*pixel_size
+    for row_start in range(0, pixel_count, 256):
+        row_count = min(256, pixel_count-row_start)
+        y = pixel_count*pixel_size-(np.arange(row_start, row_start+row_count)+0.5)*pixel_size
+        block = get_spatial_variable(x[np.newaxis, :], y[:, np.newaxis], extent, seed)
+        band.WriteArray(block.astype(np.float32), 0, row_start)
+
+    raster_file = None
+
+
+def generate_synthetic_data(output_directory: str, config: SyntheticConfig) -> dict:
+    '''
+    ### Abstract
+        Generate a synthetic study area: a parcel layer with the fields needed by every stage ('before', 'after', the spatial variables and the pg fields),
+        the rasters of the spatial variables and a restricted area layer
+    ### Parameters
+        - output_directory：Directory of the synthetic data
+        - config：Configuration of the synthetic data
+
+    ### Return
+        Dictionary of the file names: 'parcels', 'restricted_area' and 'rasters' (list)
+    '''
+    os.makedirs(output_directory, exist_ok=True)
+    rng = np.random.default_rng(config.seed+2)
+
+    corners, extent = get_grid_polygons(config)
+    centroids = corners.mean(axis=1)
+    before_landuse, after_landuse = get_landuse(centroids, config)
+    spatial_variables = [get_spatial_variable(centroids[:, 0], centroids[:, 1], extent, config.seed+10+i) for i in range(config.spatial_variable_count)]
+    pg = rng.dirichlet(np.ones(config.landuse_type_count), size=config.parcel_count)
+
+    landuse_type_list = [str(i) for i in range(config.landuse_type_count)]
+    variable_field_name_list = ['var%d' % i for i in range(config.spatial_variable_count)]
+    field_defn_list = [FieldDefn('before', ogr.OFTString), FieldDefn('after', ogr.OFTString)]
+    field_defn_list += [FieldDefn(field_name, ogr.OFTReal) for field_name in variable_field_name_list]
+    field_defn_list += [FieldDefn('pg_'+landuse_type, ogr.OFTReal) for landuse_type in landuse_type_list]
+
+    parcel_file_name = os.path.join(output_directory, 'parcels.shp')
+    file, layer = create_layer(parcel_file_name, (get_spatial_ref(), ogr.wkbPolygon, field_defn_list))
+    layer.StartTransaction()
+    for index in range(config.parcel_count):
+        feature = Feature(layer.GetLayerDefn())
+        feature.SetGeometry(get_polygon(corners[index]))
+        feature.SetField('before', landuse_type_list[before_landuse[index]])
+        feature.SetField('after', landuse_type_list[after_landuse[index]])
+        for field_name, values in zip(variable_field_name_list, spatial_variables):
+            feature.SetField(field_name, float(values[index]))
+        for landuse_index, landuse_type in enumerate(landuse_type_list):
+            feature.SetField('pg_'+landuse_type, float(pg[index, landuse_index]))
+        layer.CreateFeature(feature)
+    layer.CommitTransaction()
+    file = None
+
+    # A few square restricted areas
+    restricted_area_file_name = os.path.join(output_directory, 'restricted_area.shp')
+    spatial_ref, geometry_type, _ = get_layer_schema(parcel_file_name)
+    file, layer = create_layer(restricted_area_file_name, (spatial_ref, geometry_type, []))
+    for _ in range(5):
+        x, y = rng.random(size=(2,))*extent*0.9
+        size = extent*0.05
+        feature = Feature(layer.GetLayerDefn())
+        feature.SetGeometry(get_polygon(np.array([[x, y], [x+size, y], [x+size, y+size], [x, y+size]])))
+        layer.CreateFeature(feature)
+    file = None
+
+    raster_file_name_list = []
+    for i in range(config.spatial_variable_count):
+        raster_file_name = os.path.join(output_directory, 'var%d.tif' % i)
+        write_raster(raster_file_name, extent, config.cell_size/4, config.seed+10+i)
+        raster_file_name_list.append(raster_file_name)
+
+    return {'parcels': parcel_file_name, 'restricted_area': restricted_area_file_name, 'rasters': raster_file_name_list}
+
+
+def get_stage_parameters(stage_name: str, file_names: dict, output_directory: str) -> dict:
+    '''
+    ### Abstract
+        Get the parameters of a stage on the synthetic data. Each stage reads the synthetic parcels directly, so the stages are timed independently
+    ### Parameters
+        - stage_name：Name of the stage, see STAGE_NAME_LIST
+        - file_names：File names of the synthetic data, see generate_synthetic_data
+        - output_directory：Directory of the outputs of the stages
+
+    ### Return
+        Keyword parameters of the stage function
+    '''
+    parcel_file_name = file_names['parcels']
+    variable_field_name_list = [os.path.splitext(os.path.basename(raster_file_name))[0] for raster_file_name in file_names['rasters']]
+
+    if stage_name == 'DLPS':
+        return {'input_file_name': parcel_file_name, 'output_file_name': os.path.join(output_directory, 'dlps.shp'), 'max_iteration': 2, 'allowable_parameter': 2}
+    if stage_name == 'match':
+        return {'before_file_name': parcel_file_name, 'before_landuse_field_name': 'before', 'after_file_name': parcel_file_name, 'after_landuse_field_name': 'after', 'output_file_name': os.path.join(output_directory, 'match.shp')}
+    if stage_name == 'zonal':
+        raster_file_config_list = [RasterFileConfig(raster_file_name, field_name+'_z', StatisticMethod.mean) for raster_file_name, field_name in zip(file_names['rasters'], variable_field_name_list)]
+        return {'polygon_file_name': parcel_file_name, 'raster_file_config_list': raster_file_config_list, 'output_csvfile_name': os.path.join(output_directory, 'zonal.csv'), 'output_shapefile_name': os.path.join(output_directory, 'zonal.shp')}
+    if stage_name == 'mining_pg_RF':
+        return {'input_file_name': parcel_file_name, 'output_shapefile_name': os.path.join(output_directory, 'pg.shp'), 'output_csvfile_name': os.path.join(output_directory, 'pg.csv'), 'label_field_name': 'after', 'spatial_variable_field_name_list': variable_field_name_list, 'tree_count': 50}
+    if stage_name == 'simulation':
+        return {'input_file_name': parcel_file_name, 'restricted_area_file_name': file_names['restricted_area'], 'output_file_name': os.path.join(output_directory, 'simulated.shp'), 'before_landuse_field_name': 'before', 'after_landuse_field_name': 'after', 'RA_alpha': 5, 'buffer_range': 300, 'iteration': 5, 'seed': 0, 'assessment_interval': 0}
+    raise ValueError('Unknown stage: %s' % stage_name)
+
+
+def run_timed_stage(stage_name: str, parameters: dict) -> dict:
+    '''
+    ### Abstract
+        Run a stage and measure it, in a worker process of its own so that the peak RSS belongs to this stage only
+    ### Parameters
+        - stage_name：Name of the stage
+        - parameters：Keyword parameters of the stage function
+
+    ### Return
+        Dictionary of wall_time, cpu_time and peak_rss
+    '''
+    stage_function = {'DLPS': DLPS, 'match': match, 'zonal': zonal, 'mining_pg_RF': mining_pg_RF, 'simulation': simulation}[stage_name]
+
+    start_wall_time = time.perf_counter()
+    start_cpu_time = time.process_time()
+    stage_function(**parameters)
+
+    return {'wall_time': time.perf_counter()-start_wall_time, 'cpu_time': time.process_time()-start_cpu_time, 'peak_rss': get_peak_rss()}
+
+
+def run_benchmark(output_directory: str, parcel_count_list: list = None, stage_name_list: list = None, max_parcel_count_dict: dict = None, result_file_name: str = None) -> dict:
+    '''
+    ### Abstract
+        Time each stage on synthetic data of increasing size
+    ### Parameters
+        - output_directory：Directory of the synthetic data and the outputs, one sub-directory per size
+        - parcel_count_list：Numbers of parcels of the synthetic data, None means 1k, 10k, 100k and 1M
+        - stage_name_list：Names of the stages to time, None means STAGE_NAME_LIST
+        - max_parcel_count_dict：Largest number of parcels of some stages, larger sizes are skipped. None means 100k for match, which keeps a full distance matrix between the two periods
+        - result_file_name：The results are written to this .json file, None means no file
+
+    ### Return
+        Dictionary of the results, result[parcel_count][stage_name] is a dictionary of wall_time, cpu_time and peak_rss, or of the error or the skip reason
+    '''
+    if parcel_count_list is None:
+        parcel_count_list = [1000, 10000, 100000, 1000000]
+    if stage_name_list is None:
+        stage_name_list = STAGE_NAME_LIST
+    if max_parcel_count_dict is None:
+        max_parcel_count_dict = {'match': 100000}
+
+    result = {}
+    for parcel_count in parcel_count_list:
+        scale_directory = os.path.join(output_directory, str(parcel_count))
+        start_time = time.perf_counter()
+        file_names = generate_synthetic_data(scale_directory, SyntheticConfig(parcel_count))
+        print(parcel_count, 'parcels generated in', time.perf_counter()-start_time, 's')
+
+        result[str(parcel_count)] = {}
+        for stage_name in stage_name_list:
+            if parcel_count > max_parcel_count_dict.get(stage_name, parcel_count):
+                result[str(parcel_count)][stage_name] = {'skipped': 'more than %d parcels' % max_parcel_count_dict[stage_name]}
+                continue
+
+            parameters = get_stage_parameters(stage_name, file_names, scale_directory)
+            try:
+                with Pool(processes=1) as pool:
+                    stage_result = pool.apply(run_timed_stage, (stage_name, parameters))
+            except Exception as exception:
+                stage_result = {'error': repr(exception)}
+            result[str(parcel_count)][stage_name] = stage_result
+            print(parcel_count, stage_name, stage_result)
+
+            if result_file_name is not None:
+                with open(result_file_name, 'w') as file:
+                    json.dump(result, file, indent=2)
+
+    return result
+
+
+def compare_with_baseline(result: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    '''
+    ### Abstract
+        Compare benchmark results with a baseline and print the ratio of the wall time of each stage
+    ### Parameters
+        - result：Benchmark results, see run_benchmark
+        - baseline：Baseline results in the same form
+        - tolerance：A stage is a regression if its wall time is more than (1+tolerance) times the baseline
+
+    ### Return
+        List of (parcel_count, stage_name, ratio) of the regressions
+    '''
+    regression_list = []
+    for parcel_count, stage_results in result.items():
+        for stage_name, stage_result in stage_results.items():
+            baseline_result = baseline.get(parcel_count, {}).get(stage_name, {})
+            if 'wall_time' not in stage_result or 'wall_time' not in baseline_result:
+                continue
+
+            ratio = stage_result['wall_time']/baseline_result['wall_time']
+            print(parcel_count, stage_name, 'wall time ratio to baseline: %.3f' % ratio)
+            if ratio > 1+tolerance:
+                regression_list.append((parcel_count, stage_name, ratio))
+
+    return regression_list
+
+
+if __name__ == '__main__':
+    result = run_benchmark(
+        output_directory=r"E:\UrbanVCA_Python\benchmark",
+        parcel_count_list=[1000, 10000, 100000, 1000000],
+        result_file_name=r"E:\UrbanVCA_Python\benchmark\result.json")
+
+    baseline_file_name = r"E:\UrbanVCA_Python\benchmark\baseline.json"
+    if os.path.exists(baseline_file_name):
+        with open(baseline_file_name, 'r') as file:
+            baseline = json.load(file)
+        print('regressions:', compare_with_baseline(result, baseline))
+    else:
+        # The first run becomes the baseline
+        with open(baseline_file_name, 'w') as file:
+            json.dump(result, file, indent=2)
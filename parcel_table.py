@@ -0,0 +1,299 @@
+from osgeo import ogr
+from osgeo.ogr import DataSource
+from osgeo.ogr import Layer
+from osgeo.ogr import Feature
+from osgeo.ogr import FeatureDefn
+from osgeo.ogr import FieldDefn
+from osgeo.ogr import Geometry
+import numpy as np
+from numpy import ndarray
+from utils import create_layer
+from profiling import profiled
+
+
+class ParcelTable():
+    def __init__(self, fid: ndarray, fields: dict, wkb_list: list, spatial_ref_wkt: str = None, field_types: dict = None, geometry_columns: tuple = None):
+        self.fid = fid # FID of each parcel in the source layer
+        self.fields = fields # Attribute columns, the key is the field name and the value is a numpy array
+        self.wkb_list = wkb_list # Geometry of each parcel as WKB
+        self.spatial_ref_wkt = spatial_ref_wkt # Spatial reference of the source layer
+        if field_types is None:
+            field_types = {}
+        self.field_types = field_types # OGR field type of each attribute column, used when writing
+        if geometry_columns is None:
+            geometry_columns = get_geometry_columns(wkb_list)
+        self.areas, self.centroids, self.envelopes = geometry_columns # Area, centroid (x,y) and envelope (minx,maxx,miny,maxy) of each parcel
+
+    def __len__(self) -> int:
+        return len(self.fid)
+
+    def get_geometry(self, index: int) -> Geometry:
+        '''
+        ### Abstract
+            Build the OGR geometry of a parcel from its WKB
+        ### Parameters
+            - index：Index of the parcel in the table
+
+        ### Return
+            Geometry of the parcel
+        '''
+        return ogr.CreateGeometryFromWkb(self.wkb_list[index])
+
+    def select(self, indices: ndarray) -> 'ParcelTable':
+        '''
+        ### Abstract
+            Get a new table made of some of the parcels
+        ### Parameters
+            - indices：Indices or boolean mask of the parcels to keep
+
+        ### Return
+            The new table
+        '''
+        indices = np.arange(len(self))[indices]
+        fields = {field_name: column[indices] for field_name, column in self.fields.items()}
+        wkb_list = [self.wkb_list[index] for index in indices.tolist()]
+        geometry_columns = (self.areas[indices], self.centroids[indices], self.envelopes[indices])
+
+        return ParcelTable(self.fid[indices], fields, wkb_list, self.spatial_ref_wkt, dict(self.field_types), geometry_columns)
+
+
+def get_geometry_columns(wkb_list: list) -> tuple:
+    '''
+    ### Abstract
+        Calculate the area, centroid and envelope of each geometry once, so that later stages do not need the geometries for them
+    ### Parameters
+        - wkb_list：Geometry of each parcel as WKB
+
+    ### Return
+        areas, centroids and envelopes
+    '''
+    parcel_count = len(wkb_list)
+    areas = np.zeros(shape=(parcel_count,))
+    centroids = np.zeros(shape=(parcel_count, 2))
+    envelopes = np.zeros(shape=(parcel_count, 4))
+
+    for index, wkb in enumerate(wkb_list):
+        geometry: Geometry = ogr.CreateGeometryFromWkb(wkb)
+        areas[index] = geometry.GetArea()
+        centroids[index] = geometry.Centroid().GetPoint_2D()
+        envelopes[index] = geometry.GetEnvelope()
+
+    return (areas, centroids, envelopes)
+
+
+def get_numpy_column(values: list, field_type: int) -> ndarray:
+    '''
+    ### Abstract
+        Convert the values of a field into a numpy column according to the OGR field type
+    ### Parameters
+        - values：Values of the field
+        - field_type：OGR field type
+
+    ### Return
+        float64 column for real fields, int64 column for integer fields, otherwise an object column. Columns with null values are object columns
+    '''
+    if field_type == ogr.OFTReal and None not in values:
+        return np.array(values, dtype=np.float64)
+    if field_type in (ogr.OFTInteger, ogr.OFTInteger64) and None not in values:
+        return np.array(values, dtype=np.int64)
+
+    column = np.empty(shape=(len(values),), dtype=object)
+    column[:] = values
+    return column
+
+
+def read_layer_by_arrow(layer: Layer, field_name_list: list) -> tuple:
+    '''
+    ### Abstract
+        Read the FID, fields and WKB geometries of a layer in batches through the GDAL Arrow stream (GDAL 3.6 or later)
+    ### Parameters
+        - layer：The layer to read
+        - field_name_list：Names of the fields to read
+
+    ### Return
+        FID list, dictionary of field value lists and WKB list
+    '''
+    fid_column_name = layer.GetFIDColumn() or 'OGC_FID'
+    geometry_column_name = layer.GetGeometryColumn() or 'wkb_geometry'
+
+    fid_list = []
+    field_value_lists = {field_name: [] for field_name in field_name_list}
+    wkb_list = []
+
+    stream = layer.GetArrowStreamAsNumPy(options=['USE_MASKED_ARRAYS=NO'])
+    for batch in stream:
+        # Rows without geometry are skipped
+        has_geometry = [wkb is not None for wkb in batch[geometry_column_name]]
+        fid_list.extend(fid for fid, is_kept in zip(batch[fid_column_name].tolist(), has_geometry) if is_kept)
+        wkb_list.extend(bytes(wkb) for wkb, is_kept in zip(batch[geometry_column_name], has_geometry) if is_kept)
+        for field_name in field_name_list:
+            values = [value for value, is_kept in zip(batch[field_name].tolist(), has_geometry) if is_kept]
+            # String fields are returned as bytes
+            values = [value.decode('utf-8') if isinstance(value, bytes) else value for value in values]
+            field_value_lists[field_name].extend(values)
+
+    return (fid_list, field_value_lists, wkb_list)
+
+
+def read_layer_by_feature(layer: Layer, field_name_list: list) -> tuple:
+    '''
+    ### Abstract
+        Read the FID, fields and WKB geometries of a layer feature by feature, the features without geometry are skipped
+    ### Parameters
+        - layer：The layer to read
+        - field_name_list：Names of the fields to read
+
+    ### Return
+        FID list, dictionary of field value lists and WKB list
+    '''
+    fid_list = []
+    field_value_lists = {field_name: [] for field_name in field_name_list}
+    wkb_list = []
+
+    feature: Feature
+    for feature in layer:
+        # Features without geometry are skipped
+        geometry: Geometry = feature.GetGeometryRef()
+        if geometry is None:
+            continue
+        fid_list.append(feature.GetFID())
+        wkb_list.append(bytes(geometry.ExportToWkb()))
+        for field_name in field_name_list:
+            field_value_lists[field_name].append(feature.GetField(field_name))
+
+    return (fid_list, field_value_lists, wkb_list)
+
+
+def apart_multipolygon_rows(fid_list: list, field_value_lists: dict, wkb_list: list) -> tuple:
+    '''
+    ### Abstract
+        Convert multipolygon to polygon, each polygon becomes a row with the FID and fields of its multipolygon.
+        As utils.apart_multipolygon, the polygons are kept in their order and the polygons of the multipolygons are appended after them
+    ### Parameters
+        - fid_list：FID list
+        - field_value_lists：Dictionary of field value lists
+        - wkb_list：WKB list
+
+    ### Return
+        FID list, dictionary of field value lists and WKB list
+    '''
+    row_indices = []
+    new_wkb_list = []
+    part_row_indices = []
+    part_wkb_list = []
+    for index, wkb in enumerate(wkb_list):
+        geometry: Geometry = ogr.CreateGeometryFromWkb(wkb)
+        if geometry.GetGeometryName() == "MULTIPOLYGON":
+            for i in range(geometry.GetGeometryCount()):
+                part_row_indices.append(index)
+                part_wkb_list.append(bytes(geometry.GetGeometryRef(i).ExportToWkb()))
+        else:
+            row_indices.append(index)
+            new_wkb_list.append(wkb)
+    row_indices += part_row_indices
+    new_wkb_list += part_wkb_list
+
+    fid_list = [fid_list[index] for index in row_indices]
+    field_value_lists = {field_name: [values[index] for index in row_indices] for field_name, values in field_value_lists.items()}
+
+    return (fid_list, field_value_lists, new_wkb_list)
+
+
+@profiled()
+def read_parcel_table(file_name: str, field_name_list: list = None, apart_multipolygon: bool = False) -> ParcelTable:
+    '''
+    ### Abstract
+        Load a layer once into a columnar parcel table, the features without geometry are skipped. The GDAL Arrow stream is used where it is available
+    ### Parameters
+        - file_name：The name of the shapefile
+        - field_name_list：Names of the fields to load, all fields are loaded if it is None
+        - apart_multipolygon：Whether to convert multipolygon to polygon, see apart_multipolygon_rows
+
+    ### Return
+        The parcel table
+    '''
+    file: DataSource = ogr.Open(file_name)
+    layer: Layer = file.GetLayer()
+    layer_defn: FeatureDefn = layer.GetLayerDefn()
+
+    field_types = {}
+    for i in range(layer_defn.GetFieldCount()):
+        field_defn: FieldDefn = layer_defn.GetFieldDefn(i)
+        field_types[field_defn.GetName()] = field_defn.GetType()
+    if field_name_list is None:
+        field_name_list = list(field_types.keys())
+
+    # Fields that are not needed are not read at all
+    layer.SetIgnoredFields([field_name for field_name in field_types if field_name not in field_name_list])
+    field_types = {field_name: field_types[field_name] for field_name in field_name_list}
+
+    if hasattr(layer, 'GetArrowStreamAsNumPy'):
+        fid_list, field_value_lists, wkb_list = read_layer_by_arrow(layer, field_name_list)
+    else:
+        fid_list, field_value_lists, wkb_list = read_layer_by_feature(layer, field_name_list)
+
+    spatial_ref = layer.GetSpatialRef()
+    spatial_ref_wkt = spatial_ref.ExportToWkt() if spatial_ref is not None else None
+    file = None
+
+    if apart_multipolygon:
+        fid_list, field_value_lists, wkb_list = apart_multipolygon_rows(fid_list, field_value_lists, wkb_list)
+
+    fields = {field_name: get_numpy_column(values, field_types[field_name]) for field_name, values in field_value_lists.items()}
+
+    return ParcelTable(np.array(fid_list, dtype=np.int64), fields, wkb_list, spatial_ref_wkt, field_types)
+
+
+
+@profiled()
+def write_parcel_table(output_file_name: str, parcel_table: ParcelTable, layer_schema: tuple, field_value_lists: dict = None, batch_size: int = 10000) -> None:
+    '''
+    ### Abstract
+        Write a parcel table to a new shapefile in one pass, the geometries are built from the WKB
+    ### Parameters
+        - output_file_name：Output file, it is replaced if it exists
+        - parcel_table：The parcel table
+        - layer_schema：Spatial reference, geometry type and list of field definitions of the new layer, see get_layer_schema.
+          The fields are filled from the columns of the table with the same name
+        - field_value_lists：Dictionary of field value lists, the key is the field name. The values are used instead of the columns of the table
+        - batch_size：Number of parcels written in one transaction
+
+    ### Return
+        none
+    '''
+    if field_value_lists is None:
+        field_value_lists = {}
+    _, _, field_defn_list = layer_schema
+
+    # Python values of each field of the new layer
+    value_lists = {}
+    field_defn: FieldDefn
+    for field_defn in field_defn_list:
+        field_name = field_defn.GetName()
+        if field_name in field_value_lists:
+            value_lists[field_name] = list(field_value_lists[field_name])
+        elif field_name in parcel_table.fields:
+            value_lists[field_name] = parcel_table.fields[field_name].tolist()
+
+    file, layer = create_layer(output_file_name, layer_schema)
+    layer_defn: FeatureDefn = layer.GetLayerDefn()
+
+    use_transaction = layer.TestCapability(ogr.OLCTransactions)
+    if use_transaction:
+        layer.StartTransaction()
+
+    for index in range(len(parcel_table)):
+        feature = Feature(layer_defn)
+        feature.SetGeometry(parcel_table.get_geometry(index))
+        for field_name, values in value_lists.items():
+            if values[index] is not None:
+                feature.SetField(field_name, values[index])
+        layer.CreateFeature(feature)
+
+        if use_transaction and (index+1) % batch_size == 0:
+            layer.CommitTransaction()
+            layer.StartTransaction()
+
+    if use_transaction:
+        layer.CommitTransaction()
+    file = None
@@ -0,0 +1,464 @@
+from multiprocessing import Pool
+from enum import Enum
+import numpy as np
+import inspect
+import hashlib
+import json
+import queue
+from utils import delete_shapefile
+from utils import get_file_hash
+from preparation_reclassification import reclassification
+from preparation_DLPS import DLPS
+from preparation_match import match
+from preparation_zonal import zonal
+from preparation_zonal import RasterFileConfig
+from preparation_zonal import StatisticMethod
+from mining_Pg_RF import mining_pg_RF
+from simulation import simulation
+from profiling import profiled
+import os
+os.environ['PROJ_LIB'] = r'C:\Users\dell\AppData\Local\Programs\Python\Python38\Lib\site-packages\osgeo\data\proj'
+
+# Datasets that are not materialized are kept in the GDAL in-memory file system
+MEMORY_DIRECTORY = '/vsimem/urbanvca'
+# The fingerprints of the stages run by run_dag and the hashes of their outputs are kept in this file of the output directory
+MANIFEST_FILE_NAME = 'pipeline_manifest.json'
+
+
+class Stage():
+    def __init__(self, name: str, function, parameters: dict, input_dataset_dict: dict = None, output_dataset_dict: dict = None, version: str = None):
+        self.name = name # Name of the stage
+        self.function = function # Function of the stage, called with keyword parameters
+        self.parameters = parameters # Keyword parameters that do not refer to datasets of the pipeline
+        if input_dataset_dict is None:
+            input_dataset_dict = {}
+        self.input_dataset_dict = input_dataset_dict # The key is the parameter name, the value is the name of the dataset written by an earlier stage
+        if output_dataset_dict is None:
+            output_dataset_dict = {}
+        self.output_dataset_dict = output_dataset_dict # The key is the parameter name, the value is the name of the dataset written by this stage
+        self.version = version # Part of the fingerprint of run_dag, change it when a function called by the stage function changes
+
+
+def get_dataset_file_name(dataset_name: str, output_directory: str, materialized_dataset_name_list: list) -> str:
+    '''
+    ### Abstract
+        Get the shapefile name of a dataset of the pipeline, on disk if it is materialized and in memory otherwise
+    ### Parameters
+        - dataset_name：Name of the dataset
+        - output_directory：Directory of the materialized datasets
+        - materialized_dataset_name_list：Names of the datasets written to disk
+
+    ### Return
+        The shapefile name
+    '''
+    if dataset_name in materialized_dataset_name_list:
+        return os.path.join(output_directory, dataset_name+'.shp')
+    return MEMORY_DIRECTORY+'/'+dataset_name+'.shp'
+
+
+def get_stage_parameters(stage: Stage, dataset_file_names: dict) -> dict:
+    '''
+    ### Abstract
+        Get the keyword parameters of a stage, with the dataset names replaced by their shapefile names
+    ### Parameters
+        - stage：The stage
+        - dataset_file_names：Shapefile name of each dataset
+
+    ### Return
+        Keyword parameters of the stage function
+    '''
+    parameters = dict(stage.parameters)
+    for parameter_name, dataset_name in list(stage.input_dataset_dict.items())+list(stage.output_dataset_dict.items()):
+        parameters[parameter_name] = dataset_file_names[dataset_name]
+
+    return parameters
+
+
+@profiled()
+def run_pipeline(stage_list: list, output_directory: str, materialized_dataset_name_list: list) -> dict:
+    '''
+    ### Abstract
+        Run the stages in order. The datasets passed between the stages stay in memory, only the materialized datasets are written to disk,
+        and each in-memory dataset is freed as soon as no later stage reads it
+    ### Parameters
+        - stage_list：List of Stage, a stage can only read datasets written by earlier stages
+        - output_directory：Directory of the materialized datasets
+        - materialized_dataset_name_list：Names of the datasets written to disk, e.g. the final result and checkpoints of intermediate results
+
+    ### Return
+        Dictionary of the shapefile names of the materialized datasets, the key is the dataset name
+    '''
+    os.makedirs(output_directory, exist_ok=True)
+
+    # Index of the last stage reading each dataset
+    last_use_dict = {}
+    stage: Stage
+    for stage_index, stage in enumerate(stage_list):
+        for dataset_name in stage.input_dataset_dict.values():
+            last_use_dict[dataset_name] = stage_index
+
+    dataset_file_names = {}
+    try:
+        for stage_index, stage in enumerate(stage_list):
+            for dataset_name in stage.output_dataset_dict.values():
+                dataset_file_names[dataset_name] = get_dataset_file_name(dataset_name, output_directory, materialized_dataset_name_list)
+                delete_shapefile(dataset_file_names[dataset_name])
+
+            print('stage:', stage.name)
+            stage.function(**get_stage_parameters(stage, dataset_file_names))
+
+            for dataset_name in stage.input_dataset_dict.values():
+                if last_use_dict[dataset_name] == stage_index and dataset_name not in materialized_dataset_name_list:
+                    delete_shapefile(dataset_file_names[dataset_name])
+    finally:
+        for dataset_name, file_name in dataset_file_names.items():
+            if dataset_name not in materialized_dataset_name_list:
+                delete_shapefile(file_name)
+
+    return {dataset_name: file_name for dataset_name, file_name in dataset_file_names.items() if dataset_name in materialized_dataset_name_list}
+
+
+def get_source_hash(function) -> str:
+    '''
+    ### Abstract
+        Get the hash of the source code of a function or class, so that editing it changes the fingerprint of the stages using it.
+        The bytecode is used when the source code is not available
+    ### Parameters
+        - function：The function or class
+
+    ### Return
+        SHA-256 hex digest, None if neither the source code nor the bytecode is available
+    '''
+    try:
+        source = inspect.getsource(function).encode('utf-8')
+    except (OSError, TypeError):
+        code = getattr(function, '__code__', None)
+        if code is None:
+            return None
+        source = code.co_code+repr(code.co_consts).encode('utf-8')
+
+    return hashlib.sha256(source).hexdigest()
+
+
+def get_canonical_value(value):
+    '''
+    ### Abstract
+        Convert a parameter of a stage to a value that can be serialized by json and does not depend on the process, files are replaced by the hash of their content
+    ### Parameters
+        - value：The parameter
+
+    ### Return
+        The canonical value
+    '''
+    if isinstance(value, Enum):
+        return type(value).__name__+'.'+value.name
+    if isinstance(value, dict):
+        return {str(key): get_canonical_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [get_canonical_value(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, str) and os.path.isfile(value):
+        return {'file_name': value, 'hash': get_file_hash(value)}
+    if callable(value) and hasattr(value, '__qualname__'):
+        return {'name': getattr(value, '__module__', '')+'.'+value.__qualname__, 'hash': get_source_hash(value)}
+    if hasattr(value, '__dict__'):
+        return {'class': type(value).__name__, 'attributes': get_canonical_value(vars(value))}
+    return value
+
+
+def get_stage_fingerprint(stage: Stage, dataset_hashes: dict) -> str:
+    '''
+    ### Abstract
+        Get the fingerprint of a stage from its function (name and source code), its version, its parameters and the content of its input datasets.
+        Only the source code of the stage function itself is hashed, the functions it calls are covered by the version of the stage
+    ### Parameters
+        - stage：The stage
+        - dataset_hashes：Hash of the content of each dataset written so far
+
+    ### Return
+        SHA-256 hex digest
+    '''
+    fingerprint = {
+        'function': get_canonical_value(stage.function),
+        'version': stage.version,
+        'parameters': get_canonical_value(stage.parameters),
+        'inputs': {parameter_name: dataset_hashes[dataset_name] for parameter_name, dataset_name in stage.input_dataset_dict.items()},
+        'outputs': stage.output_dataset_dict,
+    }
+
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+
+
+def load_manifest(output_directory: str) -> dict:
+    '''
+    ### Abstract
+        Load the fingerprints of the stages run before in the output directory
+    ### Parameters
+        - output_directory：Directory of the datasets
+
+    ### Return
+        Dictionary of {'fingerprint','output_hashes'}, the key is the stage name
+    '''
+    manifest_file_name = os.path.join(output_directory, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_file_name):
+        return {}
+    with open(manifest_file_name, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_manifest(output_directory: str, manifest: dict) -> None:
+    '''
+    ### Abstract
+        Save the fingerprints of the stages, the file is replaced at once so that an interrupted run leaves the last complete manifest
+    ### Parameters
+        - output_directory：Directory of the datasets
+        - manifest：Dictionary of {'fingerprint','output_hashes'}, the key is the stage name
+
+    ### Return
+        none
+    '''
+    manifest_file_name = os.path.join(output_directory, MANIFEST_FILE_NAME)
+    with open(manifest_file_name+'.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(manifest_file_name+'.tmp', manifest_file_name)
+
+
+def is_stage_up_to_date(stage: Stage, fingerprint: str, manifest: dict, dataset_file_names: dict) -> bool:
+    '''
+    ### Abstract
+        Whether a stage can be skipped: it was run before with the same fingerprint and its outputs have not been changed or deleted since
+    ### Parameters
+        - stage：The stage
+        - fingerprint：The fingerprint of the stage, see get_stage_fingerprint
+        - manifest：The fingerprints of the stages run before
+        - dataset_file_names：Shapefile name of each dataset
+
+    ### Return
+        True if the stage can be skipped
+    '''
+    record = manifest.get(stage.name)
+    if record is None or record['fingerprint'] != fingerprint:
+        return False
+    for dataset_name in stage.output_dataset_dict.values():
+        file_name = dataset_file_names[dataset_name]
+        if dataset_name not in record['output_hashes'] or not os.path.exists(file_name) or get_file_hash(file_name) != record['output_hashes'][dataset_name]:
+            return False
+
+    return True
+
+
+def get_stage_process_count(stage: Stage) -> int:
+    '''
+    ### Abstract
+        Get the process_count parameter of a stage, with the default of the stage function if it is not set
+    ### Parameters
+        - stage：The stage
+
+    ### Return
+        The number of processes, 1 if the stage function has no process_count parameter
+    '''
+    signature_parameter = inspect.signature(stage.function).parameters.get('process_count')
+    if signature_parameter is None:
+        return 1
+    return stage.parameters.get('process_count', signature_parameter.default)
+
+
+def run_stage_task(task: tuple) -> dict:
+    '''
+    ### Abstract
+        Run a stage in a worker process
+    ### Parameters
+        - task：(stage, dataset_file_names)
+
+    ### Return
+        Hash of the content of each output dataset, the key is the dataset name
+    '''
+    stage, dataset_file_names = task
+    stage: Stage
+    for dataset_name in stage.output_dataset_dict.values():
+        delete_shapefile(dataset_file_names[dataset_name])
+
+    print('stage:', stage.name)
+    stage.function(**get_stage_parameters(stage, dataset_file_names))
+
+    return {dataset_name: get_file_hash(dataset_file_names[dataset_name]) for dataset_name in stage.output_dataset_dict.values()}
+
+
+@profiled()
+def run_dag(stage_list: list, output_directory: str, process_count: int = None, force: bool = False) -> dict:
+    '''
+    ### Abstract
+        Run the stages as a directed acyclic graph: a stage starts in a process pool as soon as the stages writing its inputs are done, so that independent branches
+        (e.g. the reclassification and DLPS of the two periods) run at the same time. A stage is skipped if its fingerprint (function, parameters and content of its inputs)
+        matches the last run in output_directory and its outputs are unchanged. All datasets are written to output_directory, as worker processes do not share memory.
+        The worker processes are daemonic and cannot start processes of their own, so a stage whose function takes a process_count parameter
+        (e.g. DLPS or simulation_ensemble) must set it to 1, otherwise ValueError is raised before any stage runs
+    ### Parameters
+        - stage_list：List of Stage, in any order
+        - output_directory：Directory of the datasets and of the manifest of fingerprints
+        - process_count：Number of worker processes, the number of CPUs if it is None
+        - force：Run all stages even if they are up to date
+
+    ### Return
+        Dictionary of the shapefile names of the datasets, the key is the dataset name
+    '''
+    os.makedirs(output_directory, exist_ok=True)
+
+    # The stage writing each dataset and the stages each stage depends on
+    producer_dict = {}
+    stage: Stage
+    for stage in stage_list:
+        for dataset_name in stage.output_dataset_dict.values():
+            if dataset_name in producer_dict:
+                raise ValueError('Dataset %s is written by more than one stage' % dataset_name)
+            producer_dict[dataset_name] = stage.name
+    dependency_dict = {}
+    for stage in stage_list:
+        for dataset_name in stage.input_dataset_dict.values():
+            if dataset_name not in producer_dict:
+                raise ValueError('Dataset %s read by stage %s is not written by any stage' % (dataset_name, stage.name))
+        dependency_dict[stage.name] = {producer_dict[dataset_name] for dataset_name in stage.input_dataset_dict.values()}
+        # The workers of the pool are daemonic and cannot start processes of their own
+        if get_stage_process_count(stage) != 1:
+            raise ValueError('Stage %s starts worker processes, set its process_count to 1 to run it with run_dag or use run_pipeline' % stage.name)
+
+    dataset_file_names = {dataset_name: os.path.join(output_directory, dataset_name+'.shp') for dataset_name in producer_dict}
+    dataset_hashes = {}
+    manifest = load_manifest(output_directory)
+    fingerprint_dict = {}
+    done_stage_names = set()
+    running_stage_names = set()
+    result_queue = queue.Queue()
+
+    with Pool(processes=process_count) as pool:
+        while len(done_stage_names) < len(stage_list):
+            # Skipping a stage may make other stages ready, so look for ready stages until there is none
+            ready_stage_list = [None]
+            while ready_stage_list:
+                ready_stage_list = [stage for stage in stage_list if stage.name not in done_stage_names and stage.name not in running_stage_names and dependency_dict[stage.name] <= done_stage_names]
+                for stage in ready_stage_list:
+                    fingerprint_dict[stage.name] = get_stage_fingerprint(stage, dataset_hashes)
+                    if not force and is_stage_up_to_date(stage, fingerprint_dict[stage.name], manifest, dataset_file_names):
+                        print('stage:', stage.name, 'is up to date')
+                        dataset_hashes.update(manifest[stage.name]['output_hashes'])
+                        done_stage_names.add(stage.name)
+                    else:
+                        running_stage_names.add(stage.name)
+                        pool.apply_async(run_stage_task, ((stage, dataset_file_names),),
+                                         callback=lambda result, stage_name=stage.name: result_queue.put((stage_name, result, None)),
+                                         error_callback=lambda error, stage_name=stage.name: result_queue.put((stage_name, None, error)))
+                ready_stage_list = [stage for stage in ready_stage_list if stage.name in done_stage_names]
+
+            if not running_stage_names:
+                if len(done_stage_names) < len(stage_list):
+                    raise ValueError('The stages contain a cycle: %s' % sorted(set(dependency_dict)-done_stage_names))
+                break
+
+            stage_name, output_hashes, error = result_queue.get()
+            running_stage_names.remove(stage_name)
+            if error is not None:
+                raise RuntimeError('Stage %s failed' % stage_name) from error
+
+            dataset_hashes.update(output_hashes)
+            manifest[stage_name] = {'fingerprint': fingerprint_dict[stage_name], 'output_hashes': output_hashes}
+            save_manifest(output_directory, manifest)
+            done_stage_names.add(stage_name)
+
+    return dataset_file_names
+
+
+def get_urbanvca_stage_list(before_file_name: str, after_file_name: str, reclass_field_name: str, reclass_dict: dict, max_iteration: int, allowable_parameter: float,
+                            raster_file_config_list: list, tree_count: int, restricted_area_file_name: str, RA_alpha: float, buffer_range: float, iteration: int,
+                            change=None, seed: int = None, error_value: float = -99999) -> list:
+    '''
+    ### Abstract
+        The stages of the whole UrbanVCA workflow: reclassification and DLPS of both periods, match, zonal, mining_pg_RF and simulation.
+        The datasets are named before_re, after_re, before_dlps, after_dlps, match, zonal, pg and simulated
+    ### Parameters
+        - before_file_name：The land use type file of the earlier period
+        - after_file_name：The land use type file of the later period
+        - reclass_field_name：The field name representing land use types in both files
+        - reclass_dict：The reclassification dictionary, see reclassification
+        - max_iteration：The number of segmentation iterations of DLPS
+        - allowable_parameter：The allowable parameter of DLPS
+        - raster_file_config_list：List of configurations of the spatial variable rasters, see zonal
+        - tree_count：The number of decision trees in the Random Forest
+        - restricted_area_file_name：The address of the restricted area shapefile
+        - RA_alpha：Calculating the random factor
+        - buffer_range：The neighborhood range
+        - iteration：The number of iterations of the simulation
+        - change：The conversion matrix, None means that all conversions are allowed
+        - seed：Seed of DLPS and of the simulation
+        - error_value：Error value
+
+    ### Return
+        List of Stage
+    '''
+    stage_list = []
+    for period in ['before', 'after']:
+        stage_list.append(Stage(
+            period+'_reclassification', reclassification,
+            {'input_file_name': before_file_name if period == 'before' else after_file_name, 'reclass_field_name': reclass_field_name, 'new_field_name': 'new', 'reclass_dict': reclass_dict},
+            output_dataset_dict={'output_file_name': period+'_re'}))
+        stage_list.append(Stage(
+            period+'_DLPS', DLPS,
+            {'max_iteration': max_iteration, 'allowable_parameter': allowable_parameter, 'seed': seed},
+            input_dataset_dict={'input_file_name': period+'_re'},
+            output_dataset_dict={'output_file_name': period+'_dlps'}))
+
+    stage_list.append(Stage(
+        'match', match,
+        {'before_landuse_field_name': 'new', 'after_landuse_field_name': 'new'},
+        input_dataset_dict={'before_file_name': 'before_dlps', 'after_file_name': 'after_dlps'},
+        output_dataset_dict={'output_file_name': 'match'}))
+    stage_list.append(Stage(
+        'zonal', zonal,
+        {'raster_file_config_list': raster_file_config_list, 'output_csvfile_name': None, 'error_value': error_value},
+        input_dataset_dict={'polygon_file_name': 'match'},
+        output_dataset_dict={'output_shapefile_name': 'zonal'}))
+    stage_list.append(Stage(
+        'mining_pg_RF', mining_pg_RF,
+        {'output_csvfile_name': None, 'label_field_name': 'after', 'spatial_variable_field_name_list': [raster_file_config.field_name for raster_file_config in raster_file_config_list], 'tree_count': tree_count, 'error_value': error_value},
+        input_dataset_dict={'input_file_name': 'zonal'},
+        output_dataset_dict={'output_shapefile_name': 'pg'}))
+    stage_list.append(Stage(
+        'simulation', simulation,
+        {'restricted_area_file_name': restricted_area_file_name, 'before_landuse_field_name': 'before', 'after_landuse_field_name': 'after',
+         'RA_alpha': RA_alpha, 'buffer_range': buffer_range, 'iteration': iteration, 'error_value': error_value, 'change': change, 'seed': seed},
+        input_dataset_dict={'input_file_name': 'pg'},
+        output_dataset_dict={'output_file_name': 'simulated'}))
+
+    return stage_list
+
+
+if __name__ == '__main__':
+    stage_list = get_urbanvca_stage_list(
+        before_file_name=r"E:\UrbanVCA_Python\data\2015.shp",
+        after_file_name=r"E:\UrbanVCA_Python\data\2018.shp",
+        reclass_field_name='DLMC',
+        reclass_dict={'city': 0, 'water': 1, 'farmland': 2, 'garden': 3, 'woodland': 4},
+        max_iteration=6,
+        allowable_parameter=2,
+        raster_file_config_list=[
+            RasterFileConfig(r"E:\UrbanVCA_Python\data\dem.tif", 'dem', StatisticMethod.mean),
+            RasterFileConfig(r"E:\UrbanVCA_Python\data\highway.tif", 'highway', StatisticMethod.mean),
+            RasterFileConfig(r"E:\UrbanVCA_Python\data\metro.tif", 'metro', StatisticMethod.mean),
+            RasterFileConfig(r"E:\UrbanVCA_Python\data\osm.tif", 'osm', StatisticMethod.mean),
+            RasterFileConfig(r"E:\UrbanVCA_Python\data\resident.tif", 'resident', StatisticMethod.mean),
+            RasterFileConfig(r"E:\UrbanVCA_Python\data\restaurant.tif", 'restaurant', StatisticMethod.mean),
+        ],
+        tree_count=100,
+        restricted_area_file_name=r"E:\UrbanVCA_Python\data\restrictedArea.shp",
+        RA_alpha=5,
+        buffer_range=600,
+        iteration=5,
+        seed=0,
+        change=[[1, 0, 1, 1, 1],
+                [1, 1, 1, 1, 1],
+                [1, 0, 1, 1, 1],
+                [1, 0, 1, 1, 1],
+                [1, 0, 1, 1, 1],
+                ])
+
+    run_pipeline(stage_list, r"E:\UrbanVCA_Python\output", ['match', 'pg', 'simulated'])
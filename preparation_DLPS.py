@@ -1,335 +1,768 @@
-from osgeo import ogr
-from osgeo.ogr import DataSource
-from osgeo.ogr import Layer
-from osgeo.ogr import Feature
-from osgeo.ogr import Geometry
-import numpy as np
-from numpy import ndarray
-import matplotlib.pyplot as plt
-import random
-from utils import copy_shapefile
-from utils import get_feature_list
-from utils import apart_multipolygon
-from utils import delete_all_feature
-from utils import add_all_feature
-import os
-os.environ['PROJ_LIB'] = r'C:\Users\dell\AppData\Local\Programs\Python\Python38\Lib\site-packages\osgeo\data\proj'
-def get_radian_with_x_axis(vector: ndarray) -> float:
-    '''
-    ### Abstract
-        Calculate the radian of the Angle between the vector and the X-axis. If the vector is in the first and second quadrants, the rotation Angle is negative so that the convex envelope rotates clockwise
-    ### Parameters
-        - vector：The vector of radians to be calculated with the X-axis
-
-    ### Return
-        The arc of the Angle
-    '''
-    x_axis = np.array([1, 0])
-    cos = np.dot(vector/np.linalg.norm(vector), x_axis/np.linalg.norm(x_axis))
-    radian = np.arccos(cos)
-    if vector[1] > 0:
-        radian = -radian
-    return radian
-
-
-def get_rotated_points(anchor: ndarray, points: ndarray, radian: float) -> ndarray:
-    '''
-    ### Abstract
-        Rotate all points counterclockwise around a point
-    ### Parameters
-        - anchor：Rotate around that point
-        - points：The set of points to rotate
-        - radian：The radian of the rotation Angle
-
-    ### Return
-        The set of points after rotation
-    '''
-    rotate_matrix = np.array([[np.cos(radian), np.sin(radian)],
-                              [-np.sin(radian), np.cos(radian)]])
-    return (points-anchor).dot(rotate_matrix)+anchor
-
-
-def get_rectangle(points: ndarray) -> ndarray:
-    '''
-    ### Abstract
-        Find the minimum and maximum values of the x and y coordinates of all points, resulting in an external rectangle
-    ### Parameters
-        - points：The set of points of the surrounding rectangle will be evaluated
-
-    ### Return
-        The set of points that make up the external rectangle
-    '''
-    xmin = points[:, 0].min()
-    xmax = points[:, 0].max()
-    ymin = points[:, 1].min()
-    ymax = points[:, 1].max()
-
-    return np.array([[xmin, ymax], [xmax, ymax], [xmax, ymin], [xmin, ymin], [xmin, ymax]])
-
-
-def get_rectangle_area(rectangle_points: ndarray) -> float:
-    '''
-    ### Abstract
-        Calculate the area of a rectangle with sides parallel to the x and y axes
-    ### Parameters
-        - The set of points that make up a rectangle
-
-    ### Return
-        Rectangular area
-    '''
-    dx = rectangle_points[1, 0]-rectangle_points[0, 0]
-    dy = rectangle_points[0, 1]-rectangle_points[2, 1]
-    return dx*dy
-
-
-def get_long_edge_index(MABR: ndarray) -> int:
-    '''
-    ### Abstract
-        Calculate the length of the two adjacent sides and get the index of the points that make up the long sides
-    ### Parameters
-        - MABR：The set of points that make up MABR
-
-    ### Return
-        If the edge of the 0 and 1 points is the long side, 1 is returned
-        If the edge of points 0 and 3 is the long side, then 3 is returned
-    '''
-    distance_0_1 = np.linalg.norm(MABR[0]-MABR[1])
-    distance_0_3 = np.linalg.norm(MABR[0]-MABR[3])
-
-    if distance_0_1 > distance_0_3:
-        return 1
-    return 3
-
-
-def get_bisected_MABR(MABR: ndarray) -> ndarray:
-    '''
-    ### Abstract
-        Bisect the long sides of the MABR, resulting in two rectangles
-    ### Parameters
-        - MABR：The set of points that make up MABR
-
-    ### Return
-        An array of two small rectangles of the shape 2x5x2, two rectangles with five points each, and xy two values at each point
-    '''
-
-    bisected_MABR = np.zeros(shape=(2, 5, 2))
-
-    long_edge_index = get_long_edge_index(MABR)
-    if long_edge_index == 1:
-        midpoint_0_1 = (MABR[0]+MABR[1])/2
-        midpoint_2_3 = (MABR[2]+MABR[3])/2
-
-        bisected_MABR[0, 0] = MABR[0]          # 0-------------1
-        bisected_MABR[0, 1] = midpoint_0_1     # |      |      |
-        bisected_MABR[0, 2] = midpoint_2_3     # |      |      |
-        bisected_MABR[0, 3] = MABR[3]          # |      |      |
-        bisected_MABR[0, 4] = MABR[0]          # 3-------------2
-
-        bisected_MABR[1, 0] = midpoint_0_1
-        bisected_MABR[1, 1] = MABR[1]
-        bisected_MABR[1, 2] = MABR[2]
-        bisected_MABR[1, 3] = midpoint_2_3
-        bisected_MABR[1, 4] = midpoint_0_1
-
-    if long_edge_index == 3:
-        midpoint_0_3 = (MABR[0]+MABR[3])/2
-        midpoint_1_2 = (MABR[1]+MABR[2])/2
-
-        bisected_MABR[0, 0] = MABR[0]          # 0-------------1
-        bisected_MABR[0, 1] = MABR[1]          # |             |
-        bisected_MABR[0, 2] = midpoint_1_2     # |             |
-        bisected_MABR[0, 3] = midpoint_0_3     # |             |
-        bisected_MABR[0, 4] = MABR[0]          # |             |
-                                               # |-------------|
-        bisected_MABR[1, 0] = midpoint_0_3     # |             |
-        bisected_MABR[1, 1] = midpoint_1_2     # |             |
-        bisected_MABR[1, 2] = MABR[2]          # |             |
-        bisected_MABR[1, 3] = MABR[3]          # |             |
-        bisected_MABR[1, 4] = midpoint_0_3     # 3-------------2
-    return bisected_MABR
-
-
-def get_MABR(convex_hull_points: ndarray) -> ndarray:
-    '''
-    ### Abstract
-        According to the theorem of geometry, one of the MABR edges of the convex hull coincides with one of the edges of the convex hull
-        Therefore, the MABR corresponding to all sides of the convex hull is obtained, and the MABR with the smallest area is returned
-    ### Parameters
-        - convex_hull_points：Point sequence of convex hull
-
-    ### Return
-        The outer rectangle with the smallest area, which is MABR
-    '''
-    edge_count: int = len(convex_hull_points)-1
-    # Each edge of the convex hull corresponds to the area of an external rectangle
-    areas: ndarray = np.zeros(shape=(edge_count,))
-    rectangle_list: list = []
-
-    # Traverse each side of the convex hull
-    for i in range(edge_count):
-        # The Angle between the current side and the X-axis
-        radian = get_radian_with_x_axis(convex_hull_points[i]-convex_hull_points[i+1])
-        # Rotate the convex hull around one end of the current edge so that the current edge is parallel to the X-axis
-        rotated_points = get_rotated_points(convex_hull_points[i], convex_hull_points, radian)
-        # The external rectangle of the convex hull after rotation
-        rectangle = get_rectangle(rotated_points)
-        # Calculate the area of the outer rectangle
-        areas[i] = get_rectangle_area(rectangle)
-        # The outer rectangle is rotated in reverse to obtain the outer rectangle that covers the convex hull before rotation
-        rectangle = get_rotated_points(convex_hull_points[i], rectangle, -radian)
-        # Adds the external rectangle to the candidate list
-        rectangle_list.append(rectangle)
-
-    # Returns the external rectangle with the smallest area
-    return rectangle_list[areas.argmin()]
-
-def write_to_file(output_file_name:str,feature_list:list)->None:
-    '''
-    ### Abstract
-        All plots are emptied and written into new plots
-    ### Parameters
-        - output_file_name：The file name of the plots to be written
-        - feature_list：A list of all the plots to be written consists of
-
-    ### Return
-        none
-    '''
-    file: DataSource = ogr.Open(output_file_name,1)
-    layer:Layer = file.GetLayer()
-    delete_all_feature(layer)
-    add_all_feature(layer,feature_list)
-
-def get_mean_and_std_of_area(feature_list:list)->tuple:
-    '''
-    ### Abstract
-        The mean and standard deviation of all plots were obtained
-    ### Parameters
-        - feature_list：List of all plots composed
-
-    ### Return
-        A tuple of mean and standard deviation
-    '''
-    areas=np.zeros(shape=(len(feature_list),))
-    feature:Feature
-    for index,feature in enumerate(feature_list):
-        geometry:Geometry=feature.GetGeometryRef()
-        areas[index]=geometry.GetArea()
-
-    return (areas.mean(),areas.std())
-
-def points_to_polygon(points:ndarray)->Geometry:
-    '''
-    ### Abstract
-        Convert the sequence of points to polygon for GDAL processing
-    ### Parameters
-        - points：Sequence of points, shape n rows 2 columns, n is the number of points, the two columns are respectively the xy coordinates of points, the first point and the last point must be the same
-
-    ### Return
-        polygon with a sequence of points entered
-    '''
-    ring:Geometry=Geometry(ogr.wkbLinearRing)
-    for point in points:
-        ring.AddPoint(point[0],point[1])
-    polygon:Geometry=Geometry(ogr.wkbPolygon)
-    polygon.AddGeometry(ring)
-    
-    return polygon
-
-def split_feature_into_two(feature:Feature)->tuple:
-    '''
-    ### Abstract
-        Divide a plot. Firstly, the convex hull of the block is obtained, and then MABR is obtained. The MABR is divided into two parts and intersected with the block to obtain the divided block
-    ### Parameters
-        - feature：A plot to be divided
-
-    ### Return
-        A tuple of two new blocks
-    '''
-    geometry:Geometry=feature.GetGeometryRef()
-    convex_hull:Geometry=geometry.ConvexHull()
-
-    MABR=get_MABR(np.array(convex_hull.GetGeometryRef(0).GetPoints())[:,:2])
-    bisected_MABR=get_bisected_MABR(MABR)
-
-    polygon1=points_to_polygon(bisected_MABR[0])
-    polygon2=points_to_polygon(bisected_MABR[1])
-
-    new_feature1:Feature=feature.Clone()
-    new_feature1.SetGeometry(geometry.Intersection(polygon1))
-    new_feature2:Feature=feature.Clone()
-    new_feature2.SetGeometry(geometry.Intersection(polygon2))
-
-    return (new_feature1,new_feature2)
-
-def split_once(feature_list:list,allowable_parameter:float)->list:
-    '''
-    ### Abstract
-        The mean and standard deviation of all plots were obtained, the plots that met the requirements of segmentation were divided, two new plots were obtained, and the old plots that had been divided were deleted
-    ### Parameters
-        - feature_list：List of all plots
-        - allowable_parameter：allowable parameter
-
-    ### Return
-        List of subdivided plots
-    '''
-    mean,std=get_mean_and_std_of_area(feature_list)
-    
-    new_feature_list=[]
-    splited_feature_index=[]
-    random_number = random.random()
-    feature:Feature
-    for index,feature in enumerate(feature_list):
-        geometry:Geometry=feature.GetGeometryRef()
-        area=geometry.GetArea()
-
-        if area>mean+allowable_parameter*std*random_number:
-            splited_feature_index.append(index)
-            new_feature1,new_feature2=split_feature_into_two(feature)
-            new_feature_list.append(new_feature1)
-            new_feature_list.append(new_feature2)
-            
-    splited_feature_index.reverse()
-    for index in splited_feature_index:
-        feature_list.pop(index)
-
-    return feature_list+new_feature_list
-
-
-def DLPS(input_file_name:str,output_file_name:str,max_iteration:int,allowable_parameter:float)->None:
-    '''
-    ### Abstract
-        parcel segmentation based on the Minimum Area Bounding Rectangle (MABR) of the parcel's convex hull
-    ### Parameters
-        - input_file_name: the file path of the land use types file (.shp) after land use reclassification
-        - output_file_name: the output path of the result file
-        - max_iteration: the number of segmentation iterations
-        - allowable_parameter: the allowable parameter for the segmentation process
-
-    ### Return
-        none
-    '''
-    copy_shapefile(input_file_name,output_file_name)
-
-    feature_list=get_feature_list(output_file_name)
-    feature_list=apart_multipolygon(feature_list)
-
-    for i in range(max_iteration):
-        feature_list=split_once(feature_list,allowable_parameter)
-        feature_list=apart_multipolygon(feature_list)
-
-    write_to_file(output_file_name,feature_list)
-    return
-
-
-if __name__=='__main__':
-    DLPS(
-        input_file_name=r"E:\UrbanVCA_Python\output\2015_re.shp",
-        output_file_name=r"E:\UrbanVCA_Python\output\2015_dlps.shp",
-        max_iteration=6,
-        allowable_parameter=2)
-
-    DLPS(
-        input_file_name=r"E:\UrbanVCA_Python\output\2018_re.shp",
-        output_file_name=r"E:\UrbanVCA_Python\output\2018_dlps.shp",
-        max_iteration=6,
-        allowable_parameter=2)
+from osgeo import ogr
+from osgeo.ogr import DataSource
+from osgeo.ogr import Layer
+from osgeo.ogr import Feature
+from osgeo.ogr import Geometry
+import numpy as np
+from numpy import ndarray
+import matplotlib.pyplot as plt
+import random
+import heapq
+import tempfile
+import shutil
+from multiprocessing import Pool
+from utils import get_feature_list
+from utils import apart_multipolygon
+from utils import get_layer_schema
+from utils import write_feature_list
+from utils import create_layer
+from utils import delete_shapefile
+from profiling import profiled
+import os
+os.environ['PROJ_LIB'] = r'C:\Users\dell\AppData\Local\Programs\Python\Python38\Lib\site-packages\osgeo\data\proj'
+def get_long_edge_index(MABR: ndarray) -> int:
+    '''
+    ### Abstract
+        Calculate the length of the two adjacent sides and get the index of the points that make up the long sides
+    ### Parameters
+        - MABR：The set of points that make up MABR
+
+    ### Return
+        If the edge of the 0 and 1 points is the long side, 1 is returned
+        If the edge of points 0 and 3 is the long side, then 3 is returned
+    '''
+    distance_0_1 = np.linalg.norm(MABR[0]-MABR[1])
+    distance_0_3 = np.linalg.norm(MABR[0]-MABR[3])
+
+    if distance_0_1 > distance_0_3:
+        return 1
+    return 3
+
+
+def get_bisected_MABR(MABR: ndarray) -> ndarray:
+    '''
+    ### Abstract
+        Bisect the long sides of the MABR, resulting in two rectangles
+    ### Parameters
+        - MABR：The set of points that make up MABR
+
+    ### Return
+        An array of two small rectangles of the shape 2x5x2, two rectangles with five points each, and xy two values at each point
+    '''
+
+    bisected_MABR = np.zeros(shape=(2, 5, 2))
+
+    long_edge_index = get_long_edge_index(MABR)
+    if long_edge_index == 1:
+        midpoint_0_1 = (MABR[0]+MABR[1])/2
+        midpoint_2_3 = (MABR[2]+MABR[3])/2
+
+        bisected_MABR[0, 0] = MABR[0]          # 0-------------1
+        bisected_MABR[0, 1] = midpoint_0_1     # |      |      |
+        bisected_MABR[0, 2] = midpoint_2_3     # |      |      |
+        bisected_MABR[0, 3] = MABR[3]          # |      |      |
+        bisected_MABR[0, 4] = MABR[0]          # 3-------------2
+
+        bisected_MABR[1, 0] = midpoint_0_1
+        bisected_MABR[1, 1] = MABR[1]
+        bisected_MABR[1, 2] = MABR[2]
+        bisected_MABR[1, 3] = midpoint_2_3
+        bisected_MABR[1, 4] = midpoint_0_1
+
+    if long_edge_index == 3:
+        midpoint_0_3 = (MABR[0]+MABR[3])/2
+        midpoint_1_2 = (MABR[1]+MABR[2])/2
+
+        bisected_MABR[0, 0] = MABR[0]          # 0-------------1
+        bisected_MABR[0, 1] = MABR[1]          # |             |
+        bisected_MABR[0, 2] = midpoint_1_2     # |             |
+        bisected_MABR[0, 3] = midpoint_0_3     # |             |
+        bisected_MABR[0, 4] = MABR[0]          # |             |
+                                               # |-------------|
+        bisected_MABR[1, 0] = midpoint_0_3     # |             |
+        bisected_MABR[1, 1] = midpoint_1_2     # |             |
+        bisected_MABR[1, 2] = MABR[2]          # |             |
+        bisected_MABR[1, 3] = MABR[3]          # |             |
+        bisected_MABR[1, 4] = midpoint_0_3     # 3-------------2
+    return bisected_MABR
+
+
+def get_MABR_list(convex_hull_points_list: list, max_element_count: int = 1 << 22) -> ndarray:
+    '''
+    ### Abstract
+        According to the theorem of geometry, one of the MABR edges of the convex hull coincides with one of the edges of the convex hull.
+        For all edges of many convex hulls at once, the points are projected onto the direction of the edge and its normal, the extent of the projections gives the area of the external rectangle,
+        and only the rectangle with the smallest area of each convex hull is built. Convex hulls with similar numbers of points are batched together, the shorter ones are padded with their last point
+    ### Parameters
+        - convex_hull_points_list：List of point sequences of convex hulls, the first point and the last point of each are the same
+        - max_element_count：Maximum number of projections calculated in one batch, it bounds the memory
+
+    ### Return
+        MABR of each convex hull, an array of shape mx5x2, the first point and the last point of each are the same
+    '''
+    MABR_array = np.zeros(shape=(len(convex_hull_points_list), 5, 2))
+    point_counts = np.array([len(points) for points in convex_hull_points_list])
+    order = np.argsort(point_counts, kind='stable')
+
+    start = 0
+    while start < len(order):
+        # The batch grows while the projections of its longest convex hull fit in max_element_count
+        end = start+1
+        while end < len(order) and (end+1-start)*point_counts[order[end]]**2 <= max_element_count:
+            end += 1
+        batch_indices = order[start:end]
+        point_count = point_counts[batch_indices[-1]]
+
+        points = np.zeros(shape=(len(batch_indices), point_count, 2))
+        for batch_index, index in enumerate(batch_indices):
+            hull_points = convex_hull_points_list[index]
+            # Move the points next to the origin, the projections of large coordinates lose precision
+            points[batch_index, :len(hull_points)] = hull_points-hull_points[0]
+            points[batch_index, len(hull_points):] = hull_points[-1]-hull_points[0]
+
+        # Unit vectors of the edges and their normals, the padded edges have no length and are replaced by the x axis, whose rectangle is never smaller than the MABR
+        edges = points[:, 1:]-points[:, :-1]
+        lengths = np.linalg.norm(edges, axis=2, keepdims=True)
+        directions = np.where(lengths > 0, edges/np.where(lengths > 0, lengths, 1), np.array([1.0, 0.0]))
+        normals = np.stack([-directions[:, :, 1], directions[:, :, 0]], axis=2)
+
+        # Projections of all points onto the direction and the normal of each edge, of shape batch x edges x points
+        u = np.einsum('bed,bpd->bep', directions, points)
+        v = np.einsum('bed,bpd->bep', normals, points)
+        u_min, u_max = u.min(axis=2), u.max(axis=2)
+        v_min, v_max = v.min(axis=2), v.max(axis=2)
+        areas = (u_max-u_min)*(v_max-v_min)
+
+        best = areas.argmin(axis=1)
+        rows = np.arange(len(batch_indices))
+        direction = directions[rows, best]
+        normal = normals[rows, best]
+        corner_u = np.stack([u_min[rows, best], u_max[rows, best], u_max[rows, best], u_min[rows, best], u_min[rows, best]], axis=1)
+        corner_v = np.stack([v_max[rows, best], v_max[rows, best], v_min[rows, best], v_min[rows, best], v_max[rows, best]], axis=1)
+        origins = np.array([convex_hull_points_list[index][0] for index in batch_indices])
+        MABR_array[batch_indices] = corner_u[:, :, None]*direction[:, None, :]+corner_v[:, :, None]*normal[:, None, :]+origins[:, None, :]
+
+        start = end
+
+    return MABR_array
+
+
+def get_MABR(convex_hull_points: ndarray) -> ndarray:
+    '''
+    ### Abstract
+        Get the MABR of one convex hull, see get_MABR_list
+    ### Parameters
+        - convex_hull_points：Point sequence of convex hull
+
+    ### Return
+        The outer rectangle with the smallest area, which is MABR
+    '''
+    return get_MABR_list([convex_hull_points])[0]
+
+@profiled()
+def write_to_file(output_file_name:str,feature_list:list,layer_schema:tuple)->None:
+    '''
+    ### Abstract
+        Write the plots into a new file
+    ### Parameters
+        - output_file_name：The file name of the plots to be written
+        - feature_list：A list of all the plots to be written consists of
+        - layer_schema：The schema of the input layer, see get_layer_schema
+
+    ### Return
+        none
+    '''
+    write_feature_list(output_file_name,feature_list,layer_schema)
+
+def get_areas(feature_list:list)->ndarray:
+    '''
+    ### Abstract
+        The areas of all plots were obtained
+    ### Parameters
+        - feature_list：List of all plots composed
+
+    ### Return
+        Array of the areas
+    '''
+    areas=np.zeros(shape=(len(feature_list),))
+    feature:Feature
+    for index,feature in enumerate(feature_list):
+        geometry:Geometry=feature.GetGeometryRef()
+        areas[index]=geometry.GetArea()
+
+    return areas
+
+def get_mean_and_std_from_sums(count:int,area_sum:float,square_sum:float,reference_area:float)->tuple:
+    '''
+    ### Abstract
+        The mean and standard deviation of areas from their running sums
+    ### Parameters
+        - count：Number of areas
+        - area_sum：Sum of the areas minus reference_area
+        - square_sum：Sum of the squares of the areas minus reference_area
+        - reference_area：The value subtracted from the areas, close to their mean so that the variance does not lose precision
+
+    ### Return
+        A tuple of mean and standard deviation
+    '''
+    if count==0:
+        return (0.0,0.0)
+    shifted_mean=area_sum/count
+    variance=max(square_sum/count-shifted_mean**2,0.0)
+
+    return (reference_area+shifted_mean,variance**0.5)
+
+class ParcelStore():
+    '''
+    The plots of DLPS with their areas. The mean and standard deviation of the areas are kept as running sums, and a max-heap of the areas gives the plots above the threshold
+    without scanning the others. Divided plots leave an empty slot, so that the order of the plots is the same as removing them from a list and appending the new ones
+    '''
+    def __init__(self,feature_list:list):
+        areas=get_areas(feature_list)
+        self.feature_list=[] # Plots by slot, None for the divided plots
+        self.areas=[] # Area of the plot of each slot
+        self.heap=[] # (-area,slot) of the plots
+        self.count=0 # Number of plots
+        self.reference_area=float(areas.mean()) if len(areas)>0 else 0.0 # The sums are taken over the areas minus this value, so that the variance does not lose precision
+        self.area_sum=0.0 # Sum of the areas minus reference_area
+        self.square_sum=0.0 # Sum of the squares of the areas minus reference_area
+        self.add_feature_list(feature_list,areas)
+
+    def add_feature_list(self,feature_list:list,areas:ndarray=None)->None:
+        '''
+        ### Abstract
+            Append plots
+        ### Parameters
+            - feature_list：List of plots
+            - areas：Their areas, calculated if it is None
+
+        ### Return
+            none
+        '''
+        if areas is None:
+            areas=get_areas(feature_list)
+        for feature,area in zip(feature_list,areas.tolist()):
+            slot=len(self.feature_list)
+            self.feature_list.append(feature)
+            self.areas.append(area)
+            heapq.heappush(self.heap,(-area,slot))
+            self.count+=1
+            self.area_sum+=area-self.reference_area
+            self.square_sum+=(area-self.reference_area)**2
+
+    def get_mean_and_std_of_area(self)->tuple:
+        '''
+        ### Abstract
+            The mean and standard deviation of the areas of all plots
+        ### Parameters
+            none
+
+        ### Return
+            A tuple of mean and standard deviation
+        '''
+        return get_mean_and_std_from_sums(self.count,self.area_sum,self.square_sum,self.reference_area)
+
+    def pop_features_above(self,threshold:float)->list:
+        '''
+        ### Abstract
+            Remove the plots whose area is larger than the threshold, only these plots are visited
+        ### Parameters
+            - threshold：The area threshold
+
+        ### Return
+            List of the removed plots, in the order of their slots
+        '''
+        slot_list=[]
+        while self.heap and -self.heap[0][0]>threshold:
+            negative_area,slot=heapq.heappop(self.heap)
+            slot_list.append(slot)
+        slot_list.sort()
+
+        feature_list=[]
+        for slot in slot_list:
+            feature_list.append(self.feature_list[slot])
+            area=self.areas[slot]
+            self.feature_list[slot]=None
+            self.count-=1
+            self.area_sum-=area-self.reference_area
+            self.square_sum-=(area-self.reference_area)**2
+
+        return feature_list
+
+    def get_feature_list(self)->list:
+        '''
+        ### Abstract
+            All plots, in the order of their slots
+        ### Parameters
+            none
+
+        ### Return
+            List of plots
+        '''
+        return [feature for feature in self.feature_list if feature is not None]
+
+def points_to_polygon(points:ndarray)->Geometry:
+    '''
+    ### Abstract
+        Convert the sequence of points to polygon for GDAL processing
+    ### Parameters
+        - points：Sequence of points, shape n rows 2 columns, n is the number of points, the two columns are respectively the xy coordinates of points, the first point and the last point must be the same
+
+    ### Return
+        polygon with a sequence of points entered
+    '''
+    ring:Geometry=Geometry(ogr.wkbLinearRing)
+    for point in points:
+        ring.AddPoint(point[0],point[1])
+    polygon:Geometry=Geometry(ogr.wkbPolygon)
+    polygon.AddGeometry(ring)
+    
+    return polygon
+
+def get_convex_hull_points(geometry:Geometry)->ndarray:
+    '''
+    ### Abstract
+        Get the point sequence of the convex hull of a plot
+    ### Parameters
+        - geometry：The geometry of a plot
+
+    ### Return
+        Point sequence of the convex hull, the first point and the last point are the same
+    '''
+    convex_hull:Geometry=geometry.ConvexHull()
+
+    return np.array(convex_hull.GetGeometryRef(0).GetPoints())[:,:2]
+
+def get_bisector(MABR:ndarray)->tuple:
+    '''
+    ### Abstract
+        Get the line bisecting the long sides of the MABR, the common side of the two rectangles of get_bisected_MABR
+    ### Parameters
+        - MABR：The set of points that make up MABR
+
+    ### Return
+        A point of the line and the direction of the line
+    '''
+    if get_long_edge_index(MABR)==1:
+        start=(MABR[0]+MABR[1])/2
+        end=(MABR[2]+MABR[3])/2
+    else:
+        start=(MABR[0]+MABR[3])/2
+        end=(MABR[1]+MABR[2])/2
+
+    return (start,end-start)
+
+def clip_ring_by_line(points:ndarray,line_point:ndarray,line_direction:ndarray)->tuple:
+    '''
+    ### Abstract
+        Clip a ring by a line into the parts on the left and on the right of the line. The ring must cross the line exactly twice and no point may lie on the line,
+        so that each part is one simple ring, otherwise None is returned
+    ### Parameters
+        - points：Sequence of points of the ring, the first point and the last point are the same
+        - line_point：A point of the line
+        - line_direction：The direction of the line
+
+    ### Return
+        Sequences of points of the left part and of the right part, or None
+    '''
+    vertices=points[:-1]
+    # Signed distance of the vertices to the line (scaled by the length of the direction), positive on the left
+    sides=line_direction[0]*(vertices[:,1]-line_point[1])-line_direction[1]*(vertices[:,0]-line_point[0])
+    if len(vertices)<3 or np.any(np.abs(sides)<=np.abs(sides).max()*1e-12):
+        return None
+
+    left=sides>0
+    next_sides=np.roll(sides,-1)
+    crossing_indices=np.nonzero(left!=(next_sides>0))[0]
+    if len(crossing_indices)!=2:
+        return None
+
+    # The crossing point of each crossing edge, inserted after the first point of the edge
+    t=sides[crossing_indices]/(sides[crossing_indices]-next_sides[crossing_indices])
+    next_vertices=np.roll(vertices,-1,axis=0)
+    crossing_points=vertices[crossing_indices]+t[:,None]*(next_vertices[crossing_indices]-vertices[crossing_indices])
+    all_points=np.insert(vertices,crossing_indices+1,crossing_points,axis=0)
+    # The crossing points belong to both parts
+    left_points=all_points[np.insert(left,crossing_indices+1,True)]
+    right_points=all_points[np.insert(~left,crossing_indices+1,True)]
+
+    return (np.vstack([left_points,left_points[:1]]),np.vstack([right_points,right_points[:1]]))
+
+def split_geometry_by_half_planes(geometry:Geometry,MABR:ndarray)->tuple:
+    '''
+    ### Abstract
+        Divide a simple polygon without holes by the line bisecting the long sides of its MABR. As the MABR covers the polygon, this is the same as the intersections with the two halves of the MABR
+    ### Parameters
+        - geometry：The geometry of a plot to be divided
+        - MABR：The MABR of the convex hull of the plot
+
+    ### Return
+        A tuple of two new geometries in the order of get_bisected_MABR, or None if the polygon is not simple enough for clipping
+    '''
+    if geometry.GetGeometryName()!="POLYGON" or geometry.GetGeometryCount()!=1 or geometry.GetCoordinateDimension()!=2 or not geometry.IsValid():
+        return None
+
+    line_point,line_direction=get_bisector(MABR)
+    points=np.array(geometry.GetGeometryRef(0).GetPoints())
+    rings=clip_ring_by_line(points,line_point,line_direction)
+    if rings is None:
+        return None
+
+    left_ring,right_ring=rings
+    # The first rectangle of get_bisected_MABR contains the point 0 of the MABR
+    side=line_direction[0]*(MABR[0,1]-line_point[1])-line_direction[1]*(MABR[0,0]-line_point[0])
+    if side>0:
+        return (points_to_polygon(left_ring),points_to_polygon(right_ring))
+    return (points_to_polygon(right_ring),points_to_polygon(left_ring))
+
+def split_geometry_into_two(geometry:Geometry,MABR:ndarray)->tuple:
+    '''
+    ### Abstract
+        Divide the geometry of a plot. The MABR of the convex hull of the block is divided into two parts and intersected with the block to obtain the divided block.
+        Simple polygons are clipped by the bisecting line directly, the intersection of GEOS is only used for the others
+    ### Parameters
+        - geometry：The geometry of a plot to be divided
+        - MABR：The MABR of the convex hull of the plot, see get_MABR_list
+
+    ### Return
+        A tuple of two new geometries
+    '''
+    geometry_pair=split_geometry_by_half_planes(geometry,MABR)
+    if geometry_pair is not None:
+        return geometry_pair
+
+    bisected_MABR=get_bisected_MABR(MABR)
+
+    polygon1=points_to_polygon(bisected_MABR[0])
+    polygon2=points_to_polygon(bisected_MABR[1])
+
+    return (geometry.Intersection(polygon1),geometry.Intersection(polygon2))
+
+def split_geometry_list(geometry_list:list)->list:
+    '''
+    ### Abstract
+        Divide the geometries of many plots, the MABR of all of them are calculated in one batch
+    ### Parameters
+        - geometry_list：List of geometries of the plots to be divided
+
+    ### Return
+        List of tuples of two new geometries, in the order of geometry_list
+    '''
+    MABR_array=get_MABR_list([get_convex_hull_points(geometry) for geometry in geometry_list])
+
+    return [split_geometry_into_two(geometry,MABR) for geometry,MABR in zip(geometry_list,MABR_array)]
+
+def split_wkb_list(wkb_list:list)->list:
+    '''
+    ### Abstract
+        Divide the geometries of a chunk of plots in a worker process, the geometries are passed as WKB
+    ### Parameters
+        - wkb_list：List of WKB of the plots to be divided
+
+    ### Return
+        List of tuples of the WKB of two new geometries, in the order of wkb_list
+    '''
+    geometry_list=[ogr.CreateGeometryFromWkb(wkb) for wkb in wkb_list]
+
+    return [(geometry1.ExportToWkb(),geometry2.ExportToWkb()) for geometry1,geometry2 in split_geometry_list(geometry_list)]
+
+def split_feature_list(feature_list:list,pool:Pool=None,chunk_size:int=1000)->list:
+    '''
+    ### Abstract
+        Divide many plots, in the current process or in a process pool. In the process pool, the geometries are sent in chunks as WKB and the halves are received in the order of feature_list
+    ### Parameters
+        - feature_list：List of plots to be divided
+        - pool：The process pool, None means the current process
+        - chunk_size：Number of plots sent to a worker process at a time
+
+    ### Return
+        List of tuples of two new plots, in the order of feature_list
+    '''
+    feature:Feature
+    if pool is None:
+        geometry_pair_list=split_geometry_list([feature.GetGeometryRef() for feature in feature_list])
+    else:
+        wkb_chunks=[[feature.GetGeometryRef().ExportToWkb() for feature in feature_list[start:start+chunk_size]] for start in range(0,len(feature_list),chunk_size)]
+        geometry_pair_list=[]
+        for wkb_pair_list in pool.imap(split_wkb_list,wkb_chunks):
+            geometry_pair_list.extend((ogr.CreateGeometryFromWkb(wkb1),ogr.CreateGeometryFromWkb(wkb2)) for wkb1,wkb2 in wkb_pair_list)
+
+    feature_pair_list=[]
+    for feature,(geometry1,geometry2) in zip(feature_list,geometry_pair_list):
+        new_feature1:Feature=feature.Clone()
+        new_feature1.SetGeometry(geometry1)
+        new_feature2:Feature=feature.Clone()
+        new_feature2.SetGeometry(geometry2)
+        feature_pair_list.append((new_feature1,new_feature2))
+
+    return feature_pair_list
+
+@profiled()
+def split_once(parcel_store:ParcelStore,allowable_parameter:float,random_number:float=None,pool:Pool=None,chunk_size:int=1000)->None:
+    '''
+    ### Abstract
+        The mean and standard deviation of all plots were obtained, the plots that met the requirements of segmentation were divided, two new plots were obtained, and the old plots that had been divided were deleted.
+        The MABR of all plots to be divided are calculated in one batch
+    ### Parameters
+        - parcel_store：All plots, the divided plots are replaced by the new plots, with the multipolygons converted to polygons
+        - allowable_parameter：allowable parameter
+        - random_number：The random number of the threshold of this iteration, random.random() if it is None
+        - pool：The process pool dividing the plots, None means the current process
+        - chunk_size：Number of plots sent to a worker process at a time
+
+    ### Return
+        none
+    '''
+    mean,std=parcel_store.get_mean_and_std_of_area()
+    
+    new_feature_list=[]
+    if random_number is None:
+        random_number = random.random()
+    splited_feature_list=parcel_store.pop_features_above(mean+allowable_parameter*std*random_number)
+
+    for new_feature1,new_feature2 in split_feature_list(splited_feature_list,pool,chunk_size):
+        new_feature_list.append(new_feature1)
+        new_feature_list.append(new_feature2)
+
+    parcel_store.add_feature_list(apart_multipolygon(new_feature_list))
+
+
+def read_feature_chunks(source_list:list,chunk_size:int):
+    '''
+    ### Abstract
+        Read the plots of several shapefiles in chunks, only one chunk is kept in memory
+    ### Parameters
+        - source_list：List of (file_name, multipolygon_part). If multipolygon_part is False, the plots that are not multipolygons are read,
+          otherwise the multipolygons are read and converted to polygons. Reading a file twice in both ways gives the same order as apart_multipolygon
+        - chunk_size：Number of plots of a chunk
+
+    ### Return
+        Generator of lists of plots
+    '''
+    chunk=[]
+    for file_name,multipolygon_part in source_list:
+        file:DataSource=ogr.Open(file_name)
+        layer:Layer=file.GetLayer()
+        feature:Feature
+        for feature in layer:
+            is_multipolygon=feature.GetGeometryRef().GetGeometryName()=="MULTIPOLYGON"
+            if multipolygon_part and is_multipolygon:
+                chunk.extend(apart_multipolygon([feature]))
+            elif not multipolygon_part and not is_multipolygon:
+                chunk.append(feature)
+
+            if len(chunk)>=chunk_size:
+                yield chunk
+                chunk=[]
+        file=None
+
+    if chunk:
+        yield chunk
+
+def append_feature_list(layer:Layer,feature_list:list)->None:
+    '''
+    ### Abstract
+        Append plots to a layer with the same schema
+    ### Parameters
+        - layer：The layer
+        - feature_list：List of plots
+
+    ### Return
+        none
+    '''
+    layer_defn=layer.GetLayerDefn()
+    feature:Feature
+    for feature in feature_list:
+        new_feature=Feature(layer_defn)
+        new_feature.SetFrom(feature)
+        layer.CreateFeature(new_feature)
+
+def get_area_sums(areas:ndarray,reference_area:float)->ndarray:
+    '''
+    ### Abstract
+        The running sums of areas, see get_mean_and_std_from_sums
+    ### Parameters
+        - areas：Array of areas
+        - reference_area：The value subtracted from the areas
+
+    ### Return
+        Array of the number of areas, the sum and the sum of the squares of the areas minus reference_area
+    '''
+    shifted_areas=areas-reference_area
+
+    return np.array([len(areas),shifted_areas.sum(),(shifted_areas**2).sum()])
+
+@profiled()
+def split_stream_once(source_list:list,output_layer_list:list,threshold:float,reference_area:float,pool:Pool=None,chunk_size:int=1000)->ndarray:
+    '''
+    ### Abstract
+        Read the plots in chunks, divide the plots larger than the threshold and write the result at once. The plots that are not divided, the new plots and the polygons of the new multipolygons
+        are written to three layers, which read in order give the same order as split_once
+    ### Parameters
+        - source_list：The shapefiles of the plots, see read_feature_chunks
+        - output_layer_list：The three output layers
+        - threshold：The area threshold of this iteration
+        - reference_area：The value subtracted from the areas of the running sums
+        - pool：The process pool dividing the plots, None means the current process
+        - chunk_size：Number of plots read at a time
+
+    ### Return
+        The running sums of the areas of the written plots, see get_area_sums
+    '''
+    area_sums=np.zeros(shape=(3,))
+    for chunk in read_feature_chunks(source_list,chunk_size):
+        areas=get_areas(chunk)
+        kept_feature_list=[feature for feature,area in zip(chunk,areas) if not area>threshold]
+        splited_feature_list=[feature for feature,area in zip(chunk,areas) if area>threshold]
+
+        polygon_feature_list=[]
+        multipolygon_feature_list=[]
+        for feature_pair in split_feature_list(splited_feature_list,pool,chunk_size):
+            for new_feature in feature_pair:
+                if new_feature.GetGeometryRef().GetGeometryName()=="MULTIPOLYGON":
+                    multipolygon_feature_list.extend(apart_multipolygon([new_feature]))
+                else:
+                    polygon_feature_list.append(new_feature)
+
+        for output_layer,feature_list in zip(output_layer_list,[kept_feature_list,polygon_feature_list,multipolygon_feature_list]):
+            append_feature_list(output_layer,feature_list)
+            area_sums+=get_area_sums(get_areas(feature_list),reference_area)
+
+    return area_sums
+
+@profiled()
+def DLPS_streaming(input_file_name:str,output_file_name:str,max_iteration:int,allowable_parameter:float,process_count:int=1,seed:int=None,chunk_size:int=1000,temporary_directory:str=None)->None:
+    '''
+    ### Abstract
+        DLPS with memory bounded by chunk_size instead of the number of parcels. Two first passes over the input get the mean and then the standard deviation of the areas,
+        then each iteration reads the parcels of the last iteration in chunks, divides them and writes them at once to temporary files, keeping the running sums of the areas for the threshold of the next iteration.
+        The last iteration writes to the output file. The result is the same as DLPS with the same seed
+    ### Parameters
+        - input_file_name: the file path of the land use types file (.shp) after land use reclassification
+        - output_file_name: the output path of the result file
+        - max_iteration: the number of segmentation iterations
+        - allowable_parameter: the allowable parameter for the segmentation process
+        - process_count: the number of processes dividing the parcels, None means the number of CPUs
+        - seed: the seed of the random threshold of each iteration
+        - chunk_size: the number of parcels read at a time
+        - temporary_directory: the directory of the temporary files. If it is None, the directory of the output file, or the system temporary directory if the output file is in a GDAL virtual file system such as /vsimem/
+
+    ### Return
+        none
+    '''
+    layer_schema=get_layer_schema(input_file_name)
+    source_list=[(input_file_name,False),(input_file_name,True)]
+    random_generator=random.Random(seed)
+
+    # A first pass gets the mean area of all parcels, the running sums are taken around it as in ParcelStore
+    area_count=0
+    area_total=0.0
+    for chunk in read_feature_chunks(source_list,chunk_size):
+        areas=get_areas(chunk)
+        area_count+=len(areas)
+        area_total+=float(areas.sum())
+    reference_area=area_total/area_count if area_count>0 else 0.0
+
+    area_sums=np.zeros(shape=(3,))
+    for chunk in read_feature_chunks(source_list,chunk_size):
+        area_sums+=get_area_sums(get_areas(chunk),reference_area)
+
+    if temporary_directory is None:
+        # Output files in a GDAL virtual file system (/vsimem/, /vsizip/, ...) have no local directory
+        if output_file_name.startswith('/vsi'):
+            temporary_directory=tempfile.gettempdir()
+        else:
+            temporary_directory=os.path.dirname(os.path.abspath(output_file_name))
+    temporary_directory=tempfile.mkdtemp(prefix='dlps_',dir=temporary_directory)
+    pool=None if process_count==1 else Pool(processes=process_count)
+    try:
+        for i in range(max_iteration):
+            mean,std=get_mean_and_std_from_sums(int(area_sums[0]),area_sums[1],area_sums[2],reference_area)
+            threshold=mean+allowable_parameter*std*random_generator.random()
+
+            output_file_name_list=[os.path.join(temporary_directory,'%d_%d.shp'%(i,part)) for part in range(3)]
+            if i==max_iteration-1:
+                output_file_name_list[0]=output_file_name
+            output_list=[create_layer(file_name,layer_schema) for file_name in output_file_name_list]
+            area_sums=split_stream_once(source_list,[layer for file,layer in output_list],threshold,reference_area,pool,chunk_size)
+            output_list=None
+
+            for file_name,multipolygon_part in source_list:
+                if os.path.dirname(file_name)==temporary_directory:
+                    delete_shapefile(file_name)
+            source_list=[(file_name,False) for file_name in output_file_name_list]
+
+        if max_iteration==0:
+            output_file,output_layer=create_layer(output_file_name,layer_schema)
+        else:
+            # The plots that are not divided in the last iteration are already in the output file, the new plots are appended
+            output_file=ogr.Open(output_file_name,1)
+            output_layer=output_file.GetLayer()
+            source_list=source_list[1:]
+        for chunk in read_feature_chunks(source_list,chunk_size):
+            append_feature_list(output_layer,chunk)
+        output_file=None
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        shutil.rmtree(temporary_directory,ignore_errors=True)
+
+    return
+
+@profiled()
+def DLPS(input_file_name:str,output_file_name:str,max_iteration:int,allowable_parameter:float,process_count:int=1,seed:int=None,chunk_size:int=1000,streaming:bool=False)->None:
+    '''
+    ### Abstract
+        parcel segmentation based on the Minimum Area Bounding Rectangle (MABR) of the parcel's convex hull
+    ### Parameters
+        - input_file_name: the file path of the land use types file (.shp) after land use reclassification
+        - output_file_name: the output path of the result file
+        - max_iteration: the number of segmentation iterations
+        - allowable_parameter: the allowable parameter for the segmentation process
+        - process_count: the number of processes dividing the parcels, None means the number of CPUs. The result does not depend on it
+        - seed: the seed of the random threshold of each iteration, None means a different result on each run
+        - chunk_size: the number of parcels sent to a worker process at a time
+        - streaming: read and write the parcels in chunks of chunk_size instead of keeping them all in memory, see DLPS_streaming
+
+    ### Return
+        none
+    '''
+    if streaming:
+        DLPS_streaming(input_file_name,output_file_name,max_iteration,allowable_parameter,process_count,seed,chunk_size)
+        return
+
+    layer_schema=get_layer_schema(input_file_name)
+    feature_list=get_feature_list(input_file_name)
+    parcel_store=ParcelStore(apart_multipolygon(feature_list))
+    random_generator=random.Random(seed)
+
+    pool=None if process_count==1 else Pool(processes=process_count)
+    try:
+        for i in range(max_iteration):
+            split_once(parcel_store,allowable_parameter,random_generator.random(),pool,chunk_size)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    write_to_file(output_file_name,parcel_store.get_feature_list(),layer_schema)
+    return
+
+
+if __name__=='__main__':
+    DLPS(
+        input_file_name=r"E:\UrbanVCA_Python\output\2015_re.shp",
+        output_file_name=r"E:\UrbanVCA_Python\output\2015_dlps.shp",
+        max_iteration=6,
+        allowable_parameter=2,
+        process_count=None,
+        seed=0)
+
+    DLPS(
+        input_file_name=r"E:\UrbanVCA_Python\output\2018_re.shp",
+        output_file_name=r"E:\UrbanVCA_Python\output\2018_dlps.shp",
+        max_iteration=6,
+        allowable_parameter=2,
+        process_count=None,
+        seed=0)
@@ -0,0 +1,167 @@
+import time
+import json
+import csv
+import atexit
+import sys
+import functools
+import os
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Profiling is off unless enable_profiling is called or the environment variable URBANVCA_PROFILE is set to the trace file name
+profiling_enabled = False
+trace_record_list = []
+stage_stack = []
+trace_start_time = time.perf_counter()
+
+
+def get_peak_rss() -> int:
+    '''
+    ### Abstract
+        Get the peak resident set size of the current process
+    ### Parameters
+        none
+
+    ### Return
+        Peak RSS in bytes, None if it is not available on this platform
+    '''
+    if psutil is not None:
+        memory_info = psutil.Process().memory_info()
+        # peak_wset is the peak working set on Windows
+        if hasattr(memory_info, 'peak_wset'):
+            return memory_info.peak_wset
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        return peak_rss if sys.platform == 'darwin' else peak_rss*1024
+    return None
+
+
+class ProfileStage():
+    def __init__(self, name: str):
+        self.name = name # Name of the stage or sub-step
+
+    def __enter__(self):
+        if not profiling_enabled:
+            return self
+        stage_stack.append(self.name)
+        self.start_wall_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+        self.start_peak_rss = get_peak_rss()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if not profiling_enabled or not stage_stack or stage_stack[-1] != self.name:
+            return False
+        end_wall_time = time.perf_counter()
+        end_cpu_time = time.process_time()
+        end_peak_rss = get_peak_rss()
+
+        trace_record_list.append({
+            'name': self.name,
+            'path': '/'.join(stage_stack),
+            'depth': len(stage_stack)-1,
+            'start': self.start_wall_time-trace_start_time,
+            'wall_time': end_wall_time-self.start_wall_time,
+            'cpu_time': end_cpu_time-self.start_cpu_time,
+            'peak_rss': end_peak_rss,
+            'peak_rss_increase': None if end_peak_rss is None else end_peak_rss-self.start_peak_rss,
+        })
+        stage_stack.pop()
+        return False
+
+
+def profiled(name: str = None):
+    '''
+    ### Abstract
+        Decorator that records every call of a function as a stage, see ProfileStage. It costs nothing but a flag test when profiling is off
+    ### Parameters
+        - name：Name of the stage, the function name if it is None
+
+    ### Return
+        The decorator
+    '''
+    def decorator(function):
+        stage_name = name if name is not None else function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiling_enabled:
+                return function(*args, **kwargs)
+            with ProfileStage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_trace_summary() -> list:
+    '''
+    ### Abstract
+        Sum up the records of the stages with the same path, sub-steps like iteration_once are called many times
+    ### Parameters
+        none
+
+    ### Return
+        List of dictionaries with path, count, wall_time, cpu_time and peak_rss, in the order of the first call
+    '''
+    summary = {}
+    for record in trace_record_list:
+        path = record['path']
+        if path not in summary:
+            summary[path] = {'path': path, 'count': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'peak_rss': record['peak_rss']}
+        summary[path]['count'] += 1
+        summary[path]['wall_time'] += record['wall_time']
+        summary[path]['cpu_time'] += record['cpu_time']
+        if record['peak_rss'] is not None:
+            summary[path]['peak_rss'] = max(summary[path]['peak_rss'], record['peak_rss'])
+
+    return list(summary.values())
+
+
+def save_trace(file_name: str) -> None:
+    '''
+    ### Abstract
+        Write the trace to a .json file (records and summary) or a .csv file (one row per record)
+    ### Parameters
+        - file_name：The trace file name, the format is chosen by its extension
+
+    ### Return
+        none
+    '''
+    if os.path.splitext(file_name)[1].lower() == '.csv':
+        field_name_list = ['name', 'path', 'depth', 'start', 'wall_time', 'cpu_time', 'peak_rss', 'peak_rss_increase']
+        with open(file_name, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=field_name_list)
+            writer.writeheader()
+            writer.writerows(trace_record_list)
+    else:
+        with open(file_name, 'w') as file:
+            json.dump({'records': trace_record_list, 'summary': get_trace_summary()}, file, indent=2)
+
+
+def enable_profiling(trace_file_name: str = None) -> None:
+    '''
+    ### Abstract
+        Start recording the stages
+    ### Parameters
+        - trace_file_name：The trace is written to this file when the program exits, None means that save_trace must be called
+
+    ### Return
+        none
+    '''
+    global profiling_enabled
+    profiling_enabled = True
+    if trace_file_name is not None:
+        atexit.register(save_trace, trace_file_name)
+
+
+if os.environ.get('URBANVCA_PROFILE'):
+    enable_profiling(os.environ['URBANVCA_PROFILE'])
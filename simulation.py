@@ -1,430 +1,1081 @@
-from osgeo import ogr
-from osgeo.ogr import DataSource
-from osgeo.ogr import Layer
-from osgeo.ogr import Feature
-from osgeo.ogr import FieldDefn
-from osgeo.ogr import Geometry
-import numpy as np
-from numpy import ndarray
-import matplotlib.pyplot as plt
-import secrets
-from utils import copy_shapefile
-from utils import get_feature_list
-from utils import get_distance_matrix
-import random
-from assessment_FoM import assessment_FoM
-import os
-os.environ['PROJ_LIB'] = r'C:\Users\dell\AppData\Local\Programs\Python\Python38\Lib\site-packages\osgeo\data\proj'
-def get_landuse_type_list(feature_list:list,landuse_field_name:str)->list:
-    '''
-    ### Abstract
-        Get all values for the land use field, then remove the same values
-    ### Parameters
-        - feature_list: parcels list
-        - landuse_field_name: The field name of the land use
-
-    ### Return
-        List of land use types
-    '''
-    landuse_type_list=[]
-    feature:Feature
-    for feature in feature_list:
-        landuse_type_list.append(feature.GetField(landuse_field_name))
-
-    return list(set(landuse_type_list))
-
-def get_RA(parcel_count:int,alpha:float)->ndarray:
-    '''
-    ### Abstract
-        Calculate the random factors for each parcel
-    ### Parameters
-        - parcel_count：Number of parcels
-        - alpha：Random factor calculation parameters
-
-    ### Return
-        RA[i] represents the random factor of parcel i
-    '''
-    gama=np.random.random(size=(parcel_count,))
-    RA=np.power(-np.log(gama),alpha)+1
-    
-    return RA
-
-def get_Pc(feature_list:list,restricted_feature_list:list)->ndarray:
-    '''
-    ### Abstract
-        Calculate whether each parcel intersects the restricted area, where Pc is 0 and otherwise 1
-    ### Parameters
-        - feature_list：parcels list
-        - restricted_feature_list：Restricted area list
-
-    ### Return
-        Pc[i] indicates the Pc value of parcel i
-    '''
-    Pc=np.zeros(shape=(len(feature_list),))
-
-    feature:Feature
-    restricted_feature:Feature
-    for index,feature in enumerate(feature_list):
-        for restricted_feature in restricted_feature_list:
-            geometry:Geometry=feature.GetGeometryRef()
-            if geometry.Intersects(restricted_feature.GetGeometryRef()):
-                Pc[index]=0
-            else:
-                Pc[index]=1
-
-    return Pc
-
-def get_areas_and_areamax_and_areamin(feature_list:list)->tuple:
-    '''
-    ### Abstract
-        Obtain the area of all parcels, as well as their maximum and minimum values
-    ### Parameters
-        - feature_list：parcels list
-
-    ### Return
-        parcel area, maximum area, minimum area
-    '''
-    areas=np.zeros(shape=(len(feature_list),))
-
-    feature:Feature
-    for index,feature in enumerate(feature_list):
-        geometry:Geometry=feature.GetGeometryRef()
-        areas[index]=geometry.GetArea()
-    
-    return (areas,areas.max(),areas.min())
-
-def get_omega(current_landuse_list:list,landuse_type_list:list,buffer_range:float,distance_matrix:ndarray,areas:ndarray,areamax:float,areamin:float)->ndarray:
-    '''
-    ### Abstract
-        Calculate the neighborhood effect of each parcel on each land type.
-    ### Parameters
-        - current_landuse_list：List of current land use types for each parcel
-        - landuse_type_list：List of land use types
-        - buffer_range：Neighborhood distance
-        - distance_matrix：The distance between two parcels
-        - areas：areas of all parcels
-        - areamax：Maximum area of all plots
-        - areamin：Minimum area of all plots
-
-    ### Return
-        omega[i,j] indicates that plot i is subject to the neighborhood effect of plots of land use type j
-    '''
-    landuse_count=len(current_landuse_list)
-    omega=np.zeros(shape=(landuse_count,len(landuse_type_list)))
-    
-    for index_i in range(landuse_count):
-        for index_j in range(landuse_count):
-            distance_ij=distance_matrix[index_i,index_j]
-            if distance_ij<=buffer_range:
-                landuse_type=current_landuse_list[index_j]
-                landuse_type_index=landuse_type_list.index(landuse_type)
-
-                omega[index_i,landuse_type_index]+=np.power(np.e,-distance_ij/buffer_range)*((areas[index_j]/areas[index_i])/(areamax/areamin))
-  
-    return omega
-
-def get_Pg(feature_list:list,pg_field_name_list:list)->ndarray:
-    '''
-    ### Abstract
-        Read pg from the parcels
-    ### Parameters
-        - feature_list：parcels list
-        - pg_field_name_list：pg field name for each land use type
-
-    ### Return
-        The pg array of each parcel has the shape of m rows and n columns, m is the number of plots, n is the number of land use types
-    '''
-    Pg=np.zeros(shape=(len(feature_list),len(pg_field_name_list)))
-
-    feature:Feature
-    for feature_index,feature in enumerate(feature_list):
-        for pg_field_name_index,pg_field_name in enumerate(pg_field_name_list):
-            Pg[feature_index,pg_field_name_index]=feature.GetField(pg_field_name)
-    
-    return Pg
-
-def get_pg_field_name_list(landuse_type_list:list)->list:
-    '''
-    ### Abstract
-       Adding 'pg_' to the name of the land use type is the corresponding pg field name
-    ### Parameters
-        - landuse_type_list：List of land use types
-
-    ### Return
-        pg field name for each land use type
-    '''
-    pg_field_name_list=[]
-    for landuse_type in landuse_type_list:
-        pg_field_name_list.append('pg_'+landuse_type)
-
-    return pg_field_name_list
-
-def filter_error_value(feature_list:list,pg_field_name_list:list,error_value:float)->tuple:
-    '''
-    ### Abstract
-        Remove parcels containing error values in the pg field
-    ### Parameters
-        - feature_list：parcels list
-        - pg_field_name_list：A list of each pg field name
-        - error_value：Error value
-
-    ### Return
-        FID of the filtered plots and list of plots
-    '''
-    error_feature_FID_list=[]
-    nonerror_feature_FID_list=[]
-
-    feature:Feature
-    for FID,feature in enumerate(feature_list):
-        is_error=False
-        for pg_field_name in pg_field_name_list:
-            value=feature.GetField(pg_field_name)
-            if value==error_value:
-                is_error=True
-                error_feature_FID_list.append(FID)
-                break
-        if is_error==False:
-            nonerror_feature_FID_list.append(FID)
-
-    error_feature_FID_list.reverse()
-    for error_feature_FID in error_feature_FID_list:
-        feature_list.pop(error_feature_FID)
-    
-    return (nonerror_feature_FID_list,feature_list)
-        
-
-def get_area_change_matrix(areas:ndarray,before_landuse_list:list,after_landuse_list:list,landuse_type_list:list)->ndarray:
-    '''
-    ### Abstract
-        The land area conversion matrix of each land use type is calculated, and the land with unchanged type is ignored
-    ### Parameters
-        - areas：Area of parcels
-        - before_landuse_list：Previous land use list of the parcel
-        - after_landuse_list：Later land use list of parcel
-        - landuse_type_list：List of land use types
-
-    ### Return
-        area_change_matrix, area_change_matrix[i,j] represents the area of land use type i transformed into land use type j
-    '''
-    landuse_type_count=len(landuse_type_list)
-    area_change_matrix=np.zeros(shape=(landuse_type_count,landuse_type_count))
-
-    for index,before_landuse in enumerate(before_landuse_list):
-        after_landuse=after_landuse_list[index]
-
-        before_landuse_index=landuse_type_list.index(before_landuse)
-        after_landuse_index=landuse_type_list.index(after_landuse)
-
-        if before_landuse_index==after_landuse_index:
-            continue
-        area_change_matrix[before_landuse_index,after_landuse_index]+=areas[index]
-
-    return area_change_matrix
-
-def get_before_and_after_landuse_list(feature_list:list,before_landuse_field_name:str,after_landuse_field_name:str)->tuple:
-    '''
-    ### Abstract
-        To get the land use type in the early and late period
-    ### Parameters
-        - feature_list：parcels list
-        - before_landuse_field_name：The name of a field that represents previous land use
-        - after_landuse_field_name：The name of a field that represents late land use
-
-    ### Return
-        List of land use in the early stage and list of land use in the later stage
-    '''
-    before_landuse_list=[]
-    after_landuse_list=[]
-    
-    feature:Feature
-    for feature in feature_list:
-        before_landuse_list.append(feature.GetField(before_landuse_field_name))
-        after_landuse_list.append(feature.GetField(after_landuse_field_name))
-
-    return before_landuse_list,after_landuse_list
-
-def iteration_once(Pg:ndarray,omega:ndarray,Pc:ndarray,RA:ndarray,landuse_type_list:list,current_landuse_list:list,areas:ndarray,area_change_matrix:ndarray,change:ndarray)->tuple:
-    '''
-    ### Abstract
-        The cellular automata iterates once
-    ### Parameters
-        - Pg：overall development probability
-        - omega：Neighborhood effect
-        - Pc：Limiting factor
-        - RA：Random factor
-        - landuse_type_list：List of land use types
-        - current_landuse_list：Current land use types of each area
-        - areas：Area of parcels
-        - area_change_matrix：Land area transformation matrix of each land use type
-
-    ### Return
-        The land use type of each area after iteration and the area transformation matrix after iteration
-    '''
-    P=np.zeros(shape=Pg.shape)
-    area_change_matrix_copy = area_change_matrix.copy()
-    feature_count=Pg.shape[0]
-    for i in range(feature_count):
-        P[i]=Pg[i]*omega[i]*Pc[i]*RA[i]
-
-    #feature_indices=np.random.randint(0,feature_count,size=(10,))
-
-    index=np.arange(len(landuse_type_list))
-    for feature_index in range(feature_count):
-        feature_indices = secrets.randbelow(feature_count)
-        Pi=P[feature_indices]
-
-        if Pi.sum()==0:
-            continue
-        current_landuse=current_landuse_list[feature_indices]
-        count=0
-        current_landuse_index = landuse_type_list.index(current_landuse)
-        while(1):
-            change_landuse=landuse_type_list[np.random.choice(index,p=Pi/Pi.sum())]
-            count+=1
-            if(change[current_landuse_index][current_landuse_index]==1):
-                break
-            if(count>5):
-                change_landuse=current_landuse
-                break
-        # change_landuse=landuse_type_list[Pi.argmax()]
-
-        change_landuse_index=landuse_type_list.index(change_landuse)
-
-        area=areas[feature_indices]
-        if area_change_matrix_copy[current_landuse_index,change_landuse_index]-area<0:
-            continue
-        area_change_matrix_copy[current_landuse_index,change_landuse_index]-=area
-        current_landuse_list[feature_indices]=change_landuse
-
-    # Pi:ndarray
-    # for i,Pi in enumerate(P):
-    #     current_landuse=current_landuse_list[i]
-    #     change_landuse=landuse_type_list[Pi.argmax()]
-
-    #     current_landuse_index=landuse_type_list.index(current_landuse)
-    #     change_landuse_index=landuse_type_list.index(change_landuse)
-
-    #     area=areas[i]
-    #     if area_change_matrix[current_landuse_index,change_landuse_index]-area<0:
-    #         continue
-    #     area_change_matrix[current_landuse_index,change_landuse_index]-=area
-    #     current_landuse_list[i]=change_landuse
-
-    return current_landuse_list,area_change_matrix
-
-def get_current_landuse_list(feature_list:list,landuse_field_name:str)->list:
-    '''
-    ### Abstract
-        Get the current land use of various blocks
-    ### Parameters
-        - feature_list：parcels list
-        - landuse_field_name：The field name of the land use
-
-    ### Return
-        Current land use of each blocks
-    '''
-    current_landuse_list=[]
-
-    feature:Feature
-    for feature in feature_list:
-        current_landuse_list.append(feature.GetField(landuse_field_name))
-
-    return current_landuse_list
-
-def write_to_file(output_file_name:str,current_landuse_list:list,FID:list,error_value:float)->None:
-    '''
-    ### Abstract
-        Write simulation results to the shapefile file
-    ### Parameters
-        - output_file_name：Output file name
-        - current_landuse_list：List of land use simulation results
-        - FID：A list of Fids for each block
-        - error_value：Error value
-
-    ### Return
-        none
-    '''
-    file: DataSource = ogr.Open(output_file_name,1)
-    layer:Layer = file.GetLayer()
-
-    field_defn:FieldDefn=FieldDefn('simulated',ogr.OFTString)
-    layer.CreateField(field_defn)
-
-    feature:Feature
-    for feature in layer:
-        feature.SetField('simulated',str(error_value))
-        layer.SetFeature(feature)
-
-    for index,fid in enumerate(FID):
-        feature=layer.GetFeature(fid)
-        feature.SetField('simulated',str(current_landuse_list[index]))
-        layer.SetFeature(feature)
-
-
-def simulation(input_file_name:str,restricted_area_file_name:str,output_file_name:str,before_landuse_field_name:str,after_landuse_field_name:str,RA_alpha:float,buffer_range:float,iteration:int,error_value:float=-99999,change=[[] * 5] ):
-    '''
-    ### Abstract
-        Land use simulation
-    ### Parameters
-        - input_file_name：The address of the land use types shapefile after overall development probability calculation
-        - restricted_area_file_name：The address of the restricted area shapefile
-        - output_file_name：The output address of the result file
-        - before_landuse_field_name：The field name of the land use types from the earlier period
-        - after_landuse_field_name：The field name of the land use types from the later period.
-        - RA_alpha：Calculating the random factor
-        - buffer_range：The neighborhood range
-        - iteration：The number of iterations
-        - change：The conversion matrix.If the value in the n row and m column of the matrix is 1, it means type n can be converted to type m; if it is 0, then it cannot be converted
-
-    ### Return
-        none
-    '''
-    copy_shapefile(input_file_name,output_file_name)
-
-
-    restricted_feature_list=get_feature_list(restricted_area_file_name)
-    feature_list=get_feature_list(output_file_name)
-
-
-    landuse_type_list=get_landuse_type_list(feature_list,before_landuse_field_name)
-    pg_field_name_list=get_pg_field_name_list(landuse_type_list)
-
-
-    FID,feature_list=filter_error_value(feature_list,pg_field_name_list,error_value)
-
-    areas,areamax,areamin=get_areas_and_areamax_and_areamin(feature_list)
-    before_landuse_list,after_landuse_list=get_before_and_after_landuse_list(feature_list,before_landuse_field_name,after_landuse_field_name)
-    area_change_matrix=get_area_change_matrix(areas,before_landuse_list,after_landuse_list,landuse_type_list)
-    current_landuse_list=get_current_landuse_list(feature_list,before_landuse_field_name)
-    distance_matrix=get_distance_matrix(feature_list,feature_list)
-
-    Pg=get_Pg(feature_list,pg_field_name_list)
-    Pc=get_Pc(feature_list,restricted_feature_list)
-    area_change_matrix = area_change_matrix/iteration
-    for i in range(iteration):
-        RA=get_RA(len(feature_list),RA_alpha)
-        omega=get_omega(current_landuse_list,landuse_type_list,buffer_range,distance_matrix,areas,areamax,areamin)
-
-        current_landuse_list,area_change_matrix=iteration_once(Pg,omega,Pc,RA,landuse_type_list,current_landuse_list,areas,area_change_matrix,change)
-
-        print(i,assessment_FoM(before_landuse_list,after_landuse_list,current_landuse_list,areas))
-
-    write_to_file(output_file_name,current_landuse_list,FID,error_value)
-
-if __name__=='__main__':
-    simulation(
-        input_file_name=r"E:\UrbanVCA_Python\output\pg.shp",
-        restricted_area_file_name=r"E:\UrbanVCA_Python\data\restrictedArea.shp",
-        output_file_name=r"E:\UrbanVCA_Python\output\simulated.shp",
-        before_landuse_field_name='before',
-        after_landuse_field_name='after',
-        RA_alpha=5,
-        buffer_range=600,
-        iteration=5,
-        change=[[1,0,1,1,1],
-                [1,1,1,1,1],
-                [1,0,1,1,1],
-                [1,0,1,1,1],
-                [1,0,1,1,1],
-                ]
+from osgeo import ogr
+from osgeo.ogr import DataSource
+from osgeo.ogr import Layer
+from osgeo.ogr import Feature
+from osgeo.ogr import FieldDefn
+from osgeo.ogr import Geometry
+import numpy as np
+from numpy import ndarray
+from scipy.sparse import csr_matrix
+import matplotlib.pyplot as plt
+from utils import copy_shapefile
+from utils import get_neighbor_graph
+from utils import build_grid_index
+from utils import query_grid_index
+from parcel_table import ParcelTable
+from parcel_table import read_parcel_table
+import random
+import json
+from simulation_cache import DEFAULT_MAX_CACHE_SIZE
+from simulation_cache import get_cache_key
+from simulation_cache import load_cached_arrays
+from simulation_cache import save_cached_arrays
+from assessment_FoM import AccuracyTracker
+from profiling import profiled
+import os
+os.environ['PROJ_LIB'] = r'C:\Users\dell\AppData\Local\Programs\Python\Python38\Lib\site-packages\osgeo\data\proj'
+def get_landuse_type_list(parcel_table:ParcelTable,landuse_field_name:str)->list:
+    '''
+    ### Abstract
+        Get all values for the land use field, then remove the same values
+    ### Parameters
+        - parcel_table: parcels table
+        - landuse_field_name: The field name of the land use
+
+    ### Return
+        List of land use types in ascending order, the index of a land use type in this list is its code
+    '''
+    return sorted(set(parcel_table.fields[landuse_field_name].tolist()))
+
+def encode_landuse(landuse_list:list,landuse_type_list:list)->ndarray:
+    '''
+    ### Abstract
+        Encode the land use of each parcel as its code, which is the index in the list of land use types
+    ### Parameters
+        - landuse_list：Land use of each parcel
+        - landuse_type_list：List of land use types
+
+    ### Return
+        Land use code of each parcel, int8 or int16 depending on the number of land use types
+    '''
+    dtype=np.int8 if len(landuse_type_list)<=np.iinfo(np.int8).max else np.int16
+    landuse_type_index={landuse_type:index for index,landuse_type in enumerate(landuse_type_list)}
+
+    return np.array([landuse_type_index[landuse_type] for landuse_type in landuse_list],dtype=dtype)
+
+def decode_landuse(landuse_codes:ndarray,landuse_type_list:list)->list:
+    '''
+    ### Abstract
+        Decode the land use codes back into land use types
+    ### Parameters
+        - landuse_codes：Land use code of each parcel
+        - landuse_type_list：List of land use types
+
+    ### Return
+        Land use of each parcel
+    '''
+    return [landuse_type_list[code] for code in landuse_codes.tolist()]
+
+def get_RA(parcel_count:int,alpha:float,rng:np.random.Generator=None)->ndarray:
+    '''
+    ### Abstract
+        Calculate the random factors for each parcel
+    ### Parameters
+        - parcel_count：Number of parcels
+        - alpha：Random factor calculation parameters
+        - rng：Random number generator, a new unseeded one is used if it is None
+
+    ### Return
+        RA[i] represents the random factor of parcel i
+    '''
+    if rng is None:
+        rng=np.random.default_rng()
+    gama=rng.random(size=(parcel_count,))
+    RA=np.power(-np.log(gama),alpha)+1
+    
+    return RA
+
+@profiled()
+def get_Pc(parcel_table:ParcelTable,restricted_parcel_table:ParcelTable)->ndarray:
+    '''
+    ### Abstract
+        Calculate whether each parcel intersects the restricted area, where Pc is 0 and otherwise 1.
+        The restricted areas are indexed by a grid of their envelopes, except those much larger than the parcels, which are kept aside and tested against every parcel envelope,
+        and the exact intersection is only tested for the candidates whose envelopes intersect the parcel
+    ### Parameters
+        - parcel_table：parcels table
+        - restricted_parcel_table：Restricted area table
+
+    ### Return
+        Pc[i] indicates the Pc value of parcel i
+    '''
+    Pc=np.ones(shape=(len(parcel_table),))
+    if len(parcel_table)==0 or len(restricted_parcel_table)==0:
+        return Pc
+
+    envelopes=parcel_table.envelopes
+    restricted_envelopes=restricted_parcel_table.envelopes
+    restricted_geometry_list=[restricted_parcel_table.get_geometry(index) for index in range(len(restricted_parcel_table))]
+
+    # The typical envelope size is used as the cell size so that each parcel only covers a few cells
+    all_envelopes=np.vstack([envelopes,restricted_envelopes])
+    cell_size=np.median(np.maximum(all_envelopes[:,1]-all_envelopes[:,0],all_envelopes[:,3]-all_envelopes[:,2]))
+    if cell_size<=0:
+        cell_size=1.0
+    grid_index=build_grid_index(restricted_envelopes,cell_size)
+
+    for index in range(len(parcel_table)):
+        candidates=query_grid_index(grid_index,envelopes[index])
+        if len(candidates)==0:
+            continue
+        geometry:Geometry=parcel_table.get_geometry(index)
+        for restricted_index in candidates:
+            if geometry.Intersects(restricted_geometry_list[restricted_index]):
+                Pc[index]=0
+                break
+
+    return Pc
+
+def get_areas_and_areamax_and_areamin(parcel_table:ParcelTable)->tuple:
+    '''
+    ### Abstract
+        Obtain the area of all parcels, as well as their maximum and minimum values
+    ### Parameters
+        - parcel_table：parcels table
+
+    ### Return
+        parcel area, maximum area, minimum area
+    '''
+    areas=parcel_table.areas
+    
+    return (areas,areas.max(),areas.min())
+
+@profiled()
+def get_neighbor_weight_matrix(neighbor_graph:tuple,buffer_range:float,areas:ndarray,areamax:float,areamin:float)->csr_matrix:
+    '''
+    ### Abstract
+        Calculate the static part of the neighborhood effect, exp(-d/r)*(A_j/A_i)/(Amax/Amin), for every pair of neighboring parcels. It does not depend on land use, so it is calculated once per run
+    ### Parameters
+        - neighbor_graph：indptr, indices and distances of the parcels within the neighborhood distance of each parcel, see get_neighbor_graph
+        - buffer_range：Neighborhood distance
+        - areas：areas of all parcels
+        - areamax：Maximum area of all plots
+        - areamin：Minimum area of all plots
+
+    ### Return
+        Sparse matrix, weight_matrix[i,j] is the weight of parcel j in the neighborhood effect of parcel i
+    '''
+    indptr,indices,distances=neighbor_graph
+    parcel_count=len(areas)
+    rows=np.repeat(np.arange(parcel_count),np.diff(indptr))
+
+    weights=np.exp(-distances/buffer_range)*((areas[indices]/areas[rows])/(areamax/areamin))
+
+    return csr_matrix((weights,indices,indptr),shape=(parcel_count,parcel_count))
+
+def get_landuse_onehot(current_landuse_codes:ndarray,landuse_type_count:int)->ndarray:
+    '''
+    ### Abstract
+        One-hot encode the current land use of each parcel
+    ### Parameters
+        - current_landuse_codes：Current land use code of each parcel
+        - landuse_type_count：Number of land use types
+
+    ### Return
+        onehot[i,j] is 1 if the land use code of parcel i is j, otherwise 0
+    '''
+    onehot=np.zeros(shape=(len(current_landuse_codes),landuse_type_count))
+    onehot[np.arange(len(current_landuse_codes)),current_landuse_codes]=1
+
+    return onehot
+
+@profiled()
+def get_omega(current_landuse_codes:ndarray,landuse_type_count:int,weight_matrix:csr_matrix)->ndarray:
+    '''
+    ### Abstract
+        Calculate the neighborhood effect of each parcel on each land type.
+    ### Parameters
+        - current_landuse_codes：Current land use code of each parcel
+        - landuse_type_count：Number of land use types
+        - weight_matrix：Static neighborhood weights of the parcels, see get_neighbor_weight_matrix
+
+    ### Return
+        omega[i,j] indicates that plot i is subject to the neighborhood effect of plots of land use type j
+    '''
+    onehot=get_landuse_onehot(current_landuse_codes,landuse_type_count)
+
+    return np.asarray(weight_matrix.dot(onehot))
+
+@profiled()
+def update_omega(omega:ndarray,weight_matrix_transposed:csr_matrix,changed_indices:ndarray,previous_landuse_codes:ndarray,current_landuse_codes:ndarray)->ndarray:
+    '''
+    ### Abstract
+        Update the neighborhood effect in place, only for the neighbors of the parcels whose land use changed in the last iteration
+    ### Parameters
+        - omega：Neighborhood effect before the last iteration
+        - weight_matrix_transposed：Transpose of the static neighborhood weights in CSR form, row j holds the weights of parcel j in the neighborhood effect of each of its neighbors
+        - changed_indices：Indices of the parcels changed in the last iteration
+        - previous_landuse_codes：Land use codes of the changed parcels before the last iteration
+        - current_landuse_codes：Current land use code of each parcel
+
+    ### Return
+        omega[i,j] indicates that plot i is subject to the neighborhood effect of plots of land use type j
+    '''
+    if len(changed_indices)==0:
+        return omega
+
+    indptr=weight_matrix_transposed.indptr
+    starts=indptr[changed_indices]
+    counts=indptr[changed_indices+1]-starts
+
+    # Positions of the rows of all changed parcels in the CSR arrays
+    offsets=np.repeat(starts-(np.cumsum(counts)-counts),counts)
+    positions=np.arange(counts.sum())+offsets
+    neighbor_indices=weight_matrix_transposed.indices[positions]
+    weights=weight_matrix_transposed.data[positions]
+
+    np.add.at(omega,(neighbor_indices,np.repeat(previous_landuse_codes,counts)),-weights)
+    np.add.at(omega,(neighbor_indices,np.repeat(current_landuse_codes[changed_indices],counts)),weights)
+
+    # Rounding errors must not leave negative neighborhood effects
+    touched_indices=np.unique(neighbor_indices)
+    omega[touched_indices]=np.maximum(omega[touched_indices],0)
+
+    return omega
+
+@profiled()
+def get_Pg(parcel_table:ParcelTable,pg_field_name_list:list)->ndarray:
+    '''
+    ### Abstract
+        Read pg from the parcels
+    ### Parameters
+        - parcel_table：parcels table
+        - pg_field_name_list：pg field name for each land use type
+
+    ### Return
+        The pg array of each parcel has the shape of m rows and n columns, m is the number of plots, n is the number of land use types
+    '''
+    Pg=np.zeros(shape=(len(parcel_table),len(pg_field_name_list)))
+
+    for pg_field_name_index,pg_field_name in enumerate(pg_field_name_list):
+        Pg[:,pg_field_name_index]=parcel_table.fields[pg_field_name]
+    
+    return Pg
+
+def get_pg_field_name_list(landuse_type_list:list)->list:
+    '''
+    ### Abstract
+       Adding 'pg_' to the name of the land use type is the corresponding pg field name
+    ### Parameters
+        - landuse_type_list：List of land use types
+
+    ### Return
+        pg field name for each land use type
+    '''
+    pg_field_name_list=[]
+    for landuse_type in landuse_type_list:
+        pg_field_name_list.append('pg_'+landuse_type)
+
+    return pg_field_name_list
+
+def filter_error_value(parcel_table:ParcelTable,pg_field_name_list:list,error_value:float)->tuple:
+    '''
+    ### Abstract
+        Remove parcels containing error values in the pg field
+    ### Parameters
+        - parcel_table：parcels table
+        - pg_field_name_list：A list of each pg field name
+        - error_value：Error value
+
+    ### Return
+        FID of the filtered plots and table of plots
+    '''
+    is_error=np.zeros(shape=(len(parcel_table),),dtype=bool)
+    for pg_field_name in pg_field_name_list:
+        is_error|=parcel_table.fields[pg_field_name]==error_value
+
+    parcel_table=parcel_table.select(~is_error)
+    
+    return (parcel_table.fid.tolist(),parcel_table)
+        
+
+def get_area_change_matrix(areas:ndarray,before_landuse_codes:ndarray,after_landuse_codes:ndarray,landuse_type_count:int)->ndarray:
+    '''
+    ### Abstract
+        The land area conversion matrix of each land use type is calculated, and the land with unchanged type is ignored
+    ### Parameters
+        - areas：Area of parcels
+        - before_landuse_codes：Previous land use code of each parcel
+        - after_landuse_codes：Later land use code of each parcel
+        - landuse_type_count：Number of land use types
+
+    ### Return
+        area_change_matrix, area_change_matrix[i,j] represents the area of land use type i transformed into land use type j
+    '''
+    area_change_matrix=np.zeros(shape=(landuse_type_count,landuse_type_count))
+
+    is_changed=before_landuse_codes!=after_landuse_codes
+    np.add.at(area_change_matrix,(before_landuse_codes[is_changed],after_landuse_codes[is_changed]),areas[is_changed])
+
+    return area_change_matrix
+
+def get_before_and_after_landuse_list(parcel_table:ParcelTable,before_landuse_field_name:str,after_landuse_field_name:str)->tuple:
+    '''
+    ### Abstract
+        To get the land use type in the early and late period
+    ### Parameters
+        - parcel_table：parcels table
+        - before_landuse_field_name：The name of a field that represents previous land use
+        - after_landuse_field_name：The name of a field that represents late land use
+
+    ### Return
+        List of land use in the early stage and list of land use in the later stage
+    '''
+    before_landuse_list=parcel_table.fields[before_landuse_field_name].tolist()
+    after_landuse_list=parcel_table.fields[after_landuse_field_name].tolist()
+
+    return before_landuse_list,after_landuse_list
+
+def propose_changes(Pg:ndarray,omega:ndarray,Pc:ndarray,RA:ndarray,current_landuse_codes:ndarray,change:ndarray,rng:np.random.Generator,max_draw_count:int=6)->tuple:
+    '''
+    ### Abstract
+        Draw the visited parcels and their candidate land use types of one iteration in bulk, the candidates by inverse-CDF sampling over each row of P
+    ### Parameters
+        - Pg：overall development probability
+        - omega：Neighborhood effect
+        - Pc：Limiting factor
+        - RA：Random factor
+        - current_landuse_codes：Current land use code of each area
+        - change：The conversion matrix, None means that all conversions are allowed
+        - rng：Random number generator
+        - max_draw_count：Number of candidates drawn for each visit, the first one allowed by the conversion matrix is used
+
+    ### Return
+        The indices of the visited parcels whose candidate differs from their land use, in visit order, their land use codes and their candidate land use codes
+    '''
+    P=Pg*omega*Pc[:,np.newaxis]*RA[:,np.newaxis]
+    feature_count,landuse_type_count=P.shape
+
+    # Parcels are visited in random order with replacement, only those with a non-zero probability can change
+    visit_indices=rng.integers(0,feature_count,size=(feature_count,))
+    cumulative_P=np.cumsum(P[visit_indices],axis=1)
+    has_probability=cumulative_P[:,-1]>0
+    visit_indices=visit_indices[has_probability]
+    cumulative_P=cumulative_P[has_probability]
+    visit_count=len(visit_indices)
+
+    # Inverse-CDF sampling: the candidate is the number of cumulative probabilities not greater than the random number
+    random_numbers=rng.random(size=(visit_count,max_draw_count))*cumulative_P[:,-1:]
+    candidates=(cumulative_P[:,np.newaxis,:]<=random_numbers[:,:,np.newaxis]).sum(axis=2)
+    candidates=np.minimum(candidates,landuse_type_count-1)
+
+    before_indices=current_landuse_codes[visit_indices]
+    if change is None:
+        after_indices=candidates[:,0]
+    else:
+        allowed=np.asarray(change)[before_indices[:,np.newaxis],candidates]==1
+        after_indices=candidates[np.arange(visit_count),allowed.argmax(axis=1)]
+        after_indices=np.where(allowed.any(axis=1),after_indices,before_indices)
+
+    is_changed=after_indices!=before_indices
+
+    return visit_indices[is_changed],before_indices[is_changed],after_indices[is_changed]
+
+def consume_area_quota(visit_indices:ndarray,before_indices:ndarray,after_indices:ndarray,areas:ndarray,area_change_matrix:ndarray)->tuple:
+    '''
+    ### Abstract
+        Accept the proposed changes in visit order while the area quota of their conversion is not used up, a parcel is converted at most once
+    ### Parameters
+        - visit_indices：Indices of the parcels of the proposed changes, see propose_changes
+        - before_indices：Their land use codes
+        - after_indices：Their candidate land use codes
+        - areas：Area of parcels
+        - area_change_matrix：The area quota of each conversion
+
+    ### Return
+        The indices of the accepted parcels and their new land use codes
+    '''
+    visit_areas=areas[visit_indices].tolist()
+
+    remaining_area_change_matrix=area_change_matrix.tolist()
+    # The area quota of each conversion is consumed in visit order
+    changed_index_set=set()
+    changed_indices=[]
+    changed_codes=[]
+    for feature_index,before_index,after_index,area in zip(visit_indices.tolist(),before_indices.tolist(),after_indices.tolist(),visit_areas):
+        if feature_index in changed_index_set:
+            continue
+        if remaining_area_change_matrix[before_index][after_index]-area<0:
+            continue
+        remaining_area_change_matrix[before_index][after_index]-=area
+        changed_index_set.add(feature_index)
+        changed_indices.append(feature_index)
+        changed_codes.append(after_index)
+
+    return np.array(changed_indices,dtype=np.int64),np.array(changed_codes,dtype=np.int64)
+
+@profiled()
+def iteration_once(Pg:ndarray,omega:ndarray,Pc:ndarray,RA:ndarray,current_landuse_codes:ndarray,areas:ndarray,area_change_matrix:ndarray,change:ndarray,rng:np.random.Generator,max_draw_count:int=6)->tuple:
+    '''
+    ### Abstract
+        The cellular automata iterates once.
+        The visited parcels and their candidate land use types are drawn in bulk, see propose_changes.
+        The area quota is then consumed sequentially in visit order, and a parcel is converted at most once per iteration, see consume_area_quota
+    ### Parameters
+        - Pg：overall development probability
+        - omega：Neighborhood effect
+        - Pc：Limiting factor
+        - RA：Random factor
+        - current_landuse_codes：Current land use code of each area, updated in place
+        - areas：Area of parcels
+        - area_change_matrix：Land area transformation matrix of each land use type
+        - change：The conversion matrix, None means that all conversions are allowed
+        - rng：Random number generator
+        - max_draw_count：Number of candidates drawn for each visit, the first one allowed by the conversion matrix is used
+
+    ### Return
+        The land use code of each area after iteration, the area transformation matrix after iteration, the indices of the parcels changed in this iteration and their land use codes before the iteration
+    '''
+    visit_indices,before_indices,after_indices=propose_changes(Pg,omega,Pc,RA,current_landuse_codes,change,rng,max_draw_count)
+    changed_indices,changed_codes=consume_area_quota(visit_indices,before_indices,after_indices,areas,area_change_matrix)
+
+    previous_landuse_codes=current_landuse_codes[changed_indices]
+    current_landuse_codes[changed_indices]=changed_codes
+
+    return current_landuse_codes,area_change_matrix,changed_indices,previous_landuse_codes
+
+def get_current_landuse_list(parcel_table:ParcelTable,landuse_field_name:str)->list:
+    '''
+    ### Abstract
+        Get the current land use of various blocks
+    ### Parameters
+        - parcel_table：parcels table
+        - landuse_field_name：The field name of the land use
+
+    ### Return
+        Current land use of each blocks
+    '''
+    return parcel_table.fields[landuse_field_name].tolist()
+
+@profiled()
+def write_to_file(output_file_name:str,current_landuse_codes:ndarray,landuse_type_list:list,FID:list,error_value:float)->None:
+    '''
+    ### Abstract
+        Write simulation results to the shapefile file
+    ### Parameters
+        - output_file_name：Output file name
+        - current_landuse_codes：Land use code of each parcel in the simulation results
+        - landuse_type_list：List of land use types, used to decode the land use codes
+        - FID：A list of Fids for each block
+        - error_value：Error value
+
+    ### Return
+        none
+    '''
+    file: DataSource = ogr.Open(output_file_name,1)
+    layer:Layer = file.GetLayer()
+
+    field_defn:FieldDefn=FieldDefn('simulated',ogr.OFTString)
+    layer.CreateField(field_defn)
+
+    # Parcels that were filtered out keep the error value
+    current_landuse_list=decode_landuse(current_landuse_codes,landuse_type_list)
+    simulated_dict=dict(zip(FID,current_landuse_list))
+
+    feature:Feature
+    for feature in layer:
+        feature.SetField('simulated',str(simulated_dict.get(feature.GetFID(),error_value)))
+        layer.SetFeature(feature)
+
+@profiled()
+def save_attribute_result(output_file_name:str,current_landuse_codes:ndarray,landuse_type_list:list,FID:list,iteration_snapshots:dict=None)->None:
+    '''
+    ### Abstract
+        Write simulation results as attribute columns only, without geometry, to a .npz file. The columns can be joined to the parcels later with join_attribute_result
+    ### Parameters
+        - output_file_name：Output .npz file name
+        - current_landuse_codes：Land use code of each parcel in the simulation results
+        - landuse_type_list：List of land use types, used to decode the land use codes
+        - FID：A list of Fids for each block
+        - iteration_snapshots：Land use codes after each iteration, the key is the iteration number. Each one is saved as the column iteration_<number>, None means no column
+
+    ### Return
+        none
+    '''
+    arrays={
+        'FID':np.array(FID,dtype=np.int64),
+        'landuse_type_list':np.array(landuse_type_list,dtype=str),
+        'simulated':current_landuse_codes,
+    }
+    if iteration_snapshots is not None:
+        for completed_iteration,landuse_codes in iteration_snapshots.items():
+            arrays['iteration_%d'%completed_iteration]=landuse_codes
+
+    save_npz(output_file_name,arrays)
+
+def load_attribute_result(file_name:str)->tuple:
+    '''
+    ### Abstract
+        Load the simulation results saved by save_attribute_result
+    ### Parameters
+        - file_name：The .npz file name
+
+    ### Return
+        FID list, list of land use types and dictionary of land use code columns, the key is the column name ('simulated' or iteration_<number>)
+    '''
+    with np.load(file_name) as file:
+        columns={key:file[key] for key in file.files if key not in ('FID','landuse_type_list')}
+        FID=file['FID'].tolist()
+        landuse_type_list=file['landuse_type_list'].tolist()
+
+    return FID,landuse_type_list,columns
+
+def join_attribute_result(result_file_name:str,input_file_name:str,output_file_name:str,column_name:str='simulated',error_value:float=-99999)->None:
+    '''
+    ### Abstract
+        Join a column of the simulation results saved by save_attribute_result to the parcels, to get a shapefile for mapping
+    ### Parameters
+        - result_file_name：The .npz file of the simulation results
+        - input_file_name：The shapefile used as input of the simulation
+        - output_file_name：Output shapefile, the column is written to its 'simulated' field
+        - column_name：Name of the column to join, 'simulated' or iteration_<number>
+        - error_value：Value of the parcels that were not simulated
+
+    ### Return
+        none
+    '''
+    FID,landuse_type_list,columns=load_attribute_result(result_file_name)
+
+    copy_shapefile(input_file_name,output_file_name)
+    write_to_file(output_file_name,columns[column_name],landuse_type_list,FID,error_value)
+
+
+class SimulationData():
+    def __init__(self, FID: list, landuse_type_list: list, before_landuse_codes: ndarray, after_landuse_codes: ndarray, areas: ndarray, area_change_matrix: ndarray, Pg: ndarray, Pc: ndarray, weight_matrix: csr_matrix, weight_matrix_transposed: csr_matrix = None):
+        self.FID = FID # FID of the parcels without error values
+        self.landuse_type_list = landuse_type_list # List of land use types, the index of a land use type is its code
+        self.before_landuse_codes = before_landuse_codes # Land use code of each parcel in the earlier period
+        self.after_landuse_codes = after_landuse_codes # Land use code of each parcel in the later period
+        self.areas = areas # Area of each parcel
+        self.area_change_matrix = area_change_matrix # Area of land use type i transformed into land use type j over the whole simulation
+        self.Pg = Pg # Overall development probability
+        self.Pc = Pc # Limiting factor
+        self.weight_matrix = weight_matrix # Static neighborhood weights
+        if weight_matrix_transposed is None:
+            weight_matrix_transposed = weight_matrix.T.tocsr()
+        self.weight_matrix_transposed = weight_matrix_transposed # Transpose of the static neighborhood weights, for incremental omega updates
+
+
+def prepare_simulation(input_file_name:str,restricted_area_file_name:str,before_landuse_field_name:str,after_landuse_field_name:str,buffer_range:float,error_value:float=-99999)->SimulationData:
+    '''
+    ### Abstract
+        Load the parcels and calculate everything that does not change during the simulation
+    ### Parameters
+        - input_file_name：The address of the land use types shapefile after overall development probability calculation
+        - restricted_area_file_name：The address of the restricted area shapefile
+        - before_landuse_field_name：The field name of the land use types from the earlier period
+        - after_landuse_field_name：The field name of the land use types from the later period.
+        - buffer_range：The neighborhood range
+        - error_value：Error value
+
+    ### Return
+        The static data of the simulation
+    '''
+    data,_=prepare_simulation_and_neighbor_graph(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,buffer_range,error_value)
+
+    return data
+
+@profiled()
+def load_simulation_parcels(input_file_name:str,restricted_area_file_name:str,before_landuse_field_name:str,after_landuse_field_name:str,error_value:float=-99999)->tuple:
+    '''
+    ### Abstract
+        Load the parcels and calculate the static data of each parcel, everything of prepare_simulation except the neighborhood weights
+    ### Parameters
+        - input_file_name：The address of the land use types shapefile after overall development probability calculation
+        - restricted_area_file_name：The address of the restricted area shapefile
+        - before_landuse_field_name：The field name of the land use types from the earlier period
+        - after_landuse_field_name：The field name of the land use types from the later period.
+        - error_value：Error value
+
+    ### Return
+        FID, landuse_type_list, before_landuse_codes, after_landuse_codes, areas, area_change_matrix, Pg, Pc and centroids of the parcels
+    '''
+    restricted_parcel_table=read_parcel_table(restricted_area_file_name,[])
+    parcel_table=read_parcel_table(input_file_name)
+
+
+    landuse_type_list=get_landuse_type_list(parcel_table,before_landuse_field_name)
+    pg_field_name_list=get_pg_field_name_list(landuse_type_list)
+
+
+    FID,parcel_table=filter_error_value(parcel_table,pg_field_name_list,error_value)
+
+    areas,_,_=get_areas_and_areamax_and_areamin(parcel_table)
+    before_landuse_list,after_landuse_list=get_before_and_after_landuse_list(parcel_table,before_landuse_field_name,after_landuse_field_name)
+    before_landuse_codes=encode_landuse(before_landuse_list,landuse_type_list)
+    after_landuse_codes=encode_landuse(after_landuse_list,landuse_type_list)
+    area_change_matrix=get_area_change_matrix(areas,before_landuse_codes,after_landuse_codes,len(landuse_type_list))
+
+    Pg=get_Pg(parcel_table,pg_field_name_list)
+    Pc=get_Pc(parcel_table,restricted_parcel_table)
+
+    return FID,landuse_type_list,before_landuse_codes,after_landuse_codes,areas,area_change_matrix,Pg,Pc,parcel_table.centroids
+
+def prepare_simulation_and_neighbor_graph(input_file_name:str,restricted_area_file_name:str,before_landuse_field_name:str,after_landuse_field_name:str,buffer_range:float,error_value:float=-99999)->tuple:
+    '''
+    ### Abstract
+        Same as prepare_simulation, but the neighbor graph is also returned, so that it can be filtered for smaller neighborhood ranges
+    ### Parameters
+        - input_file_name：The address of the land use types shapefile after overall development probability calculation
+        - restricted_area_file_name：The address of the restricted area shapefile
+        - before_landuse_field_name：The field name of the land use types from the earlier period
+        - after_landuse_field_name：The field name of the land use types from the later period.
+        - buffer_range：The neighborhood range
+        - error_value：Error value
+
+    ### Return
+        The static data of the simulation and the neighbor graph, see get_neighbor_graph
+    '''
+    FID,landuse_type_list,before_landuse_codes,after_landuse_codes,areas,area_change_matrix,Pg,Pc,centroids=load_simulation_parcels(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,error_value)
+
+    neighbor_graph=get_neighbor_graph(centroids,buffer_range)
+    weight_matrix=get_neighbor_weight_matrix(neighbor_graph,buffer_range,areas,areas.max(),areas.min())
+
+    return SimulationData(FID,landuse_type_list,before_landuse_codes,after_landuse_codes,areas,area_change_matrix,Pg,Pc,weight_matrix),neighbor_graph
+
+class CheckpointConfig():
+    def __init__(self, file_name: str, interval: int, static_file_name: str):
+        self.file_name = file_name # The .npz file the checkpoint is written to
+        self.interval = interval # A checkpoint is written every interval iterations
+        self.static_file_name = static_file_name # The .npz file of the static data, the checkpoint only keeps this pointer to it
+
+
+def save_npz(file_name:str,arrays:dict)->None:
+    '''
+    ### Abstract
+        Write arrays to a .npz file. The file is written next to the target first and then renamed, so an interrupted write never leaves a broken file
+    ### Parameters
+        - file_name：The .npz file name
+        - arrays：The arrays to be written, the key is the array name
+
+    ### Return
+        none
+    '''
+    temp_file_name=file_name+'.tmp'
+    with open(temp_file_name,'wb') as file:
+        np.savez(file,**arrays)
+    os.replace(temp_file_name,file_name)
+
+def get_simulation_data_arrays(data:SimulationData)->dict:
+    '''
+    ### Abstract
+        Convert the static data of the simulation into named arrays for saving or sharing
+    ### Parameters
+        - data：The static data of the simulation
+
+    ### Return
+        Dictionary of arrays, the key is the array name
+    '''
+    return {
+        'FID':np.array(data.FID,dtype=np.int64),
+        'landuse_type_list':np.array(data.landuse_type_list,dtype=str),
+        'before_landuse_codes':data.before_landuse_codes,
+        'after_landuse_codes':data.after_landuse_codes,
+        'areas':data.areas,
+        'area_change_matrix':data.area_change_matrix,
+        'Pg':data.Pg,
+        'Pc':data.Pc,
+        'weight_data':data.weight_matrix.data,
+        'weight_indices':data.weight_matrix.indices,
+        'weight_indptr':data.weight_matrix.indptr,
+        'weight_transposed_data':data.weight_matrix_transposed.data,
+        'weight_transposed_indices':data.weight_matrix_transposed.indices,
+        'weight_transposed_indptr':data.weight_matrix_transposed.indptr,
+    }
+
+def get_simulation_data_from_arrays(arrays:dict)->SimulationData:
+    '''
+    ### Abstract
+        Rebuild the static data of the simulation from the arrays of get_simulation_data_arrays. The arrays are used without copying, so they can be memory-mapped or shared
+    ### Parameters
+        - arrays：Dictionary of arrays, the key is the array name
+
+    ### Return
+        The static data of the simulation
+    '''
+    parcel_count=len(arrays['areas'])
+    weight_matrix=csr_matrix((arrays['weight_data'],arrays['weight_indices'],arrays['weight_indptr']),shape=(parcel_count,parcel_count))
+    weight_matrix_transposed=csr_matrix((arrays['weight_transposed_data'],arrays['weight_transposed_indices'],arrays['weight_transposed_indptr']),shape=(parcel_count,parcel_count))
+
+    return SimulationData(arrays['FID'].tolist(),arrays['landuse_type_list'].tolist(),arrays['before_landuse_codes'],arrays['after_landuse_codes'],arrays['areas'],arrays['area_change_matrix'],arrays['Pg'],arrays['Pc'],weight_matrix,weight_matrix_transposed)
+
+def save_simulation_data(data:SimulationData,file_name:str)->None:
+    '''
+    ### Abstract
+        Save the static data of the simulation to a .npz file
+    ### Parameters
+        - data：The static data of the simulation
+        - file_name：The .npz file name
+
+    ### Return
+        none
+    '''
+    save_npz(file_name,get_simulation_data_arrays(data))
+
+def load_simulation_data(file_name:str)->SimulationData:
+    '''
+    ### Abstract
+        Load the static data of the simulation saved by save_simulation_data
+    ### Parameters
+        - file_name：The .npz file name
+
+    ### Return
+        The static data of the simulation
+    '''
+    with np.load(file_name) as file:
+        arrays={key:file[key] for key in file.files}
+
+    return get_simulation_data_from_arrays(arrays)
+
+@profiled()
+def prepare_simulation_with_cache(input_file_name:str,restricted_area_file_name:str,before_landuse_field_name:str,after_landuse_field_name:str,buffer_range:float,error_value:float,cache_directory:str,max_cache_size:int=DEFAULT_MAX_CACHE_SIZE)->SimulationData:
+    '''
+    ### Abstract
+        Same as prepare_simulation, but the static data is cached on disk. The cache key is the hash of the content of both layers and of the parameters, so the cache is invalidated automatically when any input changes
+    ### Parameters
+        - input_file_name：The address of the land use types shapefile after overall development probability calculation
+        - restricted_area_file_name：The address of the restricted area shapefile
+        - before_landuse_field_name：The field name of the land use types from the earlier period
+        - after_landuse_field_name：The field name of the land use types from the later period.
+        - buffer_range：The neighborhood range
+        - error_value：Error value
+        - cache_directory：Directory of the cache
+        - max_cache_size：Maximum size of the cache in bytes, the least recently used entries are evicted beyond it
+
+    ### Return
+        The static data of the simulation, memory-mapped from the cache
+    '''
+    cache_key=get_cache_key([input_file_name,restricted_area_file_name],{
+        'stage':'simulation',
+        'before_landuse_field_name':before_landuse_field_name,
+        'after_landuse_field_name':after_landuse_field_name,
+        'buffer_range':buffer_range,
+        'error_value':error_value,
+    })
+
+    arrays=load_cached_arrays(cache_directory,cache_key)
+    if arrays is None:
+        data=prepare_simulation(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,buffer_range,error_value)
+        save_cached_arrays(cache_directory,cache_key,get_simulation_data_arrays(data),max_cache_size)
+        arrays=load_cached_arrays(cache_directory,cache_key)
+
+    return get_simulation_data_from_arrays(arrays)
+
+def save_checkpoint(checkpoint_config:CheckpointConfig,completed_iteration:int,current_landuse_codes:ndarray,area_change_matrix:ndarray,rng:np.random.Generator)->None:
+    '''
+    ### Abstract
+        Save the state of the simulation between two iterations
+    ### Parameters
+        - checkpoint_config：Checkpoint configuration
+        - completed_iteration：Number of iterations completed
+        - current_landuse_codes：Current land use code of each parcel
+        - area_change_matrix：Area transformation matrix used by each iteration
+        - rng：Random number generator
+
+    ### Return
+        none
+    '''
+    save_npz(checkpoint_config.file_name,{
+        'static_file_name':np.array(checkpoint_config.static_file_name),
+        'completed_iteration':np.array(completed_iteration),
+        'current_landuse_codes':current_landuse_codes,
+        'area_change_matrix':area_change_matrix,
+        'rng_state':np.array(json.dumps(rng.bit_generator.state)),
+    })
+
+def load_checkpoint(file_name:str)->tuple:
+    '''
+    ### Abstract
+        Load a checkpoint saved by save_checkpoint
+    ### Parameters
+        - file_name：The .npz file of the checkpoint
+
+    ### Return
+        The .npz file name of the static data, the number of iterations completed, the land use code of each parcel, the area transformation matrix used by each iteration, and the random number generator in its saved state
+    '''
+    with np.load(file_name) as arrays:
+        static_file_name=str(arrays['static_file_name'])
+        completed_iteration=int(arrays['completed_iteration'])
+        current_landuse_codes=arrays['current_landuse_codes']
+        area_change_matrix=arrays['area_change_matrix']
+        rng_state=json.loads(str(arrays['rng_state']))
+
+    rng=np.random.default_rng()
+    rng.bit_generator.state=rng_state
+
+    return static_file_name,completed_iteration,current_landuse_codes,area_change_matrix,rng
+
+@profiled()
+def run_simulation(data:SimulationData,RA_alpha:float,iteration:int,change=None,rng:np.random.Generator=None,assessment_interval:int=1,checkpoint_config:CheckpointConfig=None,start_state:tuple=None,iteration_snapshots:dict=None)->ndarray:
+    '''
+    ### Abstract
+        Run the cellular automata from the land use of the earlier period
+    ### Parameters
+        - data：The static data of the simulation, see prepare_simulation
+        - RA_alpha：Calculating the random factor
+        - iteration：The number of iterations
+        - change：The conversion matrix, None means that all conversions are allowed
+        - rng：Random number generator, a new unseeded one is used if it is None
+        - assessment_interval：The accuracy is printed every assessment_interval iterations and after the last one, 0 means never
+        - checkpoint_config：Checkpoint configuration, no checkpoint is written if it is None
+        - start_state：(completed_iteration, current_landuse_codes, area_change_matrix) loaded from a checkpoint to resume from, None means starting from the earlier period
+        - iteration_snapshots：Dictionary filled with a copy of the land use codes after each iteration run by this call, the key is the iteration number. None means no snapshot
+
+    ### Return
+        Simulated land use code of each parcel
+    '''
+    if rng is None:
+        rng=np.random.default_rng()
+
+    if start_state is None:
+        completed_iteration=0
+        current_landuse_codes=data.before_landuse_codes.copy()
+        area_change_matrix = data.area_change_matrix/iteration
+    else:
+        completed_iteration,current_landuse_codes,area_change_matrix=start_state
+    omega=get_omega(current_landuse_codes,len(data.landuse_type_list),data.weight_matrix)
+    if assessment_interval>0:
+        accuracy_tracker=AccuracyTracker(data.before_landuse_codes,data.after_landuse_codes,current_landuse_codes,data.areas,len(data.landuse_type_list))
+    for i in range(completed_iteration,iteration):
+        RA=get_RA(len(current_landuse_codes),RA_alpha,rng)
+
+        current_landuse_codes,area_change_matrix,changed_indices,previous_landuse_codes=iteration_once(data.Pg,omega,data.Pc,RA,current_landuse_codes,data.areas,area_change_matrix,change,rng)
+        omega=update_omega(omega,data.weight_matrix_transposed,changed_indices,previous_landuse_codes,current_landuse_codes)
+
+        if assessment_interval>0:
+            accuracy_tracker.update(changed_indices,current_landuse_codes)
+            if (i+1)%assessment_interval==0 or i==iteration-1:
+                print(i,accuracy_tracker.get_accuracy())
+
+        if checkpoint_config is not None and ((i+1)%checkpoint_config.interval==0 or i==iteration-1):
+            save_checkpoint(checkpoint_config,i+1,current_landuse_codes,area_change_matrix,rng)
+
+        if iteration_snapshots is not None:
+            iteration_snapshots[i+1]=current_landuse_codes.copy()
+
+    return current_landuse_codes
+
+class PeriodConfig():
+    def __init__(self, name: str, demand, iteration: int):
+        self.name = name # Name of the period, e.g. '2021'
+        self.demand = demand # Land demand of the period, either a dictionary of target areas, the key is the land use type, or an area conversion matrix like area_change_matrix
+        self.iteration = iteration # The number of iterations of the period
+
+
+def get_area_change_matrix_from_demand(current_landuse_codes:ndarray,areas:ndarray,landuse_type_list:list,demand,tolerance:float=1e-6)->ndarray:
+    '''
+    ### Abstract
+        Get the area conversion matrix of a period from its land demand.
+        For target areas, the area lost by the shrinking land use types is allocated to the growing land use types in proportion to their growth
+    ### Parameters
+        - current_landuse_codes：Land use code of each parcel at the start of the period
+        - areas：Area of parcels
+        - landuse_type_list：List of land use types
+        - demand：Dictionary of target areas at the end of the period, the key is the land use type, the types not in it keep their area. Or an area conversion matrix, which is used as it is.
+          The target areas must keep the total area: ValueError is raised if no land use type grows or shrinks, or if the growth and the shrinkage differ
+        - tolerance：The allowed difference between the growth and the shrinkage, relative to the total area
+
+    ### Return
+        area_change_matrix, area_change_matrix[i,j] represents the area of land use type i transformed into land use type j
+    '''
+    landuse_type_count=len(landuse_type_list)
+    if not isinstance(demand,dict):
+        return np.array(demand,dtype=np.float64).reshape(landuse_type_count,landuse_type_count)
+
+    current_areas=np.bincount(current_landuse_codes,weights=areas,minlength=landuse_type_count)
+    target_areas=current_areas.copy()
+    for landuse_type,target_area in demand.items():
+        if landuse_type not in landuse_type_list:
+            raise ValueError('Unknown land use type in the demand: %s'%landuse_type)
+        target_areas[landuse_type_list.index(landuse_type)]=target_area
+
+    increases=np.maximum(target_areas-current_areas,0)
+    decreases=np.maximum(current_areas-target_areas,0)
+    if increases.sum()<=0 or decreases.sum()<=0:
+        raise ValueError('The demand must both grow and shrink some land use types, growth: %f, shrinkage: %f'%(increases.sum(),decreases.sum()))
+    if abs(increases.sum()-decreases.sum())>tolerance*current_areas.sum():
+        raise ValueError('The growth and the shrinkage of the demand do not balance, growth: %f, shrinkage: %f'%(increases.sum(),decreases.sum()))
+
+    transferred_area=(increases.sum()+decreases.sum())/2
+    return transferred_area*np.outer(decreases/decreases.sum(),increases/increases.sum())
+
+def get_period_file_name(output_file_name:str,period_index:int)->str:
+    '''
+    ### Abstract
+        Get the name of the file of the changes of a period
+    ### Parameters
+        - output_file_name：The .npz file of the forecast
+        - period_index：Index of the period
+
+    ### Return
+        The .npz file name of the period
+    '''
+    return os.path.splitext(output_file_name)[0]+'_period_%d.npz'%period_index
+
+@profiled()
+def run_forecast(data:SimulationData,period_config_list:list,RA_alpha:float,output_file_name:str,change=None,rng:np.random.Generator=None)->ndarray:
+    '''
+    ### Abstract
+        Forecast the land use of several successive periods from the land use of the later period, each period starts from the result of the previous one.
+        The start state is written once to output_file_name, then only the parcels changed in each period are written, see get_period_file_name
+    ### Parameters
+        - data：The static data of the simulation, see prepare_simulation
+        - period_config_list：List of PeriodConfig, in time order
+        - RA_alpha：Calculating the random factor
+        - output_file_name：The .npz file of the forecast
+        - change：The conversion matrix, None means that all conversions are allowed
+        - rng：Random number generator, a new unseeded one is used if it is None
+
+    ### Return
+        Land use code of each parcel at the end of the last period
+    '''
+    if rng is None:
+        rng=np.random.default_rng()
+
+    current_landuse_codes=data.after_landuse_codes.copy()
+    save_npz(output_file_name,{
+        'FID':np.array(data.FID,dtype=np.int64),
+        'landuse_type_list':np.array(data.landuse_type_list,dtype=str),
+        'period_names':np.array([period_config.name for period_config in period_config_list],dtype=str),
+        'start':current_landuse_codes,
+    })
+
+    period_config:PeriodConfig
+    for period_index,period_config in enumerate(period_config_list):
+        area_change_matrix=get_area_change_matrix_from_demand(current_landuse_codes,data.areas,data.landuse_type_list,period_config.demand)
+        start_state=(0,current_landuse_codes.copy(),area_change_matrix/period_config.iteration)
+        period_landuse_codes=run_simulation(data,RA_alpha,period_config.iteration,change,rng,0,None,start_state)
+
+        changed_indices=np.flatnonzero(period_landuse_codes!=current_landuse_codes)
+        save_npz(get_period_file_name(output_file_name,period_index),{
+            'indices':changed_indices,
+            'codes':period_landuse_codes[changed_indices],
+        })
+        print(period_config.name,'changed parcels:',len(changed_indices))
+
+        current_landuse_codes=period_landuse_codes
+
+    return current_landuse_codes
+
+def load_forecast_result(output_file_name:str,period_index:int)->tuple:
+    '''
+    ### Abstract
+        Rebuild the land use at the end of a period from the files written by run_forecast
+    ### Parameters
+        - output_file_name：The .npz file of the forecast
+        - period_index：Index of the period, -1 means the start state
+
+    ### Return
+        FID list, list of land use types and land use code of each parcel
+    '''
+    with np.load(output_file_name) as file:
+        FID=file['FID'].tolist()
+        landuse_type_list=file['landuse_type_list'].tolist()
+        current_landuse_codes=file['start'].copy()
+
+    for i in range(period_index+1):
+        with np.load(get_period_file_name(output_file_name,i)) as file:
+            current_landuse_codes[file['indices']]=file['codes']
+
+    return FID,landuse_type_list,current_landuse_codes
+
+@profiled()
+def forecast(input_file_name:str,restricted_area_file_name:str,output_file_name:str,before_landuse_field_name:str,after_landuse_field_name:str,RA_alpha:float,buffer_range:float,period_config_list:list,error_value:float=-99999,change=None,seed:int=None,cache_directory:str=None)->None:
+    '''
+    ### Abstract
+        Multi-period land use forecast. The parcels are loaded and the static data is calculated once, then the periods are simulated one after another
+    ### Parameters
+        - input_file_name：The address of the land use types shapefile after overall development probability calculation
+        - restricted_area_file_name：The address of the restricted area shapefile
+        - output_file_name：The .npz file of the forecast, see run_forecast
+        - before_landuse_field_name：The field name of the land use types from the earlier period
+        - after_landuse_field_name：The field name of the land use types from the later period, the forecast starts from it
+        - RA_alpha：Calculating the random factor
+        - buffer_range：The neighborhood range
+        - period_config_list：List of PeriodConfig, in time order
+        - error_value：Error value
+        - change：The conversion matrix, None means that all conversions are allowed
+        - seed：Seed of the random number generator, the forecast is reproducible if it is given
+        - cache_directory：Directory of the on-disk cache of the static data, None means no cache
+
+    ### Return
+        none
+    '''
+    if cache_directory is not None:
+        data=prepare_simulation_with_cache(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,buffer_range,error_value,cache_directory)
+    else:
+        data=prepare_simulation(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,buffer_range,error_value)
+
+    run_forecast(data,period_config_list,RA_alpha,output_file_name,change,np.random.default_rng(seed))
+
+@profiled()
+def simulation(input_file_name:str,restricted_area_file_name:str,output_file_name:str,before_landuse_field_name:str,after_landuse_field_name:str,RA_alpha:float,buffer_range:float,iteration:int,error_value:float=-99999,change=None,seed:int=None,assessment_interval:int=1,checkpoint_file_name:str=None,checkpoint_interval:int=10,resume:bool=False,cache_directory:str=None,output_format:str='shapefile',save_iterations:bool=False):
+    '''
+    ### Abstract
+        Land use simulation
+    ### Parameters
+        - input_file_name：The address of the land use types shapefile after overall development probability calculation
+        - restricted_area_file_name：The address of the restricted area shapefile
+        - output_file_name：The output address of the result file, a shapefile or a .npz file according to output_format
+        - before_landuse_field_name：The field name of the land use types from the earlier period
+        - after_landuse_field_name：The field name of the land use types from the later period.
+        - RA_alpha：Calculating the random factor
+        - buffer_range：The neighborhood range
+        - iteration：The number of iterations
+        - change：The conversion matrix.If the value in the n row and m column of the matrix is 1, it means type n can be converted to type m; if it is 0, then it cannot be converted. None means that all conversions are allowed
+        - seed：Seed of the random number generator, the run is reproducible if it is given
+        - assessment_interval：The accuracy is printed every assessment_interval iterations, 0 means never
+        - checkpoint_file_name：The .npz file of the checkpoint. The static data is saved once next to it (with the suffix _static.npz), None means no checkpoint
+        - checkpoint_interval：A checkpoint is written every checkpoint_interval iterations
+        - resume：Whether to resume from the checkpoint instead of starting a new run, the setup is then loaded from the static data file and not recalculated
+        - cache_directory：Directory of the on-disk cache of the static data, None means no cache
+        - output_format：'shapefile' copies the input shapefile and adds the field 'simulated', 'npz' only writes the FID and the simulated land use codes, see save_attribute_result
+        - save_iterations：Whether to also write the land use codes after each iteration, only used by the 'npz' format
+
+    ### Return
+        none
+    '''
+    checkpoint_config=None
+    start_state=None
+    if checkpoint_file_name is not None and resume:
+        static_file_name,completed_iteration,current_landuse_codes,area_change_matrix,rng=load_checkpoint(checkpoint_file_name)
+        data=load_simulation_data(static_file_name)
+        start_state=(completed_iteration,current_landuse_codes,area_change_matrix)
+    else:
+        if cache_directory is not None:
+            data=prepare_simulation_with_cache(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,buffer_range,error_value,cache_directory)
+        else:
+            data=prepare_simulation(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,buffer_range,error_value)
+        rng=np.random.default_rng(seed)
+        if checkpoint_file_name is not None:
+            static_file_name=os.path.splitext(checkpoint_file_name)[0]+'_static.npz'
+            save_simulation_data(data,static_file_name)
+    if checkpoint_file_name is not None:
+        checkpoint_config=CheckpointConfig(checkpoint_file_name,checkpoint_interval,static_file_name)
+
+    iteration_snapshots={} if output_format=='npz' and save_iterations else None
+    current_landuse_codes=run_simulation(data,RA_alpha,iteration,change,rng,assessment_interval,checkpoint_config,start_state,iteration_snapshots)
+
+    if output_format=='npz':
+        save_attribute_result(output_file_name,current_landuse_codes,data.landuse_type_list,data.FID,iteration_snapshots)
+    else:
+        copy_shapefile(input_file_name,output_file_name)
+        write_to_file(output_file_name,current_landuse_codes,data.landuse_type_list,data.FID,error_value)
+
+if __name__=='__main__':
+    simulation(
+        input_file_name=r"E:\UrbanVCA_Python\output\pg.shp",
+        restricted_area_file_name=r"E:\UrbanVCA_Python\data\restrictedArea.shp",
+        output_file_name=r"E:\UrbanVCA_Python\output\simulated.shp",
+        before_landuse_field_name='before',
+        after_landuse_field_name='after',
+        RA_alpha=5,
+        buffer_range=600,
+        iteration=5,
+        change=[[1,0,1,1,1],
+                [1,1,1,1,1],
+                [1,0,1,1,1],
+                [1,0,1,1,1],
+                [1,0,1,1,1],
+                ]
     )
\ No newline at end of file
@@ -0,0 +1,139 @@
+import numpy as np
+from utils import get_file_hash
+import hashlib
+import shutil
+import tempfile
+import json
+import time
+import os
+
+# Changing the way the cached arrays are calculated must change this version, so that old entries are not used
+CACHE_VERSION=1
+DEFAULT_MAX_CACHE_SIZE=4*1024**3
+# A .tmp directory older than this, in seconds, is left over from an interrupted write
+STALE_TEMPORARY_AGE=24*3600
+
+def get_cache_key(file_name_list:list,parameters:dict)->str:
+    '''
+    ### Abstract
+        Calculate the cache key from the content of the input files and the parameters, so that any change of the inputs gives a new key
+    ### Parameters
+        - file_name_list：The input files
+        - parameters：The parameters that the cached arrays depend on, must be serializable by json
+
+    ### Return
+        The cache key
+    '''
+    key={
+        'version':CACHE_VERSION,
+        'files':[get_file_hash(file_name) for file_name in file_name_list],
+        'parameters':parameters,
+    }
+
+    return hashlib.sha256(json.dumps(key,sort_keys=True).encode('utf-8')).hexdigest()
+
+def load_cached_arrays(cache_directory:str,cache_key:str)->dict:
+    '''
+    ### Abstract
+        Load the arrays of a cache entry as memory-mapped arrays, the entry is marked as recently used
+    ### Parameters
+        - cache_directory：Directory of the cache
+        - cache_key：The cache key, see get_cache_key
+
+    ### Return
+        Dictionary of arrays, the key is the array name. None if the entry does not exist
+    '''
+    entry_directory=os.path.join(cache_directory,cache_key)
+    meta_file_name=os.path.join(entry_directory,'meta.json')
+    if not os.path.exists(meta_file_name):
+        return None
+
+    with open(meta_file_name,'r',encoding='utf-8') as file:
+        meta=json.load(file)
+
+    arrays={}
+    for array_name in meta['array_names']:
+        arrays[array_name]=np.load(os.path.join(entry_directory,array_name+'.npy'),mmap_mode='r')
+    os.utime(entry_directory)
+
+    return arrays
+
+def get_directory_size(directory:str)->int:
+    '''
+    ### Abstract
+        Calculate the total size of the files in a directory
+    ### Parameters
+        - directory：The directory
+
+    ### Return
+        Size in bytes
+    '''
+    size=0
+    for root,_,file_name_list in os.walk(directory):
+        for file_name in file_name_list:
+            size+=os.path.getsize(os.path.join(root,file_name))
+
+    return size
+
+def evict_cache(cache_directory:str,max_cache_size:int,keep_cache_key:str=None)->None:
+    '''
+    ### Abstract
+        Delete the least recently used entries until the cache is not larger than max_cache_size, the entries being written are neither counted nor deleted unless they are stale
+    ### Parameters
+        - cache_directory：Directory of the cache
+        - max_cache_size：Maximum size of the cache in bytes
+        - keep_cache_key：Entry that is never deleted
+
+    ### Return
+        none
+    '''
+    entries=[]
+    for cache_key in os.listdir(cache_directory):
+        entry_directory=os.path.join(cache_directory,cache_key)
+        # The .tmp directories are entries still being written, possibly by another process
+        if cache_key.endswith('.tmp'):
+            if time.time()-os.path.getmtime(entry_directory)>STALE_TEMPORARY_AGE:
+                shutil.rmtree(entry_directory,ignore_errors=True)
+            continue
+        if os.path.isdir(entry_directory):
+            entries.append((os.path.getmtime(entry_directory),cache_key,get_directory_size(entry_directory)))
+
+    cache_size=sum(entry[2] for entry in entries)
+    for _,cache_key,size in sorted(entries):
+        if cache_size<=max_cache_size:
+            break
+        if cache_key==keep_cache_key:
+            continue
+        shutil.rmtree(os.path.join(cache_directory,cache_key),ignore_errors=True)
+        cache_size-=size
+
+def save_cached_arrays(cache_directory:str,cache_key:str,arrays:dict,max_cache_size:int=DEFAULT_MAX_CACHE_SIZE)->None:
+    '''
+    ### Abstract
+        Save arrays as a cache entry, one .npy file per array so that they can be memory-mapped. The entry is written to a temporary directory first, so an interrupted write never leaves a broken entry, and an existing entry is kept
+    ### Parameters
+        - cache_directory：Directory of the cache
+        - cache_key：The cache key, see get_cache_key
+        - arrays：Dictionary of arrays, the key is the array name
+        - max_cache_size：Maximum size of the cache in bytes, see evict_cache
+
+    ### Return
+        none
+    '''
+    entry_directory=os.path.join(cache_directory,cache_key)
+    # Each writer has its own temporary directory, so processes sharing the cache do not write to the same one
+    os.makedirs(cache_directory,exist_ok=True)
+    temporary_directory=tempfile.mkdtemp(prefix=cache_key+'.',suffix='.tmp',dir=cache_directory)
+
+    for array_name,array in arrays.items():
+        np.save(os.path.join(temporary_directory,array_name+'.npy'),np.asarray(array),allow_pickle=False)
+    with open(os.path.join(temporary_directory,'meta.json'),'w',encoding='utf-8') as file:
+        json.dump({'version':CACHE_VERSION,'array_names':list(arrays.keys())},file)
+
+    try:
+        os.replace(temporary_directory,entry_directory)
+    except OSError:
+        # Another writer saved the same entry first, its arrays are the same
+        shutil.rmtree(temporary_directory,ignore_errors=True)
+
+    evict_cache(cache_directory,max_cache_size,cache_key)
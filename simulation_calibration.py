@@ -0,0 +1,217 @@
+from multiprocessing import Pool
+import numpy as np
+from utils import share_arrays
+from utils import attach_arrays
+from utils import filter_neighbor_graph
+from simulation import SimulationData
+from simulation import prepare_simulation_and_neighbor_graph
+from simulation import get_neighbor_weight_matrix
+from simulation import get_simulation_data_arrays
+from simulation import run_simulation
+from assessment_FoM import assessment_FoM
+from profiling import profiled
+import os
+os.environ['PROJ_LIB'] = r'C:\Users\dell\AppData\Local\Programs\Python\Python38\Lib\site-packages\osgeo\data\proj'
+
+# State of a worker process, set by init_worker
+worker_shared_memory_list=[]
+worker_arrays:dict=None
+worker_parameters:tuple=None
+worker_data_cache:dict={}
+
+def share_calibration_data(data:SimulationData,neighbor_graph:tuple)->tuple:
+    '''
+    ### Abstract
+        Copy the static data of the simulation and the neighbor graph of the largest neighborhood range into shared memory. The neighborhood weights depend on the neighborhood range, so they are not shared
+    ### Parameters
+        - data：The static data of the simulation
+        - neighbor_graph：The neighbor graph of the largest neighborhood range, see get_neighbor_graph
+
+    ### Return
+        List of the shared memory blocks, which must be closed and unlinked by the caller, and the descriptions of the shared arrays
+    '''
+    arrays={key:array for key,array in get_simulation_data_arrays(data).items() if not key.startswith('weight')}
+    arrays['neighbor_indptr'],arrays['neighbor_indices'],arrays['neighbor_distances']=neighbor_graph
+
+    return share_arrays(arrays)
+
+def init_worker(descriptions:dict,RA_alpha:float,iteration:int,change)->None:
+    '''
+    ### Abstract
+        Attach the worker process to the shared static data
+    ### Parameters
+        - descriptions：The descriptions of the shared arrays
+        - RA_alpha：Calculating the random factor
+        - iteration：The number of iterations
+        - change：The conversion matrix
+
+    ### Return
+        none
+    '''
+    global worker_shared_memory_list,worker_arrays,worker_parameters
+    worker_shared_memory_list,worker_arrays=attach_arrays(descriptions)
+    worker_parameters=(RA_alpha,iteration,change)
+
+def get_worker_data(buffer_range:float)->SimulationData:
+    '''
+    ### Abstract
+        Get the static data of the simulation for a neighborhood range in a worker process. The neighbor graph of the largest range is filtered down instead of searched again,
+        and the result of the last range is kept, as the candidates are ordered by range
+    ### Parameters
+        - buffer_range：The neighborhood range
+
+    ### Return
+        The static data of the simulation
+    '''
+    if buffer_range not in worker_data_cache:
+        worker_data_cache.clear()
+
+        arrays=worker_arrays
+        neighbor_graph=filter_neighbor_graph((arrays['neighbor_indptr'],arrays['neighbor_indices'],arrays['neighbor_distances']),buffer_range)
+        areas=arrays['areas']
+        weight_matrix=get_neighbor_weight_matrix(neighbor_graph,buffer_range,areas,areas.max(),areas.min())
+
+        worker_data_cache[buffer_range]=SimulationData(None,arrays['landuse_type_list'].tolist(),arrays['before_landuse_codes'],arrays['after_landuse_codes'],areas,arrays['area_change_matrix'],arrays['Pg'],arrays['Pc'],weight_matrix)
+
+    return worker_data_cache[buffer_range]
+
+def evaluate_candidate(task:tuple)->tuple:
+    '''
+    ### Abstract
+        Run one replicate of the simulation with one neighborhood range in a worker process
+    ### Parameters
+        - task：(candidate_index, buffer_range, seed_sequence)
+
+    ### Return
+        candidate_index and (FoM,PA,UA) of the replicate
+    '''
+    candidate_index,buffer_range,seed_sequence=task
+    RA_alpha,iteration,change=worker_parameters
+    data=get_worker_data(buffer_range)
+
+    simulated_landuse_codes=run_simulation(data,RA_alpha,iteration,change,np.random.default_rng(seed_sequence),assessment_interval=0)
+
+    return candidate_index,assessment_FoM(data.before_landuse_codes,data.after_landuse_codes,simulated_landuse_codes,data.areas)
+
+def get_refined_values(value_list:list,best_value:float)->list:
+    '''
+    ### Abstract
+        Get the values around the best value for the next round of the search, the midpoints between the best value and its neighbors among the evaluated values
+    ### Parameters
+        - value_list：The evaluated values of a parameter
+        - best_value：The best value of the parameter
+
+    ### Return
+        The best value and the midpoints
+    '''
+    value_list=sorted(set(value_list))
+    index=value_list.index(best_value)
+    refined_values=[best_value]
+    if index>0:
+        refined_values.append((value_list[index-1]+best_value)/2)
+    if index<len(value_list)-1:
+        refined_values.append((best_value+value_list[index+1])/2)
+
+    return refined_values
+
+@profiled()
+def run_calibration(data:SimulationData,neighbor_graph:tuple,buffer_range_list:list,RA_alpha:float,iteration:int,replicate_count:int=1,refine_round_count:int=0,process_count:int=None,change=None,seed:int=None)->list:
+    '''
+    ### Abstract
+        Search the buffer_range that maximizes the FoM, the neighborhood ranges are evaluated in a process pool.
+        The values of buffer_range_list are evaluated first, then each refine round evaluates the midpoints around the best range.
+        All ranges use the same seeds, so that their differences do not come from the random numbers.
+        RA_alpha is not searched: the random factor is one value per parcel, which cancels when the probabilities of each parcel are normalized for sampling, so it cannot change the FoM
+    ### Parameters
+        - data：The static data of the simulation, see prepare_simulation_and_neighbor_graph
+        - neighbor_graph：The neighbor graph of the largest neighborhood range
+        - buffer_range_list：Values of buffer_range to evaluate, not larger than the range of neighbor_graph
+        - RA_alpha：Calculating the random factor
+        - iteration：The number of iterations
+        - replicate_count：Number of replicates of each range, the accuracy is their mean
+        - refine_round_count：Number of refine rounds after buffer_range_list
+        - process_count：Number of worker processes, the number of CPUs if it is None
+        - change：The conversion matrix, None means that all conversions are allowed
+        - seed：Seed of the search
+
+    ### Return
+        List of (buffer_range, FoM, PA, UA) of all evaluated ranges, sorted by FoM from high to low
+    '''
+    seed_sequences=np.random.SeedSequence(seed).spawn(replicate_count)
+    results={}
+
+    candidate_list=list(buffer_range_list)
+    shared_memory_list,descriptions=share_calibration_data(data,neighbor_graph)
+    try:
+        with Pool(processes=process_count,initializer=init_worker,initargs=(descriptions,RA_alpha,iteration,change)) as pool:
+            for round_index in range(refine_round_count+1):
+                candidate_list=sorted(set(candidate for candidate in candidate_list if candidate not in results))
+
+                accuracy=np.zeros(shape=(len(candidate_list),3))
+                tasks=[(candidate_index,buffer_range,seed_sequence) for candidate_index,buffer_range in enumerate(candidate_list) for seed_sequence in seed_sequences]
+                for candidate_index,replicate_accuracy in pool.imap(evaluate_candidate,tasks,chunksize=replicate_count):
+                    accuracy[candidate_index]+=replicate_accuracy
+                accuracy=accuracy/replicate_count
+
+                for candidate,candidate_accuracy in zip(candidate_list,accuracy):
+                    results[candidate]=tuple(candidate_accuracy.tolist())
+
+                best_buffer_range=max(results,key=lambda candidate:results[candidate][0])
+                print(round_index,'best buffer_range:',best_buffer_range,'FoM,PA,UA:',results[best_buffer_range])
+
+                candidate_list=get_refined_values(list(results),best_buffer_range)
+    finally:
+        for shared_memory in shared_memory_list:
+            shared_memory.close()
+            shared_memory.unlink()
+
+    return sorted([(candidate,)+accuracy for candidate,accuracy in results.items()],key=lambda result:-result[1])
+
+@profiled()
+def calibration(input_file_name:str,restricted_area_file_name:str,before_landuse_field_name:str,after_landuse_field_name:str,buffer_range_list:list,RA_alpha:float,iteration:int,replicate_count:int=1,refine_round_count:int=0,process_count:int=None,error_value:float=-99999,change=None,seed:int=None)->list:
+    '''
+    ### Abstract
+        Calibration of buffer_range. The parcels are loaded and the neighbor graph is built once at the largest buffer_range, then the neighborhood ranges are evaluated in parallel.
+        RA_alpha does not change the result of the simulation, so it is not calibrated, see run_calibration
+    ### Parameters
+        - input_file_name：The address of the land use types shapefile after overall development probability calculation
+        - restricted_area_file_name：The address of the restricted area shapefile
+        - before_landuse_field_name：The field name of the land use types from the earlier period
+        - after_landuse_field_name：The field name of the land use types from the later period.
+        - buffer_range_list：Values of buffer_range to evaluate
+        - RA_alpha：Calculating the random factor
+        - iteration：The number of iterations
+        - replicate_count：Number of replicates of each range
+        - refine_round_count：Number of refine rounds after buffer_range_list
+        - process_count：Number of worker processes, the number of CPUs if it is None
+        - error_value：Error value
+        - change：The conversion matrix, None means that all conversions are allowed
+        - seed：Seed of the search
+
+    ### Return
+        List of (buffer_range, FoM, PA, UA), see run_calibration
+    '''
+    data,neighbor_graph=prepare_simulation_and_neighbor_graph(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,max(buffer_range_list),error_value)
+
+    return run_calibration(data,neighbor_graph,buffer_range_list,RA_alpha,iteration,replicate_count,refine_round_count,process_count,change,seed)
+
+if __name__=='__main__':
+    results=calibration(
+        input_file_name=r"E:\UrbanVCA_Python\output\pg.shp",
+        restricted_area_file_name=r"E:\UrbanVCA_Python\data\restrictedArea.shp",
+        before_landuse_field_name='before',
+        after_landuse_field_name='after',
+        buffer_range_list=[200,400,600,800],
+        RA_alpha=5,
+        iteration=5,
+        replicate_count=4,
+        refine_round_count=2,
+        seed=0,
+        change=[[1,0,1,1,1],
+                [1,1,1,1,1],
+                [1,0,1,1,1],
+                [1,0,1,1,1],
+                [1,0,1,1,1],
+                ]
+    )
+    print('buffer_range,FoM,PA,UA:',results[0])
@@ -0,0 +1,180 @@
+from multiprocessing import Pool
+import numpy as np
+from utils import share_arrays
+from utils import attach_arrays
+from simulation import SimulationData
+from simulation import prepare_simulation
+from simulation import prepare_simulation_with_cache
+from simulation import run_simulation
+from simulation import save_npz
+from simulation import get_simulation_data_arrays
+from simulation import get_simulation_data_from_arrays
+from assessment_FoM import assessment_FoM
+from profiling import profiled
+import os
+os.environ['PROJ_LIB'] = r'C:\Users\dell\AppData\Local\Programs\Python\Python38\Lib\site-packages\osgeo\data\proj'
+
+# State of a worker process, set by init_worker
+worker_shared_memory_list=[]
+worker_data:SimulationData=None
+worker_parameters:tuple=None
+
+def share_simulation_data(data:SimulationData)->tuple:
+    '''
+    ### Abstract
+        Copy the static data of the simulation into shared memory
+    ### Parameters
+        - data：The static data of the simulation
+
+    ### Return
+        List of the shared memory blocks, which must be closed and unlinked by the caller, and the descriptions of the shared arrays used by attach_simulation_data
+    '''
+    return share_arrays(get_simulation_data_arrays(data))
+
+def attach_simulation_data(descriptions:dict)->tuple:
+    '''
+    ### Abstract
+        Rebuild the static data of the simulation on top of the arrays shared by share_simulation_data
+    ### Parameters
+        - descriptions：The descriptions of the shared arrays
+
+    ### Return
+        List of the attached shared memory blocks, which must be kept referenced, and the static data of the simulation
+    '''
+    shared_memory_list,arrays=attach_arrays(descriptions)
+
+    return shared_memory_list,get_simulation_data_from_arrays(arrays)
+
+def init_worker(descriptions:dict,RA_alpha:float,iteration:int,change)->None:
+    '''
+    ### Abstract
+        Attach the worker process to the shared static data
+    ### Parameters
+        - descriptions：The descriptions of the shared arrays
+        - RA_alpha：Calculating the random factor
+        - iteration：The number of iterations
+        - change：The conversion matrix
+
+    ### Return
+        none
+    '''
+    global worker_shared_memory_list,worker_data,worker_parameters
+    worker_shared_memory_list,worker_data=attach_simulation_data(descriptions)
+    worker_parameters=(RA_alpha,iteration,change)
+
+def run_replicate(seed_sequence:np.random.SeedSequence)->tuple:
+    '''
+    ### Abstract
+        Run one replicate of the simulation in a worker process
+    ### Parameters
+        - seed_sequence：Seed of the replicate
+
+    ### Return
+        Simulated land use code of each parcel, and (FoM,PA,UA) of the replicate
+    '''
+    RA_alpha,iteration,change=worker_parameters
+    simulated_landuse_codes=run_simulation(worker_data,RA_alpha,iteration,change,np.random.default_rng(seed_sequence),assessment_interval=0)
+
+    return simulated_landuse_codes,assessment_FoM(worker_data.before_landuse_codes,worker_data.after_landuse_codes,simulated_landuse_codes,worker_data.areas)
+
+@profiled()
+def run_ensemble(data:SimulationData,RA_alpha:float,iteration:int,replicate_count:int,process_count:int=None,change=None,seed:int=None)->tuple:
+    '''
+    ### Abstract
+        Run seeded replicates of the simulation in a process pool. The static data is shared with the workers without copying
+    ### Parameters
+        - data：The static data of the simulation, see prepare_simulation
+        - RA_alpha：Calculating the random factor
+        - iteration：The number of iterations
+        - replicate_count：Number of replicates
+        - process_count：Number of worker processes, the number of CPUs if it is None
+        - change：The conversion matrix, None means that all conversions are allowed
+        - seed：Seed of the ensemble, each replicate gets an independent seed derived from it
+
+    ### Return
+        - frequency[i,j]：The share of replicates in which parcel i is simulated as land use type j
+        - conversion_frequency[i]：The share of replicates in which parcel i is converted from its earlier land use
+        - accuracy[k]：(FoM,PA,UA) of replicate k
+    '''
+    landuse_type_list=data.landuse_type_list
+    parcel_count=len(data.areas)
+    frequency=np.zeros(shape=(parcel_count,len(landuse_type_list)))
+    accuracy=np.zeros(shape=(replicate_count,3))
+
+    seed_sequences=np.random.SeedSequence(seed).spawn(replicate_count)
+    shared_memory_list,descriptions=share_simulation_data(data)
+    try:
+        with Pool(processes=process_count,initializer=init_worker,initargs=(descriptions,RA_alpha,iteration,change)) as pool:
+            for replicate_index,(simulated_landuse_codes,replicate_accuracy) in enumerate(pool.imap(run_replicate,seed_sequences)):
+                frequency[np.arange(parcel_count),simulated_landuse_codes]+=1
+                accuracy[replicate_index]=replicate_accuracy
+    finally:
+        for shared_memory in shared_memory_list:
+            shared_memory.close()
+            shared_memory.unlink()
+
+    frequency=frequency/replicate_count
+    conversion_frequency=1-frequency[np.arange(parcel_count),data.before_landuse_codes]
+
+    return frequency,conversion_frequency,accuracy
+
+@profiled()
+def simulation_ensemble(input_file_name:str,restricted_area_file_name:str,before_landuse_field_name:str,after_landuse_field_name:str,RA_alpha:float,buffer_range:float,iteration:int,replicate_count:int,process_count:int=None,error_value:float=-99999,change=None,seed:int=None,cache_directory:str=None,output_file_name:str=None)->tuple:
+    '''
+    ### Abstract
+        Monte Carlo ensemble of the land use simulation. The parcels are loaded and the static data is calculated once, then the replicates run in parallel
+    ### Parameters
+        - input_file_name：The address of the land use types shapefile after overall development probability calculation
+        - restricted_area_file_name：The address of the restricted area shapefile
+        - before_landuse_field_name：The field name of the land use types from the earlier period
+        - after_landuse_field_name：The field name of the land use types from the later period.
+        - RA_alpha：Calculating the random factor
+        - buffer_range：The neighborhood range
+        - iteration：The number of iterations
+        - replicate_count：Number of replicates
+        - process_count：Number of worker processes, the number of CPUs if it is None
+        - change：The conversion matrix, None means that all conversions are allowed
+        - seed：Seed of the ensemble
+        - cache_directory：Directory of the on-disk cache of the static data, None means no cache
+        - output_file_name：.npz file to which FID, landuse_type_list, frequency, conversion_frequency and accuracy are written as columns without geometry, None means no file
+
+    ### Return
+        FID of the simulated parcels, list of land use types, and frequency, conversion_frequency and accuracy, see run_ensemble
+    '''
+    if cache_directory is not None:
+        data=prepare_simulation_with_cache(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,buffer_range,error_value,cache_directory)
+    else:
+        data=prepare_simulation(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,buffer_range,error_value)
+    frequency,conversion_frequency,accuracy=run_ensemble(data,RA_alpha,iteration,replicate_count,process_count,change,seed)
+
+    if output_file_name is not None:
+        save_npz(output_file_name,{
+            'FID':np.array(data.FID,dtype=np.int64),
+            'landuse_type_list':np.array(data.landuse_type_list,dtype=str),
+            'frequency':frequency,
+            'conversion_frequency':conversion_frequency,
+            'accuracy':accuracy,
+        })
+
+    return data.FID,data.landuse_type_list,frequency,conversion_frequency,accuracy
+
+if __name__=='__main__':
+    FID,landuse_type_list,frequency,conversion_frequency,accuracy=simulation_ensemble(
+        input_file_name=r"E:\UrbanVCA_Python\output\pg.shp",
+        restricted_area_file_name=r"E:\UrbanVCA_Python\data\restrictedArea.shp",
+        before_landuse_field_name='before',
+        after_landuse_field_name='after',
+        RA_alpha=5,
+        buffer_range=600,
+        iteration=5,
+        replicate_count=20,
+        seed=0,
+        change=[[1,0,1,1,1],
+                [1,1,1,1,1],
+                [1,0,1,1,1],
+                [1,0,1,1,1],
+                [1,0,1,1,1],
+                ]
+    )
+    print('FoM,PA,UA mean:',accuracy.mean(axis=0))
+    print('FoM,PA,UA std:',accuracy.std(axis=0))
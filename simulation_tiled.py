@@ -0,0 +1,351 @@
+from multiprocessing import Process
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+import traceback
+import numpy as np
+from numpy import ndarray
+from utils import copy_shapefile
+from utils import get_neighbor_graph
+from simulation import load_simulation_parcels
+from simulation import get_neighbor_weight_matrix
+from simulation import get_omega
+from simulation import update_omega
+from simulation import get_RA
+from simulation import propose_changes
+from simulation import consume_area_quota
+from simulation import write_to_file
+from simulation import save_attribute_result
+from assessment_FoM import AccuracyTracker
+from profiling import profiled
+import os
+os.environ['PROJ_LIB'] = r'C:\Users\dell\AppData\Local\Programs\Python\Python38\Lib\site-packages\osgeo\data\proj'
+
+
+class Tile():
+    def __init__(self, owned_indices: ndarray, halo_indices: ndarray):
+        self.owned_indices = owned_indices # Indices of the parcels whose centroid is in the tile, the tile simulates them
+        self.halo_indices = halo_indices # Indices of the other parcels within the neighborhood range of the tile, the tile only reads their land use
+
+
+def get_tiles(centroids:ndarray,tile_size:float,buffer_range:float)->list:
+    '''
+    ### Abstract
+        Partition the parcels into square tiles by their centroids. Each tile also gets a halo of the parcels of other tiles within the neighborhood range,
+        so the neighborhood effect of its own parcels can be calculated inside the tile
+    ### Parameters
+        - centroids：centroids[i] represents the centroid point coordinates of parcel i
+        - tile_size：Side length of the tiles
+        - buffer_range：The neighborhood range, the width of the halo
+
+    ### Return
+        List of the non-empty tiles
+    '''
+    origin=centroids.min(axis=0)
+    tile_xy=np.floor((centroids-origin)/tile_size).astype(np.int64)
+    tile_keys,tile_of_parcel=np.unique(tile_xy,axis=0,return_inverse=True)
+    tile_of_parcel=tile_of_parcel.reshape(-1)
+
+    parcel_order=np.argsort(tile_of_parcel,kind='stable')
+    owned_indices_list=np.split(parcel_order,np.cumsum(np.bincount(tile_of_parcel))[:-1])
+
+    # The halo is searched among the parcels sorted by x
+    x_order=np.argsort(centroids[:,0],kind='stable')
+    sorted_x=centroids[x_order,0]
+
+    tile_list=[]
+    for tile_key,owned_indices in zip(tile_keys,owned_indices_list):
+        minx,miny=origin+tile_key*tile_size
+        maxx,maxy=minx+tile_size,miny+tile_size
+
+        start=np.searchsorted(sorted_x,minx-buffer_range,side='left')
+        end=np.searchsorted(sorted_x,maxx+buffer_range,side='right')
+        candidates=x_order[start:end]
+        candidate_y=centroids[candidates,1]
+        candidates=candidates[(candidate_y>=miny-buffer_range)&(candidate_y<=maxy+buffer_range)]
+
+        tile_list.append(Tile(owned_indices,np.setdiff1d(candidates,owned_indices)))
+
+    return tile_list
+
+def receive(connection:Connection):
+    '''
+    ### Abstract
+        Receive a reply from a worker process, an error of the worker process is raised again in the coordinator
+    ### Parameters
+        - connection：Connection to the worker process
+
+    ### Return
+        The content of the reply
+    '''
+    status,content=connection.recv()
+    if status=='error':
+        raise RuntimeError('Tile worker process failed:\n'+content)
+
+    return content
+
+class TileState():
+    def __init__(self, tile_data: dict):
+        self.owned_count = tile_data['owned_count'] # Number of parcels of the tile, they come first in the local parcels
+        self.local_indices = tile_data['local_indices'] # Global indices of the local parcels, the parcels of the tile followed by the halo
+        self.landuse_codes = tile_data['landuse_codes'] # Current land use code of each local parcel
+        self.Pg = tile_data['Pg'] # Overall development probability of the parcels of the tile
+        self.Pc = tile_data['Pc'] # Limiting factor of the parcels of the tile
+        self.rng = np.random.default_rng(tile_data['seed_sequence']) # Random number generator of the tile
+
+        # Only the rows of the parcels of the tile are kept from the neighborhood weights
+        neighbor_graph = get_neighbor_graph(tile_data['centroids'], tile_data['buffer_range'])
+        weight_matrix = get_neighbor_weight_matrix(neighbor_graph, tile_data['buffer_range'], tile_data['areas'], tile_data['areamax'], tile_data['areamin'])[:self.owned_count]
+        self.weight_matrix_transposed = weight_matrix.T.tocsr() # Transpose of the neighborhood weights, see update_omega
+        self.omega = get_omega(self.landuse_codes, tile_data['landuse_type_count'], weight_matrix) # Neighborhood effect of the parcels of the tile
+
+        self.local_order = np.argsort(self.local_indices) # Order of the local parcels sorted by global index
+        self.sorted_local_indices = self.local_indices[self.local_order] # Global indices of the local parcels sorted
+
+def propose_tile_changes(tile_state:TileState,changed_global_indices:ndarray,changed_codes:ndarray,RA_alpha:float,change)->tuple:
+    '''
+    ### Abstract
+        Apply the land use changes of the previous iteration to the parcels of the tile and its halo, then propose the changes of the parcels of the tile,
+        the area quota is left to the coordinator
+    ### Parameters
+        - tile_state：State of the tile
+        - changed_global_indices：Global indices of the parcels changed in the previous iteration, at least those among the local parcels of the tile
+        - changed_codes：Their new land use codes
+        - RA_alpha：Calculating the random factor
+        - change：The conversion matrix, None means that all conversions are allowed
+
+    ### Return
+        The global indices of the proposed parcels in visit order, their land use codes and their candidate land use codes, see simulation.propose_changes
+    '''
+    sorted_local_indices=tile_state.sorted_local_indices
+    positions=np.minimum(np.searchsorted(sorted_local_indices,changed_global_indices),len(sorted_local_indices)-1)
+    is_local=sorted_local_indices[positions]==changed_global_indices
+    local_changed_indices=tile_state.local_order[positions[is_local]]
+    previous_codes=tile_state.landuse_codes[local_changed_indices]
+    tile_state.landuse_codes[local_changed_indices]=changed_codes[is_local]
+    tile_state.omega=update_omega(tile_state.omega,tile_state.weight_matrix_transposed,local_changed_indices,previous_codes,tile_state.landuse_codes)
+
+    owned_count=tile_state.owned_count
+    RA=get_RA(owned_count,RA_alpha,tile_state.rng)
+    visit_indices,before_indices,after_indices=propose_changes(tile_state.Pg,tile_state.omega,tile_state.Pc,RA,tile_state.landuse_codes[:owned_count],change,tile_state.rng)
+
+    return tile_state.local_indices[visit_indices],before_indices,after_indices
+
+def run_tile_worker(connection:Connection)->None:
+    '''
+    ### Abstract
+        Main loop of a worker process, which holds the neighborhood weights and omega of several tiles.
+        Each 'iterate' message carries the land use changes of the previous iteration among the parcels and halos of its tiles,
+        the worker applies them to its tiles and replies with the changes proposed by each of its tiles
+    ### Parameters
+        - connection：Connection to the coordinator
+
+    ### Return
+        none
+    '''
+    try:
+        RA_alpha,change,tile_data_list=connection.recv()
+        tile_state_list=[TileState(tile_data) for tile_data in tile_data_list]
+        connection.send(('ok',None))
+
+        while True:
+            message=connection.recv()
+            if message[0]=='stop':
+                break
+            _,changed_global_indices,changed_codes=message
+
+            connection.send(('ok',[propose_tile_changes(tile_state,changed_global_indices,changed_codes,RA_alpha,change) for tile_state in tile_state_list]))
+    except Exception:
+        connection.send(('error',traceback.format_exc()))
+    finally:
+        connection.close()
+
+def get_tile_data(tile:Tile,current_landuse_codes:ndarray,areas:ndarray,Pg:ndarray,Pc:ndarray,centroids:ndarray,landuse_type_count:int,buffer_range:float,seed_sequence:np.random.SeedSequence)->dict:
+    '''
+    ### Abstract
+        Collect the data a worker process needs to hold one tile
+    ### Parameters
+        - tile：The tile
+        - current_landuse_codes：Current land use code of each parcel
+        - areas：Area of each parcel
+        - Pg：Overall development probability
+        - Pc：Limiting factor
+        - centroids：centroids[i] represents the centroid point coordinates of parcel i
+        - landuse_type_count：Number of land use types
+        - buffer_range：The neighborhood range
+        - seed_sequence：Seed of the tile
+
+    ### Return
+        The data of the tile, see TileState
+    '''
+    local_indices=np.concatenate([tile.owned_indices,tile.halo_indices])
+    owned_indices=tile.owned_indices
+
+    return {
+        'owned_count':len(owned_indices),
+        'local_indices':local_indices,
+        'centroids':centroids[local_indices],
+        'areas':areas[local_indices],
+        'areamax':areas.max(),
+        'areamin':areas.min(),
+        'landuse_codes':current_landuse_codes[local_indices],
+        'landuse_type_count':landuse_type_count,
+        'Pg':Pg[owned_indices],
+        'Pc':Pc[owned_indices],
+        'buffer_range':buffer_range,
+        'seed_sequence':seed_sequence,
+    }
+
+@profiled()
+def run_tiled_simulation(landuse_type_count:int,before_landuse_codes:ndarray,after_landuse_codes:ndarray,areas:ndarray,area_change_matrix:ndarray,Pg:ndarray,Pc:ndarray,centroids:ndarray,RA_alpha:float,buffer_range:float,iteration:int,tile_size:float,change=None,seed:int=None,assessment_interval:int=1,process_count:int=None)->ndarray:
+    '''
+    ### Abstract
+        Run the cellular automata with the parcels partitioned into tiles, the tiles are spread over a bounded number of worker processes.
+        The tiles only propose changes. The coordinator keeps the per-parcel arrays and one area quota for all tiles,
+        accepts the proposals of each iteration in random order against that quota as the serial simulation does, and forwards to each worker the accepted changes
+        among the parcels and halos of its tiles
+    ### Parameters
+        - landuse_type_count：Number of land use types
+        - before_landuse_codes：Land use code of each parcel in the earlier period
+        - after_landuse_codes：Land use code of each parcel in the later period
+        - areas：Area of each parcel
+        - area_change_matrix：Area of land use type i transformed into land use type j over the whole simulation
+        - Pg：Overall development probability
+        - Pc：Limiting factor
+        - centroids：centroids[i] represents the centroid point coordinates of parcel i
+        - RA_alpha：Calculating the random factor
+        - buffer_range：The neighborhood range
+        - iteration：The number of iterations
+        - tile_size：Side length of the tiles, it should be much larger than buffer_range
+        - change：The conversion matrix, None means that all conversions are allowed
+        - seed：Seed of the simulation, each tile and the coordinator get an independent seed derived from it
+        - assessment_interval：The accuracy is printed every assessment_interval iterations and after the last one, 0 means never
+        - process_count：Number of worker processes, None means the number of CPUs, the tiles are assigned to them in turn
+
+    ### Return
+        Simulated land use code of each parcel
+    '''
+    tile_list=get_tiles(centroids,tile_size,buffer_range)
+    tile_count=len(tile_list)
+    if process_count is None:
+        process_count=os.cpu_count() or 1
+    process_count=max(1,min(process_count,tile_count))
+    print('tiles:',tile_count,'processes:',process_count)
+
+    current_landuse_codes=before_landuse_codes.copy()
+    if assessment_interval>0:
+        accuracy_tracker=AccuracyTracker(before_landuse_codes,after_landuse_codes,current_landuse_codes,areas,landuse_type_count)
+
+    seed_sequences=np.random.SeedSequence(seed).spawn(tile_count+1)
+    rng=np.random.default_rng(seed_sequences[-1])
+    connection_list=[]
+    process_list=[]
+    # Whether each parcel is held by the tiles of each worker, as a parcel of a tile or of a halo
+    is_held_list=[]
+    try:
+        for process_index in range(process_count):
+            connection,child_connection=Pipe()
+            process=Process(target=run_tile_worker,args=(child_connection,),daemon=True)
+            process.start()
+            connection_list.append(connection)
+            process_list.append(process)
+
+            tile_data_list=[]
+            is_held=np.zeros(shape=(len(areas),),dtype=bool)
+            for tile_index in range(process_index,tile_count,process_count):
+                tile_data_list.append(get_tile_data(tile_list[tile_index],current_landuse_codes,areas,Pg,Pc,centroids,landuse_type_count,buffer_range,seed_sequences[tile_index]))
+                is_held[tile_data_list[-1]['local_indices']]=True
+            is_held_list.append(is_held)
+            connection.send((RA_alpha,change,tile_data_list))
+        for connection in connection_list:
+            receive(connection)
+
+        iteration_area_change_matrix=area_change_matrix/iteration
+        changed_indices=np.zeros(shape=(0,),dtype=np.int64)
+        changed_codes=current_landuse_codes[:0]
+        for i in range(iteration):
+            # Each worker only gets the changes of the parcels its tiles hold
+            for connection,is_held in zip(connection_list,is_held_list):
+                is_sent=is_held[changed_indices]
+                connection.send(('iterate',changed_indices[is_sent],changed_codes[is_sent]))
+
+            # The proposals are put in tile order, so the result does not depend on process_count
+            proposals=[None]*tile_count
+            for process_index,connection in enumerate(connection_list):
+                proposals[process_index::process_count]=receive(connection)
+            visit_indices,before_indices,after_indices=(np.concatenate(proposal_part) for proposal_part in zip(*proposals))
+
+            # The proposals of all tiles consume one area quota in random order
+            visit_order=rng.permutation(len(visit_indices))
+            changed_indices,changed_codes=consume_area_quota(visit_indices[visit_order],before_indices[visit_order],after_indices[visit_order],areas,iteration_area_change_matrix)
+            current_landuse_codes[changed_indices]=changed_codes
+
+            if assessment_interval>0:
+                accuracy_tracker.update(changed_indices,current_landuse_codes)
+                if (i+1)%assessment_interval==0 or i==iteration-1:
+                    print(i,accuracy_tracker.get_accuracy())
+
+        for connection in connection_list:
+            connection.send(('stop',))
+        for process in process_list:
+            process.join()
+    finally:
+        for process in process_list:
+            if process.is_alive():
+                process.terminate()
+
+    return current_landuse_codes
+
+@profiled()
+def tiled_simulation(input_file_name:str,restricted_area_file_name:str,output_file_name:str,before_landuse_field_name:str,after_landuse_field_name:str,RA_alpha:float,buffer_range:float,iteration:int,tile_size:float,error_value:float=-99999,change=None,seed:int=None,assessment_interval:int=1,output_format:str='shapefile',process_count:int=None)->None:
+    '''
+    ### Abstract
+        Land use simulation partitioned into spatial tiles, for study areas whose neighborhood weights do not fit in the memory of one process
+    ### Parameters
+        - input_file_name：The address of the land use types shapefile after overall development probability calculation
+        - restricted_area_file_name：The address of the restricted area shapefile
+        - output_file_name：The output address of the result file, a shapefile or a .npz file according to output_format
+        - before_landuse_field_name：The field name of the land use types from the earlier period
+        - after_landuse_field_name：The field name of the land use types from the later period.
+        - RA_alpha：Calculating the random factor
+        - buffer_range：The neighborhood range
+        - iteration：The number of iterations
+        - tile_size：Side length of the tiles
+        - error_value：Error value
+        - change：The conversion matrix, None means that all conversions are allowed
+        - seed：Seed of the simulation, the run is reproducible for the same tile_size if it is given
+        - assessment_interval：The accuracy is printed every assessment_interval iterations, 0 means never
+        - output_format：'shapefile' or 'npz', see simulation.simulation
+        - process_count：Number of worker processes, None means the number of CPUs
+
+    ### Return
+        none
+    '''
+    FID,landuse_type_list,before_landuse_codes,after_landuse_codes,areas,area_change_matrix,Pg,Pc,centroids=load_simulation_parcels(input_file_name,restricted_area_file_name,before_landuse_field_name,after_landuse_field_name,error_value)
+
+    current_landuse_codes=run_tiled_simulation(len(landuse_type_list),before_landuse_codes,after_landuse_codes,areas,area_change_matrix,Pg,Pc,centroids,RA_alpha,buffer_range,iteration,tile_size,change,seed,assessment_interval,process_count)
+
+    if output_format=='npz':
+        save_attribute_result(output_file_name,current_landuse_codes,landuse_type_list,FID)
+    else:
+        copy_shapefile(input_file_name,output_file_name)
+        write_to_file(output_file_name,current_landuse_codes,landuse_type_list,FID,error_value)
+
+if __name__=='__main__':
+    tiled_simulation(
+        input_file_name=r"E:\UrbanVCA_Python\output\pg.shp",
+        restricted_area_file_name=r"E:\UrbanVCA_Python\data\restrictedArea.shp",
+        output_file_name=r"E:\UrbanVCA_Python\output\simulated_tiled.shp",
+        before_landuse_field_name='before',
+        after_landuse_field_name='after',
+        RA_alpha=5,
+        buffer_range=600,
+        iteration=5,
+        tile_size=10000,
+        seed=0,
+        change=[[1,0,1,1,1],
+                [1,1,1,1,1],
+                [1,0,1,1,1],
+                [1,0,1,1,1],
+                [1,0,1,1,1],
+                ]
+    )
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from assessment_FoM import assessment_FoM
+from assessment_FoM import assessment_FoM_and_confusion_matrix
+from assessment_FoM import AccuracyTracker
+
+
+def assessment_FoM_by_loop(before_landuse_list, after_landuse_list, simulated_landuse_list, areas):
+    # The per-plot loop that the vectorized A, B, C, D replaced
+    A, B, C, D = 0, 0, 0, 0
+    for before_landuse, after_landuse, simulated_landuse, area in zip(before_landuse_list, after_landuse_list, simulated_landuse_list, areas):
+        if before_landuse != after_landuse and before_landuse == simulated_landuse:
+            A += area
+        if before_landuse != after_landuse and after_landuse == simulated_landuse:
+            B += area
+        if before_landuse != after_landuse and before_landuse != simulated_landuse and after_landuse != simulated_landuse:
+            C += area
+        if before_landuse == after_landuse and before_landuse != simulated_landuse:
+            D += area
+    return B/(A+B+C+D), B/(A+B+C), B/(B+C+D)
+
+
+def get_confusion_matrix_by_loop(after_landuse_codes, simulated_landuse_codes, areas, landuse_type_count):
+    confusion_matrix = np.zeros(shape=(landuse_type_count, landuse_type_count))
+    for after_landuse_code, simulated_landuse_code, area in zip(after_landuse_codes, simulated_landuse_codes, areas):
+        confusion_matrix[after_landuse_code, simulated_landuse_code] += area
+    return confusion_matrix
+
+
+def make_landuse(rng, parcel_count=2000, landuse_type_count=4):
+    before_landuse_codes = rng.integers(0, landuse_type_count, parcel_count)
+    after_landuse_codes = np.where(rng.random(parcel_count) < 0.3, rng.integers(0, landuse_type_count, parcel_count), before_landuse_codes)
+    simulated_landuse_codes = np.where(rng.random(parcel_count) < 0.3, rng.integers(0, landuse_type_count, parcel_count), before_landuse_codes)
+    areas = rng.random(parcel_count)*100+10
+    return before_landuse_codes, after_landuse_codes, simulated_landuse_codes, areas
+
+
+def test_vectorized_accuracy_matches_loop():
+    before_landuse_codes, after_landuse_codes, simulated_landuse_codes, areas = make_landuse(np.random.default_rng(0))
+
+    FoM, PA, UA, confusion_matrix = assessment_FoM_and_confusion_matrix(before_landuse_codes, after_landuse_codes, simulated_landuse_codes, areas, 4)
+
+    assert (FoM, PA, UA) == pytest.approx(assessment_FoM_by_loop(before_landuse_codes.tolist(), after_landuse_codes.tolist(), simulated_landuse_codes.tolist(), areas.tolist()))
+    np.testing.assert_allclose(confusion_matrix, get_confusion_matrix_by_loop(after_landuse_codes, simulated_landuse_codes, areas, 4))
+
+    # Land use types given as strings
+    landuse_type_list = ['a', 'b', 'c', 'd']
+    landuse_lists = [[landuse_type_list[code] for code in codes] for codes in (before_landuse_codes, after_landuse_codes, simulated_landuse_codes)]
+    assert assessment_FoM(*landuse_lists, areas) == pytest.approx((FoM, PA, UA))
+
+
+def test_tracker_updates_match_full_recompute():
+    rng = np.random.default_rng(1)
+    before_landuse_codes, after_landuse_codes, _, areas = make_landuse(rng)
+    simulated_landuse_codes = before_landuse_codes.copy()
+    accuracy_tracker = AccuracyTracker(before_landuse_codes, after_landuse_codes, simulated_landuse_codes, areas, 4)
+
+    for _ in range(10):
+        changed_indices = np.unique(rng.integers(0, len(areas), 100))
+        simulated_landuse_codes[changed_indices] = rng.integers(0, 4, len(changed_indices))
+        accuracy_tracker.update(changed_indices, simulated_landuse_codes)
+
+        FoM, PA, UA, confusion_matrix = assessment_FoM_and_confusion_matrix(before_landuse_codes, after_landuse_codes, simulated_landuse_codes, areas, 4)
+        assert accuracy_tracker.get_accuracy() == pytest.approx((FoM, PA, UA))
+        np.testing.assert_allclose(accuracy_tracker.confusion_matrix, confusion_matrix)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+from osgeo import ogr
+from osgeo.ogr import FieldDefn
+from utils import create_layer
+from parcel_table import apart_multipolygon_rows
+from parcel_table import read_parcel_table
+
+
+def get_wkb(wkt):
+    return bytes(ogr.CreateGeometryFromWkt(wkt).ExportToWkb())
+
+
+def test_apart_multipolygon_rows_appends_the_parts_after_the_polygons():
+    wkt_list = [
+        'POLYGON ((0 0, 1 0, 1 1, 0 0))',
+        'MULTIPOLYGON (((10 0, 11 0, 11 1, 10 0)), ((20 0, 21 0, 21 1, 20 0)))',
+        'POLYGON ((30 0, 31 0, 31 1, 30 0))',
+    ]
+    fid_list, field_value_lists, wkb_list = apart_multipolygon_rows([5, 6, 7], {'landuse': ['a', 'b', 'c']}, [get_wkb(wkt) for wkt in wkt_list])
+
+    assert fid_list == [5, 7, 6, 6]
+    assert field_value_lists['landuse'] == ['a', 'c', 'b', 'b']
+    assert [ogr.CreateGeometryFromWkb(wkb).GetEnvelope()[0] for wkb in wkb_list] == [0, 30, 10, 20]
+
+
+def test_read_parcel_table_skips_features_without_geometry(tmp_path):
+    file_name = str(tmp_path / 'parcels.shp')
+    file, layer = create_layer(file_name, (None, ogr.wkbPolygon, [FieldDefn('landuse', ogr.OFTString)]))
+    for landuse, wkt in [('a', 'POLYGON ((0 0, 1 0, 1 1, 0 0))'), ('b', None), ('c', 'POLYGON ((10 0, 12 0, 12 2, 10 0))')]:
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetField('landuse', landuse)
+        if wkt is not None:
+            feature.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+        layer.CreateFeature(feature)
+    file = None
+
+    parcel_table = read_parcel_table(file_name, ['landuse'], apart_multipolygon=True)
+
+    assert len(parcel_table) == 2
+    np.testing.assert_array_equal(parcel_table.fid, [0, 2])
+    assert parcel_table.fields['landuse'].tolist() == ['a', 'c']
+    np.testing.assert_allclose(parcel_table.areas, [0.5, 2])
@@ -0,0 +1,39 @@
+import importlib.util
+import pytest
+
+pytest.importorskip('osgeo')
+
+from pipeline import Stage
+from pipeline import get_stage_fingerprint
+from pipeline import run_dag
+
+
+def load_stage_function(tmp_path, source):
+    file_name = tmp_path / 'stage_module.py'
+    file_name.write_text(source)
+    spec = importlib.util.spec_from_file_location('stage_module', str(file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.stage_function
+
+
+def test_editing_the_stage_function_changes_the_fingerprint(tmp_path):
+    function = load_stage_function(tmp_path, 'def stage_function(output_file_name, value):\n    return value\n')
+    fingerprint = get_stage_fingerprint(Stage('stage', function, {'value': 1}, output_dataset_dict={'output_file_name': 'out'}), {})
+    assert fingerprint == get_stage_fingerprint(Stage('stage', function, {'value': 1}, output_dataset_dict={'output_file_name': 'out'}), {})
+
+    # Same name, different body
+    edited_function = load_stage_function(tmp_path, 'def stage_function(output_file_name, value):\n    return value+1\n')
+    assert fingerprint != get_stage_fingerprint(Stage('stage', edited_function, {'value': 1}, output_dataset_dict={'output_file_name': 'out'}), {})
+
+    # Same function, new version
+    assert fingerprint != get_stage_fingerprint(Stage('stage', function, {'value': 1}, output_dataset_dict={'output_file_name': 'out'}, version='2'), {})
+
+
+def test_stages_starting_processes_are_rejected(tmp_path):
+    function = load_stage_function(tmp_path, 'def stage_function(output_file_name, process_count=None):\n    pass\n')
+
+    with pytest.raises(ValueError):
+        run_dag([Stage('stage', function, {}, output_dataset_dict={'output_file_name': 'out'})], str(tmp_path / 'output'))
+    with pytest.raises(ValueError):
+        run_dag([Stage('stage', function, {'process_count': 4}, output_dataset_dict={'output_file_name': 'out'})], str(tmp_path / 'output'))
@@ -0,0 +1,242 @@
+import random
+import numpy as np
+import pytest
+from scipy.spatial import ConvexHull
+
+pytest.importorskip('osgeo')
+
+from osgeo import ogr
+from osgeo.ogr import FieldDefn
+from utils import create_layer
+from utils import get_feature_list
+import preparation_DLPS
+from preparation_DLPS import DLPS
+from preparation_DLPS import ParcelStore
+from preparation_DLPS import split_once
+from preparation_DLPS import clip_ring_by_line
+from preparation_DLPS import get_MABR_list
+
+
+class FakeGeometry():
+    def __init__(self, area, is_multipolygon=False):
+        self.area = area
+        self.is_multipolygon = is_multipolygon
+
+    def GetArea(self):
+        return self.area
+
+    def GetGeometryName(self):
+        return 'MULTIPOLYGON' if self.is_multipolygon else 'POLYGON'
+
+
+class FakeFeature():
+    def __init__(self, area, is_multipolygon=False):
+        self.geometry = FakeGeometry(area, is_multipolygon)
+
+    def GetGeometryRef(self):
+        return self.geometry
+
+
+def fake_split_feature_list(feature_list, pool=None, chunk_size=1000):
+    # The split ratio depends only on the area, some first halves are multipolygons
+    result = []
+    for feature in feature_list:
+        area = feature.GetGeometryRef().GetArea()
+        ratio = 0.1+0.8*((area*7.3) % 1)
+        result.append((FakeFeature(area*ratio, int(area) % 5 == 0), FakeFeature(area*(1-ratio))))
+    return result
+
+
+def fake_apart_multipolygon(feature_list):
+    polygon_list = [feature for feature in feature_list if not feature.GetGeometryRef().is_multipolygon]
+    for feature in feature_list:
+        if feature.GetGeometryRef().is_multipolygon:
+            area = feature.GetGeometryRef().GetArea()
+            polygon_list += [FakeFeature(area/2), FakeFeature(area/2)]
+    return polygon_list
+
+
+def split_once_with_list(feature_list, allowable_parameter, random_number):
+    # The list-based iteration that ParcelStore replaced
+    areas = np.array([feature.GetGeometryRef().GetArea() for feature in feature_list])
+    threshold = areas.mean()+allowable_parameter*areas.std()*random_number
+    kept_feature_list = [feature for feature in feature_list if feature.GetGeometryRef().GetArea() <= threshold]
+    new_feature_list = []
+    for new_feature1, new_feature2 in fake_split_feature_list([feature for feature in feature_list if feature.GetGeometryRef().GetArea() > threshold]):
+        new_feature_list += [new_feature1, new_feature2]
+    return fake_apart_multipolygon(kept_feature_list+new_feature_list)
+
+
+def test_parcel_store_keeps_the_order_of_the_list(monkeypatch):
+    monkeypatch.setattr(preparation_DLPS, 'split_feature_list', fake_split_feature_list)
+    monkeypatch.setattr(preparation_DLPS, 'apart_multipolygon', fake_apart_multipolygon)
+    areas = np.random.default_rng(1).lognormal(8, 1, 5000)
+
+    feature_list = [FakeFeature(area) for area in areas]
+    random_generator = random.Random(3)
+    for _ in range(6):
+        feature_list = split_once_with_list(feature_list, 2, random_generator.random())
+
+    parcel_store = ParcelStore([FakeFeature(area) for area in areas])
+    random_generator = random.Random(3)
+    for _ in range(6):
+        split_once(parcel_store, 2, random_generator.random())
+
+    expected_areas = [feature.GetGeometryRef().GetArea() for feature in feature_list]
+    store_areas = [feature.GetGeometryRef().GetArea() for feature in parcel_store.get_feature_list()]
+    assert len(store_areas) == len(expected_areas)
+    np.testing.assert_allclose(store_areas, expected_areas)
+
+    mean, std = parcel_store.get_mean_and_std_of_area()
+    assert mean == pytest.approx(np.mean(expected_areas))
+    assert std == pytest.approx(np.std(expected_areas))
+
+
+def get_ring_area(points, origin):
+    # Shoelace formula, relative to origin to keep the precision of projected coordinates
+    x, y = (points-origin).T
+    return 0.5*np.sum(x[:-1]*y[1:]-x[1:]*y[:-1])
+
+
+def get_star_shaped_ring(rng, origin):
+    point_count = rng.integers(5, 40)
+    angles = (np.arange(point_count)+rng.uniform(0, 0.9, point_count))*2*np.pi/point_count
+    radii = rng.uniform(0.3, 1, point_count)*rng.uniform(1, 100)
+    points = np.column_stack([radii*np.cos(angles), radii*np.sin(angles)])+origin
+    return np.vstack([points, points[:1]])
+
+
+def test_clip_ring_by_line_conserves_area():
+    rng = np.random.default_rng(0)
+    origin = np.array([4e5, 4e5])
+    clipped_count = 0
+    for _ in range(2000):
+        points = get_star_shaped_ring(rng, origin)
+        line_point = origin+rng.normal(size=2)
+        line_direction = rng.normal(size=2)
+
+        parts = clip_ring_by_line(points, line_point, line_direction)
+        if parts is None:
+            continue
+        clipped_count += 1
+        left_points, right_points = parts
+
+        area = get_ring_area(points, origin)
+        left_area = get_ring_area(left_points, origin)
+        right_area = get_ring_area(right_points, origin)
+        assert left_area > 0 and right_area > 0
+        assert left_area+right_area == pytest.approx(area, rel=1e-6)
+
+        # Each part stays on its side of the line
+        tolerance = 1e-6*np.linalg.norm(line_direction)
+        left_sides = line_direction[0]*(left_points[:, 1]-line_point[1])-line_direction[1]*(left_points[:, 0]-line_point[0])
+        right_sides = line_direction[0]*(right_points[:, 1]-line_point[1])-line_direction[1]*(right_points[:, 0]-line_point[0])
+        assert left_sides.min() > -tolerance and right_sides.max() < tolerance
+
+    assert clipped_count > 1000
+
+
+def write_polygon_layer(file_name, rng, polygon_count):
+    # Rotated rectangles of very different sizes on a grid, the last one is a multipolygon
+    file, layer = create_layer(file_name, (None, ogr.wkbPolygon, [FieldDefn('landuse', ogr.OFTString)]))
+    wkt_list = []
+    for index in range(polygon_count):
+        center = np.array([index % 10, index // 10])*1000.0
+        width, height = rng.lognormal(5, 0.8, 2)
+        angle = rng.uniform(0, np.pi)
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        corners = center+np.array([[-width, -height], [width, -height], [width, height], [-width, height], [-width, -height]])/2@rotation.T
+        wkt_list.append('((%s))' % ', '.join('%f %f' % (x, y) for x, y in corners))
+    for index, wkt in enumerate(wkt_list[:-2]):
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetField('landuse', str(index % 3))
+        feature.SetGeometry(ogr.CreateGeometryFromWkt('POLYGON '+wkt))
+        layer.CreateFeature(feature)
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetField('landuse', '0')
+    feature.SetGeometry(ogr.CreateGeometryFromWkt('MULTIPOLYGON (%s, %s)' % (wkt_list[-2], wkt_list[-1])))
+    layer.CreateFeature(feature)
+    file = None
+
+
+def get_part_areas(file_name):
+    return np.array([feature.GetGeometryRef().GetArea() for feature in get_feature_list(file_name)])
+
+
+def test_streaming_gives_the_same_parts_as_in_memory(tmp_path):
+    input_file_name = str(tmp_path / 'parcels.shp')
+    write_polygon_layer(input_file_name, np.random.default_rng(0), 60)
+
+    DLPS(input_file_name, str(tmp_path / 'in_memory.shp'), 4, 1, seed=5)
+    DLPS(input_file_name, str(tmp_path / 'streaming.shp'), 4, 1, seed=5, chunk_size=7, streaming=True)
+
+    in_memory_areas = get_part_areas(str(tmp_path / 'in_memory.shp'))
+    streaming_areas = get_part_areas(str(tmp_path / 'streaming.shp'))
+    assert len(in_memory_areas) > 61
+    assert len(streaming_areas) == len(in_memory_areas)
+    assert streaming_areas.sum() == pytest.approx(in_memory_areas.sum())
+    np.testing.assert_allclose(streaming_areas, in_memory_areas)
+
+
+def get_MABR_by_rotation(convex_hull_points):
+    # The per-edge rotation search that get_MABR_list replaced
+    area_list = []
+    rectangle_list = []
+    for i in range(len(convex_hull_points)-1):
+        vector = convex_hull_points[i]-convex_hull_points[i+1]
+        radian = np.arccos(vector[0]/np.linalg.norm(vector))
+        if vector[1] > 0:
+            radian = -radian
+        rotate_matrix = np.array([[np.cos(radian), np.sin(radian)], [-np.sin(radian), np.cos(radian)]])
+        anchor = convex_hull_points[i]
+        rotated_points = (convex_hull_points-anchor).dot(rotate_matrix)+anchor
+        xmin, ymin = rotated_points.min(axis=0)
+        xmax, ymax = rotated_points.max(axis=0)
+        rectangle = np.array([[xmin, ymax], [xmax, ymax], [xmax, ymin], [xmin, ymin], [xmin, ymax]])
+        area_list.append((xmax-xmin)*(ymax-ymin))
+        rectangle_list.append((rectangle-anchor).dot(rotate_matrix.T)+anchor)
+    return rectangle_list[int(np.argmin(area_list))], np.sort(area_list)
+
+
+def get_rectangle_area(rectangle):
+    return np.linalg.norm(rectangle[1]-rectangle[0])*np.linalg.norm(rectangle[3]-rectangle[0])
+
+
+def get_corner_set(rectangle):
+    return sorted(map(tuple, np.round(rectangle[:4], 4).tolist()))
+
+
+def test_batched_MABR_matches_rotation_search():
+    rng = np.random.default_rng(0)
+    convex_hull_points_list = []
+    for point_count in rng.integers(3, 60, 300):
+        points = rng.normal(size=(point_count, 2))*rng.uniform(1, 100, 2)+rng.uniform(0, 1e5, 2)
+        hull_points = points[ConvexHull(points).vertices]
+        convex_hull_points_list.append(np.vstack([hull_points, hull_points[:1]]))
+
+    # Small batches exercise the padding of the shorter convex hulls
+    for max_element_count in [1 << 22, 5000]:
+        MABR_array = get_MABR_list(convex_hull_points_list, max_element_count)
+        for convex_hull_points, MABR in zip(convex_hull_points_list, MABR_array):
+            expected_MABR, sorted_areas = get_MABR_by_rotation(convex_hull_points)
+            assert get_rectangle_area(MABR) == pytest.approx(get_rectangle_area(expected_MABR), rel=1e-9)
+            # Several edges can give the same smallest rectangle area, e.g. every edge of a triangle
+            if sorted_areas[1] > sorted_areas[0]*(1+1e-9):
+                assert get_corner_set(MABR) == get_corner_set(expected_MABR)
+            np.testing.assert_allclose(MABR[4], MABR[0])
+
+
+def test_process_pool_splits_the_same_as_serial(tmp_path):
+    input_file_name = str(tmp_path / 'parcels.shp')
+    write_polygon_layer(input_file_name, np.random.default_rng(1), 60)
+
+    DLPS(input_file_name, str(tmp_path / 'serial.shp'), 4, 1, process_count=1, seed=7)
+    DLPS(input_file_name, str(tmp_path / 'parallel.shp'), 4, 1, process_count=2, seed=7, chunk_size=5)
+
+    serial_feature_list = get_feature_list(str(tmp_path / 'serial.shp'))
+    parallel_feature_list = get_feature_list(str(tmp_path / 'parallel.shp'))
+    assert len(serial_feature_list) > 61
+    assert len(parallel_feature_list) == len(serial_feature_list)
+    for serial_feature, parallel_feature in zip(serial_feature_list, parallel_feature_list):
+        assert parallel_feature.GetField('landuse') == serial_feature.GetField('landuse')
+        assert parallel_feature.GetGeometryRef().Equals(serial_feature.GetGeometryRef())
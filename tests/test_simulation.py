@@ -0,0 +1,214 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+from osgeo import ogr
+
+from utils import get_neighbor_graph
+from parcel_table import ParcelTable
+from simulation import get_Pc
+from simulation import get_neighbor_weight_matrix
+from simulation import get_area_change_matrix
+from simulation import get_omega
+from simulation import update_omega
+from simulation import get_RA
+from simulation import iteration_once
+from simulation import SimulationData
+from simulation import CheckpointConfig
+from simulation import save_simulation_data
+from simulation import load_simulation_data
+from simulation import load_checkpoint
+from simulation import run_simulation
+from simulation import get_area_change_matrix_from_demand
+from simulation import PeriodConfig
+from simulation import run_forecast
+from simulation import load_forecast_result
+import simulation
+
+
+def make_simulation_data(parcel_count=2000, landuse_type_count=3, buffer_range=150, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = rng.random((parcel_count, 2)) * 3000
+    areas = rng.random(parcel_count) * 100 + 10
+    before_landuse_codes = rng.integers(0, landuse_type_count, parcel_count)
+    after_landuse_codes = np.where(rng.random(parcel_count) < 0.3, rng.integers(0, landuse_type_count, parcel_count), before_landuse_codes)
+    area_change_matrix = get_area_change_matrix(areas, before_landuse_codes, after_landuse_codes, landuse_type_count)
+    weight_matrix = get_neighbor_weight_matrix(get_neighbor_graph(centroids, buffer_range), buffer_range, areas, areas.max(), areas.min())
+    return SimulationData(list(range(parcel_count)), [str(i) for i in range(landuse_type_count)], before_landuse_codes, after_landuse_codes, areas, area_change_matrix, rng.random((parcel_count, landuse_type_count)), np.ones(parcel_count), weight_matrix)
+
+
+def test_update_omega_matches_full_recompute():
+    data = make_simulation_data()
+    landuse_type_count = len(data.landuse_type_list)
+    rng = np.random.default_rng(1)
+    current_landuse_codes = data.before_landuse_codes.copy()
+    omega = get_omega(current_landuse_codes, landuse_type_count, data.weight_matrix)
+    area_change_matrix = data.area_change_matrix / 10
+
+    for _ in range(10):
+        RA = get_RA(len(current_landuse_codes), 5, rng)
+        current_landuse_codes, area_change_matrix, changed_indices, previous_landuse_codes = iteration_once(data.Pg, omega, data.Pc, RA, current_landuse_codes, data.areas, area_change_matrix, None, rng)
+        assert len(changed_indices) > 0
+        omega = update_omega(omega, data.weight_matrix_transposed, changed_indices, previous_landuse_codes, current_landuse_codes)
+
+        np.testing.assert_allclose(omega, get_omega(current_landuse_codes, landuse_type_count, data.weight_matrix), atol=1e-9)
+
+
+def test_update_omega_without_changes_keeps_omega():
+    data = make_simulation_data(200)
+    omega = get_omega(data.before_landuse_codes, len(data.landuse_type_list), data.weight_matrix)
+    expected = omega.copy()
+
+    omega = update_omega(omega, data.weight_matrix_transposed, np.zeros(shape=(0,), dtype=np.int64), data.before_landuse_codes[:0], data.before_landuse_codes)
+
+    np.testing.assert_array_equal(omega, expected)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_resume_from_checkpoint_matches_uninterrupted_run(tmp_path, monkeypatch):
+    data = make_simulation_data()
+    iteration = 10
+    uninterrupted_landuse_codes = run_simulation(data, 5, iteration, rng=np.random.default_rng(2), assessment_interval=0)
+
+    # The run is interrupted right after the checkpoint of iteration 4
+    static_file_name = str(tmp_path / 'checkpoint_static.npz')
+    save_simulation_data(data, static_file_name)
+    checkpoint_config = CheckpointConfig(str(tmp_path / 'checkpoint.npz'), 4, static_file_name)
+    save_checkpoint = simulation.save_checkpoint
+
+    def save_checkpoint_and_stop(checkpoint_config, completed_iteration, *args):
+        save_checkpoint(checkpoint_config, completed_iteration, *args)
+        raise Interrupted()
+
+    monkeypatch.setattr(simulation, 'save_checkpoint', save_checkpoint_and_stop)
+    with pytest.raises(Interrupted):
+        run_simulation(data, 5, iteration, rng=np.random.default_rng(2), assessment_interval=0, checkpoint_config=checkpoint_config)
+    monkeypatch.undo()
+
+    static_file_name, completed_iteration, current_landuse_codes, area_change_matrix, rng = load_checkpoint(checkpoint_config.file_name)
+    assert completed_iteration == 4
+    resumed_landuse_codes = run_simulation(load_simulation_data(static_file_name), 5, iteration, rng=rng, assessment_interval=0, start_state=(completed_iteration, current_landuse_codes, area_change_matrix))
+
+    np.testing.assert_array_equal(resumed_landuse_codes, uninterrupted_landuse_codes)
+
+
+def get_random_triangle_table(rng, count, size, extent):
+    # Triangles around random centers, their envelopes often intersect without the triangles intersecting
+    wkb_list = []
+    for center in rng.random((count, 2))*extent:
+        points = center+rng.uniform(-size, size, (3, 2))
+        wkt = 'POLYGON ((%s))' % ', '.join('%f %f' % (x, y) for x, y in np.vstack([points, points[:1]]))
+        wkb_list.append(bytes(ogr.CreateGeometryFromWkt(wkt).ExportToWkb()))
+    return ParcelTable(np.arange(count), {}, wkb_list)
+
+
+def test_get_Pc_matches_brute_force_intersects():
+    rng = np.random.default_rng(0)
+    parcel_table = get_random_triangle_table(rng, 1500, 10, 1000)
+    restricted_parcel_table = get_random_triangle_table(rng, 300, 15, 1000)
+
+    # One zoning polygon much larger than the parcels
+    large_wkt = 'POLYGON ((100 100, 900 150, 500 700, 100 100))'
+    restricted_parcel_table = ParcelTable(np.arange(301), {}, restricted_parcel_table.wkb_list+[bytes(ogr.CreateGeometryFromWkt(large_wkt).ExportToWkb())])
+
+    Pc = get_Pc(parcel_table, restricted_parcel_table)
+
+    restricted_geometry_list = [restricted_parcel_table.get_geometry(index) for index in range(len(restricted_parcel_table))]
+    expected_Pc = np.ones(shape=(len(parcel_table),))
+    for index in range(len(parcel_table)):
+        geometry = parcel_table.get_geometry(index)
+        if any(geometry.Intersects(restricted_geometry) for restricted_geometry in restricted_geometry_list):
+            expected_Pc[index] = 0
+
+    np.testing.assert_array_equal(Pc, expected_Pc)
+    assert 0 < expected_Pc.sum() < len(parcel_table)
+
+
+def get_omega_by_loop(current_landuse_list, landuse_type_list, buffer_range, distance_matrix, areas, areamax, areamin):
+    # The double loop that the sparse weight matrix replaced
+    omega = np.zeros(shape=(len(current_landuse_list), len(landuse_type_list)))
+    for index_i in range(len(current_landuse_list)):
+        for index_j in range(len(current_landuse_list)):
+            distance_ij = distance_matrix[index_i, index_j]
+            if distance_ij <= buffer_range:
+                landuse_type_index = landuse_type_list.index(current_landuse_list[index_j])
+                omega[index_i, landuse_type_index] += np.power(np.e, -distance_ij/buffer_range)*((areas[index_j]/areas[index_i])/(areamax/areamin))
+    return omega
+
+
+def test_omega_matches_dense_loop():
+    rng = np.random.default_rng(3)
+    centroids = rng.random((300, 2))*1000
+    areas = rng.random(300)*100+10
+    buffer_range = 120
+    landuse_type_list = ['farmland', 'urban', 'water', 'forest']
+    current_landuse_codes = rng.integers(0, len(landuse_type_list), 300)
+
+    weight_matrix = get_neighbor_weight_matrix(get_neighbor_graph(centroids, buffer_range), buffer_range, areas, areas.max(), areas.min())
+    omega = get_omega(current_landuse_codes, len(landuse_type_list), weight_matrix)
+
+    current_landuse_list = [landuse_type_list[code] for code in current_landuse_codes]
+    distance_matrix = np.linalg.norm(centroids[:, np.newaxis, :]-centroids[np.newaxis, :, :], axis=2)
+    expected_omega = get_omega_by_loop(current_landuse_list, landuse_type_list, buffer_range, distance_matrix, areas, areas.max(), areas.min())
+
+    np.testing.assert_allclose(omega, expected_omega, rtol=1e-10)
+
+
+def get_type_areas(data, landuse_codes):
+    return np.bincount(landuse_codes, weights=data.areas, minlength=len(data.landuse_type_list))
+
+
+def test_balanced_demand_gives_area_change_matrix():
+    data = make_simulation_data(500)
+    current_areas = get_type_areas(data, data.before_landuse_codes)
+    demand = {'0': current_areas[0]-300, '1': current_areas[1]+100, '2': current_areas[2]+200}
+
+    area_change_matrix = get_area_change_matrix_from_demand(data.before_landuse_codes, data.areas, data.landuse_type_list, demand)
+
+    np.testing.assert_allclose(area_change_matrix.sum(axis=1), [300, 0, 0], atol=1e-9)
+    np.testing.assert_allclose(area_change_matrix.sum(axis=0), [0, 100, 200], atol=1e-9)
+
+
+@pytest.mark.parametrize('changes', [
+    {'0': 100},  # Only growth
+    {'0': -100},  # Only shrinkage
+    {'0': -100, '1': 150},  # Growth and shrinkage do not balance
+    {'urban': 100, '0': -100},  # Unknown land use type
+])
+def test_unbalanced_demand_is_rejected(changes):
+    data = make_simulation_data(500)
+    current_areas = get_type_areas(data, data.before_landuse_codes)
+    demand = {}
+    for landuse_type, change in changes.items():
+        index = data.landuse_type_list.index(landuse_type) if landuse_type in data.landuse_type_list else 0
+        demand[landuse_type] = current_areas[index]+change
+
+    with pytest.raises(ValueError):
+        get_area_change_matrix_from_demand(data.before_landuse_codes, data.areas, data.landuse_type_list, demand)
+
+
+def test_forecast_chains_two_periods(tmp_path):
+    data = make_simulation_data()
+    start_areas = get_type_areas(data, data.after_landuse_codes)
+    transferred_area = start_areas.sum()*0.03
+    first_targets = start_areas+np.array([-transferred_area, transferred_area, 0])
+    second_targets = first_targets+np.array([-transferred_area, 0, transferred_area])
+    period_config_list = [
+        PeriodConfig('2021', dict(zip(data.landuse_type_list, first_targets)), 5),
+        PeriodConfig('2024', dict(zip(data.landuse_type_list, second_targets)), 5),
+    ]
+    output_file_name = str(tmp_path / 'forecast.npz')
+
+    final_landuse_codes = run_forecast(data, period_config_list, 5, output_file_name, rng=np.random.default_rng(0))
+
+    # Each period misses its targets by at most one parcel per iteration and conversion
+    tolerance = 5*len(data.landuse_type_list)*data.areas.max()
+    _, _, first_landuse_codes = load_forecast_result(output_file_name, 0)
+    np.testing.assert_allclose(get_type_areas(data, first_landuse_codes), first_targets, atol=tolerance)
+    _, _, second_landuse_codes = load_forecast_result(output_file_name, 1)
+    np.testing.assert_array_equal(second_landuse_codes, final_landuse_codes)
+    np.testing.assert_allclose(get_type_areas(data, final_landuse_codes), second_targets, atol=tolerance)
@@ -0,0 +1,59 @@
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+from simulation_cache import get_cache_key
+from simulation_cache import load_cached_arrays
+from simulation_cache import save_cached_arrays
+from simulation_cache import get_directory_size
+
+
+def test_changing_an_input_invalidates_the_cache(tmp_path):
+    cache_directory = str(tmp_path / 'cache')
+    input_file_name = str(tmp_path / 'input.shp')
+    for component in ('.shp', '.dbf'):
+        with open(str(tmp_path / ('input'+component)), 'wb') as file:
+            file.write(b'parcels')
+
+    cache_key = get_cache_key([input_file_name], {'buffer_range': 600})
+    save_cached_arrays(cache_directory, cache_key, {'areas': np.arange(10.0)})
+    np.testing.assert_array_equal(load_cached_arrays(cache_directory, get_cache_key([input_file_name], {'buffer_range': 600}))['areas'], np.arange(10.0))
+
+    # A component file of the shapefile changes
+    with open(str(tmp_path / 'input.dbf'), 'wb') as file:
+        file.write(b'changed')
+    assert load_cached_arrays(cache_directory, get_cache_key([input_file_name], {'buffer_range': 600})) is None
+
+    # A parameter changes
+    assert get_cache_key([input_file_name], {'buffer_range': 300}) != get_cache_key([input_file_name], {'buffer_range': 600})
+
+
+def get_directory_size_of_entry(tmp_path):
+    save_cached_arrays(str(tmp_path / 'sizing'), 'entry', {'areas': np.zeros(1000)})
+    return get_directory_size(str(tmp_path / 'sizing' / 'entry'))
+
+
+def test_eviction_keeps_the_cache_under_max_cache_size(tmp_path):
+    cache_directory = str(tmp_path / 'cache')
+    entry_size = get_directory_size_of_entry(tmp_path)
+    max_cache_size = entry_size*3
+
+    # An entry that another process is still writing
+    os.makedirs(os.path.join(cache_directory, 'writing.abc.tmp'))
+    with open(os.path.join(cache_directory, 'writing.abc.tmp', 'areas.npy'), 'wb') as file:
+        file.write(b'0'*entry_size*2)
+
+    cache_key_list = ['%064x' % index for index in range(6)]
+    for index, cache_key in enumerate(cache_key_list):
+        save_cached_arrays(cache_directory, cache_key, {'areas': np.full(1000, float(index))}, max_cache_size)
+        os.utime(os.path.join(cache_directory, cache_key), (index, index))
+
+        entry_list = [name for name in os.listdir(cache_directory) if not name.endswith('.tmp')]
+        assert sum(get_directory_size(os.path.join(cache_directory, name)) for name in entry_list) <= max_cache_size
+        assert cache_key in entry_list
+
+    # The most recently used entries are kept, the entry being written is not touched
+    assert sorted(name for name in os.listdir(cache_directory) if not name.endswith('.tmp')) == cache_key_list[3:]
+    assert os.path.exists(os.path.join(cache_directory, 'writing.abc.tmp', 'areas.npy'))
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+from utils import get_neighbor_graph
+from simulation import get_neighbor_weight_matrix
+from simulation import get_area_change_matrix
+from simulation import SimulationData
+from simulation import run_simulation
+from simulation_tiled import run_tiled_simulation
+
+
+def make_parcels(parcel_count=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = rng.random((parcel_count, 2)) * 3000
+    areas = rng.random(parcel_count) * 100 + 10
+    before_landuse_codes = rng.integers(0, 3, parcel_count)
+    after_landuse_codes = np.where(rng.random(parcel_count) < 0.3, rng.integers(0, 3, parcel_count), before_landuse_codes)
+    Pg = rng.random((parcel_count, 3))
+    Pc = np.ones(parcel_count)
+    return centroids, areas, before_landuse_codes, after_landuse_codes, Pg, Pc
+
+
+def get_converted_area(areas, before_landuse_codes, current_landuse_codes):
+    return areas[current_landuse_codes != before_landuse_codes].sum()
+
+
+@pytest.mark.parametrize('tile_size', [3000, 300, 150])
+def test_tiled_converts_the_same_area_as_serial(tile_size):
+    buffer_range = 150
+    iteration = 10
+    centroids, areas, before_landuse_codes, after_landuse_codes, Pg, Pc = make_parcels()
+    area_change_matrix = get_area_change_matrix(areas, before_landuse_codes, after_landuse_codes, 3)
+
+    weight_matrix = get_neighbor_weight_matrix(get_neighbor_graph(centroids, buffer_range), buffer_range, areas, areas.max(), areas.min())
+    data = SimulationData(list(range(len(areas))), ['0', '1', '2'], before_landuse_codes, after_landuse_codes, areas, area_change_matrix, Pg, Pc, weight_matrix)
+    serial_landuse_codes = run_simulation(data, 5, iteration, rng=np.random.default_rng(0), assessment_interval=0)
+
+    tiled_landuse_codes = run_tiled_simulation(3, before_landuse_codes, after_landuse_codes, areas, area_change_matrix, Pg, Pc, centroids, 5, buffer_range, iteration, tile_size, seed=0, assessment_interval=0, process_count=2)
+
+    serial_area = get_converted_area(areas, before_landuse_codes, serial_landuse_codes)
+    tiled_area = get_converted_area(areas, before_landuse_codes, tiled_landuse_codes)
+    assert tiled_area == pytest.approx(serial_area, rel=0.05)
+
+
+def test_tiled_result_does_not_depend_on_process_count():
+    centroids, areas, before_landuse_codes, after_landuse_codes, Pg, Pc = make_parcels(1000)
+    area_change_matrix = get_area_change_matrix(areas, before_landuse_codes, after_landuse_codes, 3)
+
+    results = [
+        run_tiled_simulation(3, before_landuse_codes, after_landuse_codes, areas, area_change_matrix, Pg, Pc, centroids, 5, 150, 5, 500, seed=1, assessment_interval=0, process_count=process_count)
+        for process_count in [1, 3]
+    ]
+    np.testing.assert_array_equal(results[0], results[1])
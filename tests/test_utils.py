@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+from scipy.spatial.distance import cdist
+from utils import get_neighbor_graph
+
+
+def test_neighbor_graph_matches_dense_distance_matrix():
+    rng = np.random.default_rng(0)
+    centroids = rng.random((500, 2))*2000
+    buffer_range = 150
+
+    indptr, indices, distances = get_neighbor_graph(centroids, buffer_range)
+
+    # The dense distance matrix that the graph replaced
+    distance_matrix = cdist(centroids, centroids)
+    for index in range(len(centroids)):
+        neighbor_indices = indices[indptr[index]:indptr[index+1]]
+        np.testing.assert_array_equal(neighbor_indices, np.flatnonzero(distance_matrix[index] <= buffer_range))
+        np.testing.assert_allclose(distances[indptr[index]:indptr[index+1]], distance_matrix[index, neighbor_indices])
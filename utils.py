@@ -1,155 +1,428 @@
-from osgeo import ogr
-from osgeo.ogr import DataSource
-from osgeo.ogr import Layer
-from osgeo.ogr import Feature
-from osgeo.ogr import Driver
-from osgeo.ogr import Geometry
-
-import numpy as np
-from numpy import ndarray
-
-def copy_shapefile(source_file_name:str,output_file_name:str) -> None:
-    '''
-    ### Abstract
-        Copy the shapefile file
-    ### Parameters
-        - source_file_name：The original file to be copied
-        - output_file_name：Output file
-
-    ### Return
-        none
-    '''
-    source_file:DataSource=ogr.Open(source_file_name)
-    driver:Driver = ogr.GetDriverByName("ESRI Shapefile")
-    driver.CopyDataSource(source_file,output_file_name)
-    return
-
-def get_feature_list(file_name:str)->list:
-    '''
-    ### Abstract
-        Copy all the elements in the shapefile
-    ### Parameters
-        - file_name：The name of the shapefile to be copied
-
-    ### Return
-        A list of components
-    '''
-    file:DataSource=ogr.Open(file_name)
-    layer:Layer=file.GetLayer()
-    feature_list=[]
-
-    feature:Feature
-    for feature in layer:
-        feature_list.append(feature.Clone())
-
-    file=None
-    return feature_list
-
-def apart_multipolygon(feature_list:list)->list:
-    '''
-    ### Abstract
-        Convert multipolygon to polygon
-    ### Parameters
-        - feature_list：List of parcels
-
-    ### Return
-        List of parcels
-    '''
-    multipolygon_index=[]
-    new_feature_list=[]
-    feature:Feature
-    for index,feature in enumerate(feature_list):
-        geometry:Geometry=feature.GetGeometryRef()
-        geometry_name=geometry.GetGeometryName()
-
-        if geometry_name=="MULTIPOLYGON":
-            multipolygon_index.append(index)
-            polygon_count=geometry.GetGeometryCount()
-            for i in range(polygon_count):
-                new_feature:Feature=feature.Clone()
-                new_geometry:Geometry=geometry.GetGeometryRef(i)
-                new_feature.SetGeometry(new_geometry)
-                new_feature_list.append(new_feature)
-
-    multipolygon_index.reverse()
-    for index in multipolygon_index:
-        feature_list.pop(index)
-    
-    return feature_list+new_feature_list
-
-def delete_all_feature(layer:Layer)->None:
-    '''
-    ### Abstract
-        Delete all elements from the layer
-    ### Parameters
-        - layer：The layer you want to remove the element from
-
-    ### Return
-        none
-    '''
-    feature_count=layer.GetFeatureCount()
-    for FID in range(feature_count-1,-1,-1):
-        layer.DeleteFeature(FID)
-
-def add_all_feature(layer:Layer,feature_list:list)->None:
-    '''
-    ### Abstract
-        Copy the elements from the elements list to the layer
-    ### Parameters
-        - layer：layer
-        - feature_list：Element list
-
-    ### Return
-        none
-    '''
-    for feature in feature_list:
-        layer.CreateFeature(feature)
-
-def get_centroids(feature_list: list) -> ndarray:
-    '''
-    ### Abstract
-        Get the centroid points of all the parcels
-    ### Parameters
-        - feature_list：List of parcels
-
-    ### Return
-        centroids[i],which represents the centroid point coordinates of block i
-    '''
-    centroids = np.zeros(shape=(len(feature_list), 2))
-
-    feature: Feature
-    for index, feature in enumerate(feature_list):
-        geometry: Geometry = feature.GetGeometryRef()
-        centroid: Geometry = geometry.Centroid()
-        centroids[index] = centroid.GetPoint_2D()
-
-    return centroids
-
-def get_distance_matrix(before_feature_list: list, after_feature_list: list) -> ndarray:
-    '''
-
-    ### Abstract
-        Calculate the distance between each of the two parcel lists
-    ### Parameters
-        - before_feature_list：List of previous parcels
-        - after_feature_list：List of later parcels
-
-    ### Return
-        distance_matrix[i,j] represents the distance between the I-th block in the earlier period and the J-th block in the later period
-
-    '''
-
-    before_feature_count = len(before_feature_list)
-    after_feature_count = len(after_feature_list)
-    distance_matrix = np.zeros(shape=(before_feature_count, after_feature_count))
-
-    before_centroids = get_centroids(before_feature_list)
-    after_centroids = get_centroids(after_feature_list)
-
-    for before_index, before_centroid in enumerate(before_centroids):
-        for after_index, after_centroid in enumerate(after_centroids):
-            distance_matrix[before_index, after_index] = np.linalg.norm(before_centroid-after_centroid)
-            print(before_index," ",after_index)
-
-    return distance_matrix
-
+from osgeo import ogr
+from osgeo import gdal
+from osgeo.ogr import DataSource
+from osgeo.ogr import Layer
+from osgeo.ogr import Feature
+from osgeo.ogr import Driver
+from osgeo.ogr import Geometry
+from osgeo.ogr import FeatureDefn
+from osgeo.ogr import FieldDefn
+
+import numpy as np
+from numpy import ndarray
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+from multiprocessing.shared_memory import SharedMemory
+import hashlib
+import os
+from profiling import profiled
+
+def copy_shapefile(source_file_name:str,output_file_name:str) -> None:
+    '''
+    ### Abstract
+        Copy the shapefile file
+    ### Parameters
+        - source_file_name：The original file to be copied
+        - output_file_name：Output file
+
+    ### Return
+        none
+    '''
+    source_file:DataSource=ogr.Open(source_file_name)
+    driver:Driver = ogr.GetDriverByName("ESRI Shapefile")
+    driver.CopyDataSource(source_file,output_file_name)
+    return
+
+def delete_shapefile(file_name:str)->None:
+    '''
+    ### Abstract
+        Delete a shapefile and its component files if it exists, on disk or in the GDAL in-memory file system (/vsimem/)
+    ### Parameters
+        - file_name：The shapefile to be deleted
+
+    ### Return
+        none
+    '''
+    if gdal.VSIStatL(file_name) is not None:
+        driver:Driver=ogr.GetDriverByName("ESRI Shapefile")
+        driver.DeleteDataSource(file_name)
+
+def get_feature_list(file_name:str)->list:
+    '''
+    ### Abstract
+        Copy all the elements in the shapefile
+    ### Parameters
+        - file_name：The name of the shapefile to be copied
+
+    ### Return
+        A list of components
+    '''
+    file:DataSource=ogr.Open(file_name)
+    layer:Layer=file.GetLayer()
+    feature_list=[]
+
+    feature:Feature
+    for feature in layer:
+        feature_list.append(feature.Clone())
+
+    file=None
+    return feature_list
+
+@profiled()
+def apart_multipolygon(feature_list:list)->list:
+    '''
+    ### Abstract
+        Convert multipolygon to polygon
+    ### Parameters
+        - feature_list：List of parcels
+
+    ### Return
+        List of parcels
+    '''
+    polygon_feature_list=[]
+    new_feature_list=[]
+    feature:Feature
+    for feature in feature_list:
+        geometry:Geometry=feature.GetGeometryRef()
+        geometry_name=geometry.GetGeometryName()
+
+        if geometry_name=="MULTIPOLYGON":
+            polygon_count=geometry.GetGeometryCount()
+            for i in range(polygon_count):
+                new_feature:Feature=feature.Clone()
+                new_geometry:Geometry=geometry.GetGeometryRef(i)
+                new_feature.SetGeometry(new_geometry)
+                new_feature_list.append(new_feature)
+        else:
+            polygon_feature_list.append(feature)
+    
+    return polygon_feature_list+new_feature_list
+
+def get_layer_schema(file_name:str)->tuple:
+    '''
+    ### Abstract
+        Get the schema of the layer of a shapefile, used to create an output layer with the same schema
+    ### Parameters
+        - file_name：The name of the shapefile
+
+    ### Return
+        Spatial reference, geometry type and list of field definitions of the layer
+    '''
+    file:DataSource=ogr.Open(file_name)
+    layer:Layer=file.GetLayer()
+    layer_defn:FeatureDefn=layer.GetLayerDefn()
+
+    spatial_ref=layer.GetSpatialRef()
+    if spatial_ref is not None:
+        spatial_ref=spatial_ref.Clone()
+    geometry_type=layer.GetGeomType()
+
+    # The definitions are copied, they must not depend on the closed file
+    field_defn_list=[]
+    for i in range(layer_defn.GetFieldCount()):
+        source_field_defn:FieldDefn=layer_defn.GetFieldDefn(i)
+        field_defn=FieldDefn(source_field_defn.GetName(),source_field_defn.GetType())
+        field_defn.SetWidth(source_field_defn.GetWidth())
+        field_defn.SetPrecision(source_field_defn.GetPrecision())
+        field_defn_list.append(field_defn)
+
+    file=None
+    return (spatial_ref,geometry_type,field_defn_list)
+
+def create_layer(output_file_name:str,layer_schema:tuple)->tuple:
+    '''
+    ### Abstract
+        Create a new shapefile with an empty layer
+    ### Parameters
+        - output_file_name：Output file, it is replaced if it exists
+        - layer_schema：Spatial reference, geometry type and list of field definitions of the new layer, see get_layer_schema
+
+    ### Return
+        The data source, which must be kept until the writing is done, and the layer
+    '''
+    spatial_ref,geometry_type,field_defn_list=layer_schema
+
+    delete_shapefile(output_file_name)
+    driver:Driver=ogr.GetDriverByName("ESRI Shapefile")
+    file:DataSource=driver.CreateDataSource(output_file_name)
+    layer:Layer=file.CreateLayer(os.path.splitext(os.path.basename(output_file_name))[0],spatial_ref,geometry_type)
+    for field_defn in field_defn_list:
+        layer.CreateField(field_defn)
+
+    return (file,layer)
+
+@profiled()
+def write_feature_list(output_file_name:str,feature_list:list,layer_schema:tuple,field_value_lists:dict=None,batch_size:int=10000)->None:
+    '''
+    ### Abstract
+        Write the elements to a new shapefile in one pass. The file is created with its final schema, the fields are filled when each element is created,
+        and the elements are written in batched transactions where the driver supports them
+    ### Parameters
+        - output_file_name：Output file, it is replaced if it exists
+        - feature_list：Element list, the geometry and the fields with the same name are copied from the elements
+        - layer_schema：Spatial reference, geometry type and list of field definitions of the new layer, see get_layer_schema
+        - field_value_lists：Dictionary of field value lists, the key is the field name. The values are used instead of the values of the elements
+        - batch_size：Number of elements written in one transaction
+
+    ### Return
+        none
+    '''
+    if field_value_lists is None:
+        field_value_lists={}
+
+    file,layer=create_layer(output_file_name,layer_schema)
+    layer_defn:FeatureDefn=layer.GetLayerDefn()
+
+    use_transaction=layer.TestCapability(ogr.OLCTransactions)
+    if use_transaction:
+        layer.StartTransaction()
+
+    feature:Feature
+    for index,feature in enumerate(feature_list):
+        new_feature=Feature(layer_defn)
+        new_feature.SetFrom(feature)
+        for field_name,values in field_value_lists.items():
+            new_feature.SetField(field_name,values[index])
+        layer.CreateFeature(new_feature)
+
+        if use_transaction and (index+1)%batch_size==0:
+            layer.CommitTransaction()
+            layer.StartTransaction()
+
+    if use_transaction:
+        layer.CommitTransaction()
+    file=None
+
+@profiled()
+def get_distance_matrix(before_centroids: ndarray, after_centroids: ndarray) -> ndarray:
+    '''
+
+    ### Abstract
+        Calculate the distance between each of the two parcel lists
+    ### Parameters
+        - before_centroids：Centroids of the previous parcels
+        - after_centroids：Centroids of the later parcels
+
+    ### Return
+        distance_matrix[i,j] represents the distance between the I-th block in the earlier period and the J-th block in the later period
+
+    '''
+
+    distance_matrix = cdist(before_centroids, after_centroids)
+
+    return distance_matrix
+
+
+
+@profiled()
+def get_neighbor_graph(centroids:ndarray,buffer_range:float)->tuple:
+    '''
+    ### Abstract
+        Find all pairs of parcels whose centroids are within the neighborhood distance by a KD-tree, and store them in CSR form instead of a full distance matrix. Each parcel is also a neighbor of itself
+    ### Parameters
+        - centroids：centroids[i] represents the centroid point coordinates of parcel i
+        - buffer_range：Neighborhood distance
+
+    ### Return
+        indptr, indices, distances. The neighbors of parcel i are indices[indptr[i]:indptr[i+1]], and distances[indptr[i]:indptr[i+1]] are their distances to parcel i
+    '''
+    parcel_count=len(centroids)
+    tree=cKDTree(centroids)
+    pairs=tree.query_pairs(r=buffer_range,output_type='ndarray')
+
+    # query_pairs only returns i<j, so both directions and the parcel itself are added
+    self_indices=np.arange(parcel_count)
+    rows=np.concatenate([pairs[:,0],pairs[:,1],self_indices])
+    cols=np.concatenate([pairs[:,1],pairs[:,0],self_indices])
+
+    order=np.lexsort((cols,rows))
+    rows=rows[order]
+    indices=cols[order]
+    distances=np.linalg.norm(centroids[rows]-centroids[indices],axis=1)
+
+    indptr=np.zeros(shape=(parcel_count+1,),dtype=np.int64)
+    np.cumsum(np.bincount(rows,minlength=parcel_count),out=indptr[1:])
+
+    return indptr,indices,distances
+
+def filter_neighbor_graph(neighbor_graph:tuple,buffer_range:float)->tuple:
+    '''
+    ### Abstract
+        Keep the pairs of a neighbor graph that are within a smaller neighborhood distance, so that the graph of a larger distance can be reused without another search
+    ### Parameters
+        - neighbor_graph：indptr, indices and distances, see get_neighbor_graph
+        - buffer_range：The smaller neighborhood distance
+
+    ### Return
+        indptr, indices, distances of the smaller neighborhood distance
+    '''
+    indptr,indices,distances=neighbor_graph
+    parcel_count=len(indptr)-1
+    is_kept=distances<=buffer_range
+
+    rows=np.repeat(np.arange(parcel_count),np.diff(indptr))
+    new_indptr=np.zeros(shape=(parcel_count+1,),dtype=np.int64)
+    np.cumsum(np.bincount(rows[is_kept],minlength=parcel_count),out=new_indptr[1:])
+
+    return new_indptr,indices[is_kept],distances[is_kept]
+
+def build_grid_index(envelopes:ndarray,cell_size:float,max_cell_count:int=64)->tuple:
+    '''
+    ### Abstract
+        Build a uniform grid spatial index, each envelope is registered in every grid cell it covers.
+        Envelopes covering more than max_cell_count cells, such as a large zoning polygon, are kept aside and tested directly on each query,
+        so that they do not fill the grid
+    ### Parameters
+        - envelopes：envelopes[i] is (minx,maxx,miny,maxy) of feature i
+        - cell_size：Side length of a grid cell
+        - max_cell_count：The largest number of cells an envelope is registered in
+
+    ### Return
+        Grid index, a tuple of the cell dictionary, the grid origin, the cell size, the envelopes, the indices of the large envelopes and max_cell_count.
+        The key of the cell dictionary is (column,row) and the value is the array of the features in that cell
+    '''
+    origin=(envelopes[:,0].min(),envelopes[:,2].min())
+    columns=np.floor((envelopes[:,:2]-origin[0])/cell_size).astype(np.int64)
+    rows=np.floor((envelopes[:,2:]-origin[1])/cell_size).astype(np.int64)
+    cell_counts=(columns[:,1]-columns[:,0]+1)*(rows[:,1]-rows[:,0]+1)
+    is_large=cell_counts>max_cell_count
+
+    cells={}
+    for index,column_min,column_max,row_min,row_max in zip(np.flatnonzero(~is_large).tolist(),*np.hstack([columns,rows])[~is_large].T.tolist()):
+        for column in range(column_min,column_max+1):
+            for row in range(row_min,row_max+1):
+                cells.setdefault((column,row),[]).append(index)
+
+    for key in cells:
+        cells[key]=np.array(cells[key],dtype=np.int64)
+
+    return (cells,origin,cell_size,envelopes,np.flatnonzero(is_large),max_cell_count)
+
+def query_grid_index(grid_index:tuple,envelope:ndarray)->ndarray:
+    '''
+    ### Abstract
+        Find the features whose envelopes intersect the given envelope
+    ### Parameters
+        - grid_index：Grid index, see build_grid_index
+        - envelope：(minx,maxx,miny,maxy) to be queried
+
+    ### Return
+        Indices of the candidate features in ascending order
+    '''
+    cells,origin,cell_size,envelopes,large_indices,max_cell_count=grid_index
+    column_min,column_max=np.floor((np.asarray(envelope[:2])-origin[0])/cell_size).astype(np.int64).tolist()
+    row_min,row_max=np.floor((np.asarray(envelope[2:])-origin[1])/cell_size).astype(np.int64).tolist()
+
+    if (column_max-column_min+1)*(row_max-row_min+1)>max_cell_count:
+        # A large query tests all envelopes at once instead of visiting its cells
+        candidates=np.arange(len(envelopes))
+    else:
+        candidate_list=[large_indices]
+        for column in range(column_min,column_max+1):
+            for row in range(row_min,row_max+1):
+                if (column,row) in cells:
+                    candidate_list.append(cells[(column,row)])
+        candidates=np.unique(np.concatenate(candidate_list))
+
+    candidate_envelopes=envelopes[candidates]
+    is_intersected=(candidate_envelopes[:,0]<=envelope[1])&(candidate_envelopes[:,1]>=envelope[0])&(candidate_envelopes[:,2]<=envelope[3])&(candidate_envelopes[:,3]>=envelope[2])
+
+    return candidates[is_intersected]
+
+def share_array(array:ndarray)->tuple:
+    '''
+    ### Abstract
+        Copy an array into a new block of shared memory so that other processes can use it without copying
+    ### Parameters
+        - array：The array to be shared
+
+    ### Return
+        The shared memory block, and the description (name, shape, dtype) used by attach_array.
+        The caller must close and unlink the block when it is no longer needed
+    '''
+    array=np.ascontiguousarray(array)
+    shared_memory=SharedMemory(create=True,size=max(array.nbytes,1))
+    shared_array=np.ndarray(array.shape,dtype=array.dtype,buffer=shared_memory.buf)
+    shared_array[...]=array
+
+    return shared_memory,(shared_memory.name,array.shape,array.dtype.str)
+
+def attach_array(description:tuple)->tuple:
+    '''
+    ### Abstract
+        Attach to an array shared by share_array
+    ### Parameters
+        - description：(name, shape, dtype) returned by share_array
+
+    ### Return
+        The shared memory block and the array using it as buffer. The block must be kept referenced as long as the array is used
+    '''
+    name,shape,dtype=description
+    shared_memory=SharedMemory(name=name)
+    array=np.ndarray(shape,dtype=np.dtype(dtype),buffer=shared_memory.buf)
+
+    return shared_memory,array
+
+def share_arrays(arrays:dict)->tuple:
+    '''
+    ### Abstract
+        Copy several arrays into shared memory, see share_array
+    ### Parameters
+        - arrays：Dictionary of arrays, the key is the array name
+
+    ### Return
+        List of the shared memory blocks, which must be closed and unlinked by the caller, and the descriptions of the shared arrays used by attach_arrays
+    '''
+    shared_memory_list=[]
+    descriptions={}
+    for key,array in arrays.items():
+        shared_memory,description=share_array(array)
+        shared_memory_list.append(shared_memory)
+        descriptions[key]=description
+
+    return shared_memory_list,descriptions
+
+def attach_arrays(descriptions:dict)->tuple:
+    '''
+    ### Abstract
+        Attach to the arrays shared by share_arrays
+    ### Parameters
+        - descriptions：The descriptions of the shared arrays
+
+    ### Return
+        List of the attached shared memory blocks, which must be kept referenced, and the dictionary of arrays
+    '''
+    shared_memory_list=[]
+    arrays={}
+    for key,description in descriptions.items():
+        shared_memory,array=attach_array(description)
+        shared_memory_list.append(shared_memory)
+        arrays[key]=array
+
+    return shared_memory_list,arrays
+
+def get_file_hash(file_name:str,block_size:int=1<<20)->str:
+    '''
+    ### Abstract
+        Calculate the hash of the content of a file. For a shapefile, the hash covers all of its component files (.shp, .shx, .dbf, .prj, .cpg)
+    ### Parameters
+        - file_name：The file name
+        - block_size：Number of bytes read at a time
+
+    ### Return
+        SHA-256 hex digest
+    '''
+    stem,extension=os.path.splitext(file_name)
+    if extension.lower()=='.shp':
+        file_name_list=[stem+component for component in ('.shp','.shx','.dbf','.prj','.cpg') if os.path.exists(stem+component)]
+    else:
+        file_name_list=[file_name]
+
+    file_hash=hashlib.sha256()
+    for component_file_name in file_name_list:
+        file_hash.update(os.path.splitext(component_file_name)[1].lower().encode('utf-8'))
+        with open(component_file_name,'rb') as file:
+            for block in iter(lambda:file.read(block_size),b''):
+                file_hash.update(block)
+
+    return file_hash.hexdigest()